@@ -0,0 +1,356 @@
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import multiprocessing as mp
+import cv2
+from database import FaceDatabase
+from database_sqlite import SQLiteFaceDatabase
+from recognizer import FaceRecognizer, carregar_ou_treinar, criar_modelo
+from model import PredictionCache
+from hardware import ImageFolderSource
+from report import barra_progresso
+
+EXTENSOES_VIDEO = ('.mp4', '.avi', '.mkv', '.mov', '.m4v', '.mpg', '.mpeg', '.webm')
+
+# Modelo carregado no processo principal (herdado pelos workers com fork; ver multi_camera.py)
+_MODELO = None
+# Estado de cada worker do pool: reconhecedor e função de detecção
+_WORKER = None
+
+def planejar_tarefas(entradas, quadros_por_tarefa=300, imagens_por_tarefa=64):
+    """
+    Divide as entradas (imagens, vídeos ou diretórios, percorridos recursivamente)
+    em tarefas independentes: lotes de imagens e trechos de quadros_por_tarefa
+    quadros de cada vídeo, para que um vídeo longo ocupe vários núcleos.
+    """
+    imagens = []
+    videos = []
+    for entrada in entradas:
+        if os.path.isdir(entrada):
+            caminhos = []
+            for raiz, dirs, arquivos in os.walk(entrada):
+                dirs.sort()
+                caminhos.extend(os.path.join(raiz, nome) for nome in sorted(arquivos))
+        else:
+            caminhos = [entrada]
+        for caminho in caminhos:
+            extensao = os.path.splitext(caminho)[1].lower()
+            if extensao in ImageFolderSource.extensoes:
+                imagens.append(caminho)
+            elif extensao in EXTENSOES_VIDEO:
+                videos.append(caminho)
+
+    tarefas = [('imagens', imagens[i:i + imagens_por_tarefa])
+               for i in range(0, len(imagens), imagens_por_tarefa)]
+    for caminho in videos:
+        cap = cv2.VideoCapture(caminho)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+        cap.release()
+        if total <= 0:
+            # Número de quadros desconhecido: o vídeo inteiro em uma tarefa
+            tarefas.append(('video', caminho, 0, None))
+            continue
+        for inicio in range(0, total, quadros_por_tarefa):
+            tarefas.append(('video', caminho, inicio, min(total, inicio + quadros_por_tarefa)))
+    return tarefas
+
+def identificadores(tarefa):
+    """Chaves registradas no checkpoint quando a tarefa termina"""
+    if tarefa[0] == 'imagens':
+        return list(tarefa[1])
+    _, caminho, inicio, fim = tarefa
+    return [f"{caminho}#{inicio}-{'' if fim is None else fim}"]
+
+def _iniciar_worker(config):
+    """Inicializador do pool: modelo herdado (fork) ou lido do snapshot (spawn)"""
+    global _WORKER
+    # O principal coordena o encerramento; as threads do OpenCV só disputariam os núcleos
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cv2.setNumThreads(1)
+    # Os prints de depuração do modelo (um por predição) não disputam o console com o progresso
+    sys.stdout = open(os.devnull, 'w')
+
+    model = _MODELO
+    if model is None:
+        model = criar_modelo(config['motor'], config['snapshot_dir'])
+        if not model.load_snapshot(config['snapshot_dir'], config['fingerprint']):
+            raise RuntimeError("Snapshot do modelo indisponível")
+    # Sem o cache de predições: sua validade é medida no relógio, o que tornaria o
+    # resultado dependente da ordem e da velocidade das tarefas (e da retomada)
+    model.last_predictions = PredictionCache(ttl=0)
+    recognizer = FaceRecognizer(model)
+    _WORKER = {'recognizer': recognizer, 'detectar': recognizer.criar_detector()}
+
+def _analisar(frame):
+    """Detecção, qualidade e predição de um quadro; retorna (faces detectadas, detecções, tempos em ms)"""
+    recognizer = _WORKER['recognizer']
+    inicio = time.perf_counter()
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    faces = _WORKER['detectar'](gray)
+    meio = time.perf_counter()
+    resultados = recognizer.reconhecer(gray, faces)
+    fim = time.perf_counter()
+
+    deteccoes = [{
+        'bbox': [int(v) for v in bbox],
+        'pessoa_id': int(pessoa_id),
+        'confianca': float(confianca),
+        'reconhecido': recognizer.reconhecido(pessoa_id, confianca)
+    } for bbox, pessoa_id, confianca in resultados]
+    return len(faces), deteccoes, {
+        'deteccao': round(1000 * (meio - inicio), 3),
+        'reconhecimento': round(1000 * (fim - meio), 3)
+    }
+
+def _processar_imagens(caminhos):
+    linhas = []
+    for caminho in caminhos:
+        inicio = time.perf_counter()
+        frame = cv2.imread(caminho, cv2.IMREAD_COLOR)
+        leitura = round(1000 * (time.perf_counter() - inicio), 3)
+        if frame is None:
+            linhas.append({'arquivo': caminho, 'erro': "Imagem ilegível"})
+            continue
+        faces, deteccoes, tempos = _analisar(frame)
+        linhas.append({'arquivo': caminho, 'faces_detectadas': faces, 'deteccoes': deteccoes,
+                       'ms': dict(tempos, leitura=leitura)})
+    return linhas, len(caminhos)
+
+def _abrir_no_quadro(caminho, inicio):
+    """
+    Abre o vídeo posicionado exatamente no quadro inicio (None se não abrir).
+    A busca do backend pode parar em um quadro-chave anterior; nesse caso o
+    vídeo é reaberto e avança com grab() (sem decodificar as imagens), para
+    que os trechos não se sobreponham nem deixem quadros de fora.
+    """
+    cap = cv2.VideoCapture(caminho)
+    if not cap.isOpened():
+        return None
+    if not inicio:
+        return cap
+    if cap.set(cv2.CAP_PROP_POS_FRAMES, inicio) and int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == inicio:
+        return cap
+
+    cap.release()
+    cap = cv2.VideoCapture(caminho)
+    for _ in range(inicio):
+        if not cap.grab():
+            break
+    return cap
+
+def _processar_video(caminho, inicio, fim, passo):
+    """Quadros [inicio, fim) do vídeo, um a cada passo; linhas só para quadros com faces"""
+    cap = _abrir_no_quadro(caminho, inicio)
+    if cap is None:
+        return [{'arquivo': caminho, 'erro': "Não foi possível abrir o vídeo"}], 0
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        linhas = []
+        quadros = 0
+        quadro = inicio
+        while fim is None or quadro < fim:
+            if quadro % passo:
+                # Quadro pulado: avança sem decodificar a imagem
+                if not cap.grab():
+                    break
+                quadro += 1
+                continue
+            t = time.perf_counter()
+            ret, frame = cap.read()
+            leitura = round(1000 * (time.perf_counter() - t), 3)
+            if not ret:
+                break
+            quadros += 1
+            faces, deteccoes, tempos = _analisar(frame)
+            if faces:
+                linhas.append({'arquivo': caminho, 'quadro': quadro, 'tempo_s': round(quadro / fps, 3),
+                               'faces_detectadas': faces, 'deteccoes': deteccoes,
+                               'ms': dict(tempos, leitura=leitura)})
+            quadro += 1
+        return linhas, quadros
+    finally:
+        cap.release()
+
+def _executar_tarefa(args):
+    """Executada nos workers: retorna (tarefa, linhas JSONL, quadros analisados, segundos)"""
+    tarefa, passo = args
+    inicio = time.perf_counter()
+    if tarefa[0] == 'imagens':
+        linhas, quadros = _processar_imagens(tarefa[1])
+    else:
+        linhas, quadros = _processar_video(*tarefa[1:], passo)
+    return tarefa, linhas, quadros, time.perf_counter() - inicio
+
+def _ler_checkpoint(caminho):
+    """
+    Cabeçalho, chaves concluídas, tamanho válido da saída e tamanho válido do
+    próprio checkpoint (sem uma linha incompleta deixada por uma interrupção)
+    """
+    cabecalho = None
+    concluidas = set()
+    tamanho_saida = 0
+    valido = 0
+    with open(caminho, 'rb') as f:
+        for linha in f:
+            try:
+                if not linha.endswith(b"\n"):
+                    raise ValueError
+                registro = json.loads(linha)
+            except ValueError:
+                break
+            valido += len(linha)
+            if cabecalho is None:
+                cabecalho = registro
+                continue
+            concluidas.update(registro['concluidas'])
+            tamanho_saida = registro['saida']
+    return cabecalho, concluidas, tamanho_saida, valido
+
+def processar_lote(model, tarefas, saida, config, processos=None, passo=1, progresso=None):
+    """
+    Reconhece as tarefas em um pool de processos e grava uma linha JSON por
+    imagem (ou por quadro de vídeo com faces) em saida, com os tempos de
+    leitura, detecção e reconhecimento. Cada tarefa concluída é registrada em
+    saida + ".checkpoint" junto com o tamanho da saída; uma nova execução com
+    o mesmo checkpoint descarta o que foi gravado depois dele e pula as
+    tarefas concluídas. As linhas saem na ordem de conclusão das tarefas.
+    Retorna o resumo da execução.
+    """
+    global _MODELO
+    checkpoint = saida + ".checkpoint"
+    cabecalho = {'fingerprint': config['fingerprint'], 'passo': passo}
+
+    concluidas = set()
+    tamanho_saida = tamanho_checkpoint = 0
+    if os.path.exists(checkpoint):
+        anterior, concluidas, tamanho_saida, tamanho_checkpoint = _ler_checkpoint(checkpoint)
+        if anterior is not None and anterior != cabecalho:
+            raise ValueError(f"Checkpoint {checkpoint} é de outro modelo ou passo; "
+                             f"use outra saída ou --reiniciar")
+        if tamanho_saida and (not os.path.exists(saida) or os.path.getsize(saida) < tamanho_saida):
+            raise ValueError(f"{saida} é menor que o registrado em {checkpoint}; use --reiniciar")
+    pendentes = [t for t in tarefas if not set(identificadores(t)) <= concluidas]
+
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    resumo = {'tarefas': len(tarefas), 'retomadas': len(tarefas) - len(pendentes),
+              'quadros': 0, 'linhas': 0, 'faces': 0, 'avaliadas': 0, 'reconhecidas': 0,
+              'segundos_cpu': 0.0, 'segundos': 0.0}
+    inicio = time.perf_counter()
+
+    with open(saida, 'ab') as out, open(checkpoint, 'a', encoding='utf-8') as ckpt:
+        # Linhas gravadas depois do último checkpoint seriam duplicadas na retomada.
+        # O tamanho é contado aqui: truncate não move a posição (tell) do arquivo
+        out.truncate(tamanho_saida)
+        out.seek(0, os.SEEK_END)
+        ckpt.truncate(tamanho_checkpoint)
+        if tamanho_checkpoint == 0:
+            ckpt.write(json.dumps(cabecalho) + "\n")
+
+        # fork compartilha a galeria já carregada; spawn é o padrão fora do Linux
+        metodo = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+        _MODELO = model
+        try:
+            pool = mp.get_context(metodo).Pool(processos, initializer=_iniciar_worker, initargs=(config,))
+        finally:
+            _MODELO = None
+
+        try:
+            feitas = resumo['retomadas']
+            for tarefa, linhas, quadros, segundos in pool.imap_unordered(
+                    _executar_tarefa, [(t, passo) for t in pendentes]):
+                for linha in linhas:
+                    dados = (json.dumps(linha, ensure_ascii=False) + "\n").encode('utf-8')
+                    out.write(dados)
+                    tamanho_saida += len(dados)
+                    resumo['faces'] += linha.get('faces_detectadas', 0)
+                    for d in linha.get('deteccoes', []):
+                        resumo['avaliadas'] += 1
+                        resumo['reconhecidas'] += d['reconhecido']
+                out.flush()
+                os.fsync(out.fileno())
+                ckpt.write(json.dumps({'concluidas': identificadores(tarefa), 'saida': tamanho_saida},
+                                      ensure_ascii=False) + "\n")
+                ckpt.flush()
+
+                resumo['quadros'] += quadros
+                resumo['linhas'] += len(linhas)
+                resumo['segundos_cpu'] += segundos
+                feitas += 1
+                if progresso is not None:
+                    progresso(feitas, len(tarefas))
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    resumo['segundos'] = time.perf_counter() - inicio
+    resumo['quadros_por_segundo'] = resumo['quadros'] / resumo['segundos'] if resumo['segundos'] else 0.0
+    return resumo
+
+def main():
+    """Reconhecimento offline de diretórios de imagens e arquivos de vídeo"""
+    parser = argparse.ArgumentParser(description="Reconhecimento em lote (headless) de imagens e vídeos")
+    parser.add_argument("entradas", nargs="+", help="Imagens, vídeos ou diretórios (percorridos recursivamente)")
+    parser.add_argument("--saida", default="lote_reconhecimentos.jsonl",
+                        help="Arquivo JSONL de resultados (padrão: lote_reconhecimentos.jsonl)")
+    parser.add_argument("--processos", type=int, default=None,
+                        help="Processos do pool (padrão: número de núcleos)")
+    parser.add_argument("--passo", type=int, default=1,
+                        help="Analisar um quadro a cada N dos vídeos (padrão: 1)")
+    parser.add_argument("--quadros-por-tarefa", type=int, default=300,
+                        help="Quadros de vídeo por tarefa do pool (padrão: 300)")
+    parser.add_argument("--imagens-por-tarefa", type=int, default=64,
+                        help="Imagens por tarefa do pool (padrão: 64)")
+    parser.add_argument("--reiniciar", action="store_true",
+                        help="Descartar a saída e o checkpoint anteriores em vez de retomar")
+    parser.add_argument("--banco", choices=["json", "sqlite"], default="json",
+                        help="Backend de armazenamento (padrão: json)")
+    parser.add_argument("--db", default="faces.db", help="Arquivo do banco SQLite")
+    parser.add_argument("--motor", choices=["opencv", "numpy", "mapeado"], default="opencv",
+                        help="Motor LBPH (padrão: opencv)")
+    args = parser.parse_args()
+
+    database = SQLiteFaceDatabase(args.db) if args.banco == "sqlite" else FaceDatabase()
+    snapshot_dir = "modelos"
+    try:
+        model = criar_modelo(args.motor, snapshot_dir)
+        origem, total = carregar_ou_treinar(model, database, snapshot_dir)
+        fingerprint = model.fingerprint(database.listar_faces_treinamento())
+    finally:
+        database.fechar()
+    if origem is None:
+        print("Erro: Nenhuma face cadastrada para reconhecimento")
+        return
+    print(f"Modelo {'carregado do snapshot' if origem == 'snapshot' else 'treinado'} ({total} faces)")
+
+    if args.reiniciar:
+        for caminho in (args.saida, args.saida + ".checkpoint"):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+
+    tarefas = planejar_tarefas(args.entradas, args.quadros_por_tarefa, args.imagens_por_tarefa)
+    if not tarefas:
+        print("Nenhuma imagem ou vídeo encontrado")
+        return
+    config = {'motor': args.motor, 'snapshot_dir': snapshot_dir, 'fingerprint': fingerprint}
+    try:
+        resumo = processar_lote(model, tarefas, args.saida, config, args.processos, args.passo,
+                                progresso=barra_progresso)
+    except ValueError as e:
+        print(f"Erro: {e}")
+        return
+    except KeyboardInterrupt:
+        print(f"\nInterrompido; execute novamente para retomar de {args.saida}.checkpoint")
+        return
+
+    print(f"\n{resumo['tarefas']} tarefas ({resumo['retomadas']} já concluídas) | "
+          f"{resumo['quadros']} quadros em {resumo['segundos']:.1f} s "
+          f"({resumo['quadros_por_segundo']:.1f} quadros/s) | "
+          f"{resumo['faces']} faces, {resumo['avaliadas']} com qualidade, {resumo['reconhecidas']} reconhecidas")
+    print(f"Resultados: {os.path.abspath(args.saida)}")
+
+if __name__ == "__main__":
+    main()
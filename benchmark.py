@@ -0,0 +1,388 @@
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+import contextlib
+from datetime import datetime
+import cv2
+import numpy as np
+from hardware import open_source, SyntheticSource
+from quality_check import FaceQualityChecker
+from model import LBPHModel, PredictionCache
+from lbph_numpy import NumpyLBPHModel
+from report import gerar_relatorio
+from database import FaceDatabase
+from logger import log_metrics
+from tracking import FaceTracker
+from motion import MotionGate
+from face_detection import FaceDetector
+
+class StageTimer:
+    """Acumula as durações de cada etapa"""
+
+    def __init__(self):
+        self.amostras = {}
+
+    def medir(self, etapa, func, *args, **kwargs):
+        """Executa func medindo sua duração sob o nome da etapa"""
+        inicio = time.perf_counter()
+        resultado = func(*args, **kwargs)
+        self.amostras.setdefault(etapa, []).append(time.perf_counter() - inicio)
+        return resultado
+
+    def resumo(self):
+        """Throughput e latências p50/p95/p99 (ms) de cada etapa"""
+        resumo = {}
+        for etapa, duracoes in self.amostras.items():
+            d = np.array(duracoes)
+            total = float(d.sum())
+            resumo[etapa] = {
+                'amostras': len(d),
+                'total_s': total,
+                'throughput_s': len(d) / total if total > 0 else 0.0,
+                'media_ms': float(d.mean() * 1000),
+                'p50_ms': float(np.percentile(d, 50) * 1000),
+                'p95_ms': float(np.percentile(d, 95) * 1000),
+                'p99_ms': float(np.percentile(d, 99) * 1000)
+            }
+        return resumo
+
+def carregar_faces(diretorios):
+    """Carrega as faces (escala de cinza) dos diretórios informados"""
+    faces = []
+    for diretorio in diretorios:
+        for path in sorted(glob.glob(os.path.join(diretorio, "*.png"))):
+            face = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+            if face is not None:
+                faces.append(face)
+    return faces
+
+def carregar_frames(fonte, faces, max_frames):
+    """Lê até max_frames frames da fonte; sem fonte, gera frames sintéticos com as faces"""
+    if fonte:
+        source = open_source(fonte, tempo_real=False)
+    else:
+        # Faces ampliadas para passar no tamanho mínimo do FaceQualityChecker
+        ampliadas = [cv2.resize(f, (150, 150)) for f in faces[:3]]
+        source = SyntheticSource(num_frames=max_frames, faces=ampliadas, tempo_real=False)
+
+    frames = []
+    with source:
+        while len(frames) < max_frames:
+            ret, frame = source.read()
+            if not ret:
+                break
+            frames.append(frame)
+    return frames
+
+def montar_galeria(faces, tamanho, rng):
+    """Galeria sintética com 'tamanho' amostras (faces com pequenas variações)"""
+    galeria = []
+    labels = []
+    for i in range(tamanho):
+        face = faces[i % len(faces)]
+        # Deslocamento e ganho aleatórios para que as amostras não sejam idênticas
+        dx, dy = rng.integers(-3, 4, 2)
+        m = np.float32([[1, 0, dx], [0, 1, dy]])
+        variada = cv2.warpAffine(face, m, (face.shape[1], face.shape[0]), borderMode=cv2.BORDER_REFLECT)
+        variada = cv2.convertScaleAbs(variada, alpha=float(rng.uniform(0.9, 1.1)))
+        galeria.append(variada)
+        labels.append(i // 5 + 1)
+    return galeria, labels
+
+def benchmark_frames(frames, detector, quality_checker, timer):
+    """Etapas por frame: conversão para cinza, detecção e verificação de qualidade"""
+    recortes = []
+    for frame in frames:
+        gray = timer.medir('cinza', cv2.cvtColor, frame, cv2.COLOR_BGR2GRAY)
+        faces = timer.medir('deteccao', detector.detectMultiScale, gray, 1.3, 5)
+        for (x, y, w, h) in faces:
+            regiao = gray[y:y+h, x:x+w]
+            if timer.medir('qualidade', quality_checker.check_quality, regiao, (x, y, w, h)) == "OK":
+                recortes.append(regiao)
+    return recortes
+
+def benchmark_motor(frames, quality_checker, timer):
+    """Detecção pelo motor FaceDetector (resolução reduzida e limites de tamanho da qualidade)"""
+    detector = FaceDetector(min_face_size=quality_checker.min_face_size,
+                            max_face_size=quality_checker.max_face_size)
+    for frame in frames:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        timer.medir('deteccao_motor', detector.detect_gray, gray)
+
+def benchmark_rastreamento(frames, detector, timer, intervalo_deteccao=5):
+    """Custo por frame do modo detectar-e-rastrear (comparável à etapa 'deteccao')"""
+    tracker = FaceTracker(lambda gray: detector.detectMultiScale(gray, 1.3, 5),
+                          intervalo_deteccao=intervalo_deteccao)
+    for frame in frames:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        timer.medir('rastreamento', tracker.update, gray)
+    return tracker.stats()
+
+def benchmark_movimento(frames, detector, timer):
+    """Custo por frame da detecção filtrada por movimento (comparável à etapa 'deteccao')"""
+    motion_gate = MotionGate()
+    detectar = lambda gray: detector.detectMultiScale(gray, 1.3, 5)
+    for frame in frames:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        timer.medir('deteccao_movimento', motion_gate.detectar, detectar, gray)
+    return motion_gate.stats()
+
+def benchmark_modelo(criar_modelo, faces, probes, tamanhos, rng):
+    """Pré-processamento e predição para cada tamanho de galeria"""
+    resultados = {}
+    for tamanho in tamanhos:
+        galeria, labels = montar_galeria(faces, tamanho, rng)
+        model = criar_modelo()
+
+        inicio = time.perf_counter()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            model.train(galeria, labels)
+        treino_s = time.perf_counter() - inicio
+
+        timer = StageTimer()
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            for probe in probes:
+                timer.medir('pre_processamento', model._preprocess, probe)
+                model.last_predictions.clear()  # Mede a busca, não o cache
+                timer.medir('predicao', model.predict, probe)
+
+        resultados[str(tamanho)] = {'treino_s': treino_s, 'etapas': timer.resumo()}
+    return resultados
+
+def benchmark_cache(criar_modelo, faces, recortes, timer):
+    """
+    Taxa de acerto do cache de predições nos recortes de quadros consecutivos,
+    na ordem da captura; divergencias conta acertos cuja identidade difere da
+    predição sem cache.
+    """
+    labels = [i // 5 + 1 for i in range(len(faces))]
+    model = criar_modelo()
+    referencia = criar_modelo()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        model.train(faces, labels)
+        referencia.train(faces, labels)
+        referencia.last_predictions = PredictionCache(ttl=0)
+        divergencias = 0
+        for recorte in recortes:
+            hits = model.last_predictions.hits
+            label, _ = timer.medir('predicao_cache', model.predict, recorte)
+            if model.last_predictions.hits > hits and label != referencia.predict(recorte)[0]:
+                divergencias += 1
+    estatisticas = model.last_predictions.stats()
+    estatisticas['divergencias'] = divergencias
+    return estatisticas
+
+def benchmark_banco(num_eventos, timer):
+    """Registro de reconhecimentos e geração de relatório em um banco temporário"""
+    diretorio = tempfile.mkdtemp(prefix="benchmark_db_")
+    try:
+        database = FaceDatabase(
+            pessoas_file=os.path.join(diretorio, "pessoas.json"),
+            reconhecimentos_file=os.path.join(diretorio, "reconhecimentos.json"),
+            faces_dir=os.path.join(diretorio, "faces")
+        )
+        pessoa_id = database.cadastrar_pessoa("Benchmark", "00000000000", "benchmark@exemplo.com", [])
+        for _ in range(num_eventos):
+            timer.medir('registrar_reconhecimento', database.registrar_reconhecimento,
+                        pessoa_id, 90.0, "benchmark.png")
+        database.sincronizar()
+
+        hoje = datetime.now().strftime("%Y-%m-%d")
+        amanha = datetime.fromtimestamp(time.time() + 86400).strftime("%Y-%m-%d")
+
+        def escrever_relatorio():
+            # Mesmo caminho do menu: leitura em streaming e gravação incremental
+            return gerar_relatorio(database, hoje, amanha, "csv", diretorio=diretorio)[1]
+
+        timer.medir('relatorio', escrever_relatorio)
+        database.fechar()
+    finally:
+        shutil.rmtree(diretorio, ignore_errors=True)
+
+def chave_comparacao(resultado):
+    """Parâmetros que precisam coincidir para que duas execuções sejam comparáveis"""
+    configuracao = resultado.get('configuracao', {})
+    return (configuracao.get('motor'), configuracao.get('fonte'),
+            sorted(int(t) for t in resultado.get('galerias', {})))
+
+def buscar_anterior(diretorio, chave):
+    """Execução mais recente em diretorio com a mesma chave de comparação, ou None"""
+    for path in sorted(glob.glob(os.path.join(diretorio, "benchmark_*.json")), reverse=True):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                anterior = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if chave_comparacao(anterior) == chave:
+            return path, anterior
+    return None, None
+
+def comparar(atual, anterior, tolerancia):
+    """Lista as etapas cujo p50 piorou mais que a tolerância em relação à execução anterior"""
+    regressoes = []
+
+    def verificar(prefixo, etapas_atual, etapas_anterior):
+        for etapa, dados in etapas_atual.items():
+            base = etapas_anterior.get(etapa)
+            if base and base['p50_ms'] > 0 and dados['p50_ms'] > base['p50_ms'] * (1 + tolerancia):
+                regressoes.append((prefixo + etapa, base['p50_ms'], dados['p50_ms']))
+
+    verificar("", atual['etapas'], anterior.get('etapas', {}))
+    for tamanho, dados in atual['galerias'].items():
+        base = anterior.get('galerias', {}).get(tamanho)
+        if base:
+            verificar(f"galeria {tamanho}: ", dados['etapas'], base['etapas'])
+    return regressoes
+
+def imprimir_etapas(etapas, prefixo=""):
+    for etapa, d in etapas.items():
+        print(f"{prefixo}{etapa:<26} n={d['amostras']:<6} {d['throughput_s']:>10.1f}/s  "
+              f"p50={d['p50_ms']:8.3f} ms  p95={d['p95_ms']:8.3f} ms  p99={d['p99_ms']:8.3f} ms")
+
+def main():
+    """Executa o benchmark por etapa e salva os resultados em JSON"""
+    parser = argparse.ArgumentParser(description="Benchmark por etapa do reconhecimento facial")
+    parser.add_argument("--fonte", default=None,
+                        help="Frames gravados (vídeo, diretório ou sintetico[:N]); padrão: frames sintéticos com as faces")
+    parser.add_argument("--faces", nargs="+", default=["faces_db/faces", "reconhecimentos"],
+                        help="Diretórios com recortes de faces")
+    parser.add_argument("--frames", type=int, default=200, help="Número máximo de frames")
+    parser.add_argument("--galerias", default="10,100,1000", help="Tamanhos de galeria (separados por vírgula)")
+    parser.add_argument("--motor", choices=["opencv", "numpy"], default="opencv", help="Motor LBPH")
+    parser.add_argument("--intervalo-deteccao", type=int, default=5,
+                        help="Frames entre detecções completas na etapa de rastreamento")
+    parser.add_argument("--eventos", type=int, default=2000, help="Reconhecimentos registrados")
+    parser.add_argument("--saida", default="benchmarks", help="Diretório dos resultados")
+    parser.add_argument("--comparar", default=None,
+                        help="Resultado anterior (JSON) para comparação; padrão: o mais recente em --saida "
+                             "com o mesmo motor, fonte e galerias")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="Piora relativa tolerada no p50")
+    parser.add_argument("--falhar-regressao", action="store_true", help="Sai com código 1 se houver regressão")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    faces = carregar_faces(args.faces)
+    if not faces:
+        print("Erro: nenhuma face encontrada nos diretórios informados")
+        sys.exit(1)
+
+    criar_modelo = NumpyLBPHModel if args.motor == "numpy" else LBPHModel
+    tamanhos = [int(t) for t in args.galerias.split(",") if t]
+
+    print(f"Faces: {len(faces)} | Motor: {args.motor} | Galerias: {tamanhos}")
+
+    # Etapas por frame
+    timer = StageTimer()
+    frames = carregar_frames(args.fonte, faces, args.frames)
+    detector = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    quality_checker = FaceQualityChecker()
+    recortes = benchmark_frames(frames, detector, quality_checker, timer)
+    benchmark_motor(frames, quality_checker, timer)
+    rastreamento = benchmark_rastreamento(frames, detector, timer, args.intervalo_deteccao)
+    movimento = benchmark_movimento(frames, detector, timer)
+
+    # Etapas de banco de dados e relatório
+    benchmark_banco(args.eventos, timer)
+
+    # Pré-processamento e predição por tamanho de galeria; usa os recortes
+    # detectados e, na falta deles, as próprias faces
+    probes = recortes or faces
+    galerias = benchmark_modelo(criar_modelo, faces, probes, tamanhos, rng)
+    cache = benchmark_cache(criar_modelo, faces, recortes, timer)
+
+    resultado = {
+        'data': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'ambiente': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'plataforma': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'configuracao': {
+            'fonte': args.fonte or "sintetico",
+            'frames': len(frames),
+            'faces': len(faces),
+            'probes': len(probes),
+            'motor': args.motor,
+            'eventos': args.eventos
+        },
+        'etapas': timer.resumo(),
+        'rastreamento': rastreamento,
+        'movimento': movimento,
+        'cache': cache,
+        'galerias': galerias
+    }
+
+    print("\n=== Etapas por frame / banco ===")
+    imprimir_etapas(resultado['etapas'])
+    print(f"Rastreamento: detecção completa em {rastreamento['deteccoes']} de {rastreamento['frames']} frames")
+    print(f"Movimento: {movimento['frames_ignorados']} frames ignorados, "
+          f"{100 * movimento['fracao_area_processada']:.0f}% da área processada em média")
+    print(f"Cache de predições: {100 * cache['taxa_acerto']:.0f}% de acertos "
+          f"({cache['hits']} de {cache['hits'] + cache['misses']}), {cache['divergencias']} divergências")
+    for tamanho, dados in galerias.items():
+        print(f"\n=== Galeria com {tamanho} amostras (treino: {dados['treino_s']:.2f} s) ===")
+        imprimir_etapas(dados['etapas'])
+
+    # Comparação com a execução anterior de mesmo motor, fonte e galerias
+    os.makedirs(args.saida, exist_ok=True)
+    chave = chave_comparacao(resultado)
+    anterior_path = args.comparar
+    if anterior_path is None:
+        anterior_path, anterior = buscar_anterior(args.saida, chave)
+    else:
+        with open(anterior_path, 'r', encoding='utf-8') as f:
+            anterior = json.load(f)
+        if chave_comparacao(anterior) != chave:
+            motor, fonte, tamanhos_anterior = chave_comparacao(anterior)
+            print(f"\nAviso: {anterior_path} não é comparável (motor {motor}, fonte {fonte}, "
+                  f"galerias {tamanhos_anterior}); comparação ignorada")
+            anterior_path = None
+
+    regressoes = []
+    if anterior_path:
+        regressoes = comparar(resultado, anterior, args.tolerancia)
+        print(f"\nComparação com {anterior_path}:")
+        if regressoes:
+            for etapa, antes, depois in regressoes:
+                print(f"  REGRESSÃO {etapa}: p50 {antes:.3f} ms -> {depois:.3f} ms")
+        else:
+            print("  Nenhuma regressão acima da tolerância")
+    elif args.comparar is None:
+        print("\nNenhuma execução anterior com o mesmo motor, fonte e galerias para comparação")
+
+    # Resultados legíveis por máquina: JSON completo + histórico CSV por etapa
+    saida_path = os.path.join(args.saida, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(saida_path, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, indent=4)
+
+    historico = os.path.join(args.saida, "historico.csv")
+    linhas = [("", resultado['etapas'])] + [(t, d['etapas']) for t, d in galerias.items()]
+    for galeria, etapas in linhas:
+        for etapa, d in etapas.items():
+            log_metrics({
+                'data': resultado['data'],
+                'motor': args.motor,
+                'galeria': galeria,
+                'etapa': etapa,
+                'amostras': d['amostras'],
+                'throughput_s': round(d['throughput_s'], 3),
+                'p50_ms': round(d['p50_ms'], 4),
+                'p95_ms': round(d['p95_ms'], 4),
+                'p99_ms': round(d['p99_ms'], 4)
+            }, csv_path=historico)
+
+    print(f"\nResultados salvos em: {saida_path}")
+
+    if regressoes and args.falhar_regressao:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
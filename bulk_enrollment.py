@@ -0,0 +1,257 @@
+import os
+import csv
+import json
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import multiprocessing as mp
+import cv2
+from database import FaceDatabase
+from database_sqlite import SQLiteFaceDatabase
+from quality_check import FaceQualityChecker
+from face_detection import FaceDetector
+from face_store import FaceStore
+from hardware import ImageFolderSource
+from recognizer import carregar_ou_treinar, criar_modelo
+from report import barra_progresso
+
+# Detector e verificador de qualidade de cada worker do pool
+_WORKER = None
+
+def ler_manifesto(caminho):
+    """
+    Lê um manifesto CSV (colunas nome, cpf, email, imagens separadas por ';')
+    ou JSON (lista de objetos com as mesmas chaves; imagens pode ser uma lista).
+    Caminhos relativos partem do diretório do manifesto e um diretório em
+    imagens equivale a todas as imagens dele. Retorna a lista de registros.
+    """
+    if caminho.lower().endswith(".json"):
+        with open(caminho, 'r', encoding='utf-8') as f:
+            linhas = json.load(f)
+    else:
+        # utf-8-sig: planilhas exportadas costumam gravar o BOM
+        with open(caminho, 'r', encoding='utf-8-sig', newline='') as f:
+            linhas = list(csv.DictReader(f))
+
+    base = os.path.dirname(os.path.abspath(caminho))
+    registros = []
+    for numero, linha in enumerate(linhas, start=1):
+        imagens = linha.get('imagens') or []
+        if isinstance(imagens, str):
+            imagens = [i.strip() for i in imagens.split(';') if i.strip()]
+        caminhos = []
+        for imagem in imagens:
+            imagem = os.path.join(base, imagem)
+            if os.path.isdir(imagem):
+                caminhos.extend(sorted(
+                    os.path.join(imagem, nome) for nome in os.listdir(imagem)
+                    if nome.lower().endswith(ImageFolderSource.extensoes)
+                ))
+            else:
+                caminhos.append(imagem)
+        registros.append({
+            'linha': numero,
+            'nome': (linha.get('nome') or '').strip(),
+            'cpf': ''.join(c for c in str(linha.get('cpf') or '') if c.isdigit()),
+            'email': (linha.get('email') or '').strip(),
+            'imagens': caminhos
+        })
+    return registros
+
+def _iniciar_worker(faces_dir, tamanho_maximo):
+    """
+    Inicializador do pool: um detector por processo (o cascade não é
+    compartilhável); faces_dir é o diretório temporário do lote
+    """
+    global _WORKER
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cv2.setNumThreads(1)
+    quality_checker = FaceQualityChecker()
+    # Como no cadastro interativo, faces fora dos limites também são detectadas
+    # para que a rejeição traga o motivo
+    face_detector = FaceDetector(
+        min_face_size=quality_checker.min_face_size // 2,
+        max_face_size=int(quality_checker.max_face_size * 1.5)
+    )
+    _WORKER = {
+        'quality_checker': quality_checker,
+        'face_detector': face_detector,
+        'faces_dir': faces_dir,
+        'tamanho_maximo': tamanho_maximo
+    }
+
+def _extrair_face(caminho):
+    """Detecta e valida a face de uma imagem; retorna (face, None) ou (None, motivo)"""
+    gray = cv2.imread(caminho, cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return None, "Imagem ilegível"
+
+    # Fotos em alta resolução são reduzidas para a escala de uma captura da câmera
+    escala = _WORKER['tamanho_maximo'] / max(gray.shape)
+    if escala < 1.0:
+        gray = cv2.resize(gray, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+
+    faces = _WORKER['face_detector'].detect_gray(gray)
+    if len(faces) == 0:
+        return None, "Nenhuma face detectada"
+    if len(faces) > 1:
+        return None, "Mais de uma face na imagem"
+
+    (x, y, w, h) = faces[0]
+    face_region = gray[y:y+h, x:x+w]
+    quality_msg = _WORKER['quality_checker'].check_quality(face_region, (x, y, w, h))
+    if quality_msg != "OK":
+        return None, quality_msg
+    return face_region, None
+
+def _processar_registro(registro):
+    """Executada nos workers: grava as faces aprovadas no diretório do lote; retorna (registro, face_paths, rejeições)"""
+    face_paths = []
+    rejeicoes = []
+    for caminho in registro['imagens']:
+        face, motivo = _extrair_face(caminho)
+        if face is None:
+            rejeicoes.append((caminho, motivo))
+            continue
+        # Mesmo padrão de nome do cadastro interativo: <cpf>.png, <cpf>_2.png, ...
+        sufixo = f"_{len(face_paths) + 1}" if face_paths else ""
+        face_path = os.path.join(_WORKER['faces_dir'], f"{registro['cpf']}{sufixo}.png")
+        cv2.imwrite(face_path, face)
+        face_paths.append(face_path)
+    return registro, face_paths, rejeicoes
+
+def cadastrar_lote(database, registros, model, face_store, snapshot_dir="modelos",
+                   processos=None, tamanho_maximo=640, progresso=None):
+    """
+    Cadastra os registros do manifesto: CPFs repetidos (no manifesto ou já
+    cadastrados) são descartados por índice, a detecção e a verificação de
+    qualidade rodam em um pool de processos, as pessoas aprovadas são gravadas
+    de uma vez (cadastrar_pessoas) e o modelo recebe as faces novas em uma única
+    atualização, salva em snapshot. As faces são gravadas em um diretório
+    temporário e só passam para faces_dir junto com o cadastro: um lote recusado
+    ou interrompido não deixa arquivos órfãos. Retorna (IDs cadastrados,
+    rejeições), com rejeições como (linha, nome, cpf, imagem, motivo).
+    """
+    rejeicoes = []
+    cpfs = set()
+    validos = []
+    for registro in registros:
+        motivo = None
+        if not registro['nome']:
+            motivo = "Nome ausente"
+        elif not registro['cpf']:
+            motivo = "CPF ausente ou inválido"
+        elif registro['cpf'] in cpfs:
+            motivo = "CPF repetido no manifesto"
+        elif database.verificar_duplicidade(registro['cpf']):
+            motivo = "Já existe uma pessoa cadastrada com este CPF"
+        elif not registro['imagens']:
+            motivo = "Nenhuma imagem informada"
+        if motivo is not None:
+            rejeicoes.append((registro['linha'], registro['nome'], registro['cpf'], "", motivo))
+            continue
+        cpfs.add(registro['cpf'])
+        validos.append(registro)
+    if not validos:
+        return [], rejeicoes
+
+    # Modelo atual (snapshot ou treino) antes do cadastro: depois dele, apenas as faces novas são treinadas
+    carregar_ou_treinar(model, database, snapshot_dir, face_store)
+
+    aprovados = []
+    # No mesmo sistema de arquivos de faces_dir, para que a transferência seja um rename
+    temporario = tempfile.mkdtemp(prefix=".lote_", dir=database.faces_dir)
+    try:
+        metodo = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+        with mp.get_context(metodo).Pool(processos, initializer=_iniciar_worker,
+                                         initargs=(temporario, tamanho_maximo)) as pool:
+            for n, (registro, face_paths, rejeitadas) in enumerate(
+                    pool.imap_unordered(_processar_registro, validos, chunksize=16), start=1):
+                for imagem, motivo in rejeitadas:
+                    rejeicoes.append((registro['linha'], registro['nome'], registro['cpf'], imagem, motivo))
+                if face_paths:
+                    aprovados.append((registro, face_paths))
+                else:
+                    rejeicoes.append((registro['linha'], registro['nome'], registro['cpf'], "",
+                                      "Nenhuma imagem aprovada"))
+                if progresso is not None and (n % 100 == 0 or n == len(validos)):
+                    progresso(n, len(validos))
+
+        if not aprovados:
+            return [], rejeicoes
+
+        # Ordem do manifesto nos IDs, independente da ordem de conclusão dos workers
+        aprovados.sort(key=lambda a: a[0]['linha'])
+        pessoas = []
+        transferidas = []
+        try:
+            for registro, face_paths in aprovados:
+                destinos = []
+                for face_path in face_paths:
+                    destino = os.path.join(database.faces_dir, os.path.basename(face_path))
+                    os.replace(face_path, destino)
+                    transferidas.append(destino)
+                    destinos.append(destino)
+                pessoas.append((registro['nome'], registro['cpf'], registro['email'], destinos))
+            ids = database.cadastrar_pessoas(pessoas)
+        except BaseException:
+            # Cadastro recusado (ex.: CPF cadastrado por outro processo) ou interrompido
+            for destino in transferidas:
+                os.remove(destino)
+            raise
+    finally:
+        shutil.rmtree(temporario, ignore_errors=True)
+
+    faces, labels = face_store.adicionar(database.listar_faces_novas(), model)
+    if len(faces):
+        model.update_processed(faces, labels)
+        model.save_snapshot(snapshot_dir, model.fingerprint(database.listar_faces_treinamento()))
+    return ids, rejeicoes
+
+def main():
+    """Cadastro em lote a partir de um manifesto CSV ou JSON"""
+    parser = argparse.ArgumentParser(description="Cadastro em lote de pessoas a partir de um manifesto")
+    parser.add_argument("manifesto", help="Arquivo CSV ou JSON com nome, cpf, email e imagens")
+    parser.add_argument("--rejeitados", default=None,
+                        help="CSV com as linhas e imagens rejeitadas (padrão: <manifesto>_rejeitados.csv)")
+    parser.add_argument("--processos", type=int, default=None,
+                        help="Processos do pool (padrão: número de núcleos)")
+    parser.add_argument("--tamanho-maximo", type=int, default=640,
+                        help="Maior lado, em pixels, ao qual as fotos são reduzidas (padrão: 640)")
+    parser.add_argument("--banco", choices=["json", "sqlite"], default="json",
+                        help="Backend de armazenamento (padrão: json)")
+    parser.add_argument("--db", default="faces.db", help="Arquivo do banco SQLite")
+    parser.add_argument("--motor", choices=["opencv", "numpy", "mapeado"], default="opencv",
+                        help="Motor LBPH (padrão: opencv)")
+    args = parser.parse_args()
+
+    registros = ler_manifesto(args.manifesto)
+    print(f"{len(registros)} pessoas no manifesto")
+
+    database = SQLiteFaceDatabase(args.db) if args.banco == "sqlite" else FaceDatabase()
+    snapshot_dir = "modelos"
+    model = criar_modelo(args.motor, snapshot_dir)
+    face_store = FaceStore(os.path.join(snapshot_dir, "faces.pack"))
+    inicio = time.monotonic()
+    try:
+        ids, rejeicoes = cadastrar_lote(database, registros, model, face_store, snapshot_dir,
+                                        args.processos, args.tamanho_maximo, progresso=barra_progresso)
+    except ValueError as e:
+        print(f"\nErro: {e}")
+        return
+    finally:
+        database.fechar()
+
+    print(f"\n{len(ids)} pessoas cadastradas em {time.monotonic() - inicio:.1f} s")
+    if rejeicoes:
+        caminho = args.rejeitados or os.path.splitext(args.manifesto)[0] + "_rejeitados.csv"
+        with open(caminho, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['linha', 'nome', 'cpf', 'imagem', 'motivo'])
+            writer.writerows(rejeicoes)
+        print(f"{len(rejeicoes)} rejeições | Detalhes: {os.path.abspath(caminho)}")
+
+if __name__ == "__main__":
+    main()
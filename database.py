@@ -1,18 +1,78 @@
 import os
 import json
+import gzip
+import fcntl
+import time
+import shutil
+import argparse
+import threading
+import contextlib
 from datetime import datetime
 import cv2
 import numpy as np
+from rollups import RecognitionRollups
 
 class FaceDatabase:
-    def __init__(self):
-        """Inicializa o banco de dados"""
-        self.pessoas_file = "pessoas.json"
-        self.reconhecimentos_file = "reconhecimentos.json"
-        self.faces_dir = "faces"
+    def __init__(self, pessoas_file="pessoas.json", reconhecimentos_file="reconhecimentos.json",
+                 faces_dir="faces", historico_dir=None, particionamento="mensal"):
+        """
+        Inicializa o banco de dados.
+        historico_dir: partições do histórico de reconhecimentos (padrão: "historico"
+            ao lado de reconhecimentos_file).
+        particionamento: "mensal" (AAAA-MM.jsonl) ou "diario" (AAAA-MM-DD.jsonl).
+        """
+        self.pessoas_file = pessoas_file
+        self.reconhecimentos_file = reconhecimentos_file
+        self.faces_dir = faces_dir
+        
+        # Log de eventos legado (não particionado), migrado para historico_dir
+        self.reconhecimentos_log = os.path.splitext(reconhecimentos_file)[0] + ".jsonl"
+        
+        # Histórico particionado por período (uma linha JSON por reconhecimento,
+        # somente append) e índice com a data/hora mínima e máxima de cada partição
+        if historico_dir is None:
+            historico_dir = os.path.join(os.path.dirname(reconhecimentos_file), "historico")
+        self.historico_dir = historico_dir
+        self._tamanho_chave = {"mensal": 7, "diario": 10}[particionamento]
+        self._indice_file = os.path.join(historico_dir, "indice.json")
+        self._particoes = {}  # chave -> {'arquivo', 'min', 'max', 'linhas', 'bytes'}
+        self._indice_alterado = False
+        # O índice e os arquivos das partições também são alterados por outros
+        # processos (ex.: --arquivar-ate): gravações sob flock em indice.lock e
+        # releitura quando o (mtime, tamanho) do índice muda
+        self._trava_indice = None
+        self._assinatura_indice = None
+        self._migracao = None  # Partições sendo substituídas por migrar_historico
+        
+        # Agregados mantidos a cada reconhecimento (consultas sem varrer o histórico)
+        self._rollups_file = os.path.join(historico_dir, "rollups.json")
+        self._rollups_dir = os.path.join(historico_dir, "rollups")  # Visitas por dia, por partição
+        self.rollups_intervalo = 30.0  # Tempo mínimo (s) entre gravações dos agregados
+        self.rollups = RecognitionRollups()
+        self._rollups_alterados = False
+        self._ultimo_rollup = time.monotonic()
+        self.fsync_a_cada = 20  # Número de eventos entre fsyncs
+        self.fsync_intervalo = 2.0  # Tempo máximo (s) entre fsyncs
+        self._log = None
+        self._chave_log = None  # Partição aberta para append
+        self._pendentes_fsync = 0
+        self._ultimo_fsync = time.monotonic()
+        
+        # Índice em memória de pessoas (id -> pessoa, cpf -> pessoa), recarregado
+        # apenas quando o mtime/tamanho de pessoas_file muda
+        self.intervalo_verificacao = 1.0  # Tempo mínimo (s) entre verificações do arquivo
+        self._lock = threading.RLock()
+        self._pessoas = []
+        self._pessoas_por_id = {}
+        self._pessoas_por_cpf = {}
+        self._assinatura_pessoas = None
+        self._ultima_verificacao = 0.0
+        self._faces_carregadas = set()  # (id, face_path) já entregues para treino
         
         # Criar diretórios se não existirem
         os.makedirs(self.faces_dir, exist_ok=True)
+        os.makedirs(self.historico_dir, exist_ok=True)
+        os.makedirs(self._rollups_dir, exist_ok=True)
         
         # Inicializar arquivos se não existirem
         if not os.path.exists(self.pessoas_file):
@@ -25,6 +85,18 @@ class FaceDatabase:
                 
         # Migrar dados antigos se necessário
         self.migrar_dados_antigos()
+        
+        # Conferir o índice das partições (descartando linhas incompletas
+        # deixadas por uma queda) e migrar o histórico legado
+        migracao_retomada = self._carregar_indice_particoes()
+        if (os.path.getsize(self.reconhecimentos_file) > len("[]") or
+                os.path.exists(self.reconhecimentos_log)):
+            self.migrar_historico()
+            self.reconstruir_rollups()
+        elif migracao_retomada:
+            self.reconstruir_rollups()
+        else:
+            self._carregar_rollups()
     
     def migrar_dados_antigos(self):
         """Migra dados do formato antigo para o novo formato"""
@@ -47,120 +119,909 @@ class FaceDatabase:
                     }
                     novas_pessoas.append(nova_pessoa)
                 
-                with open(self.pessoas_file, 'w') as f:
-                    json.dump(novas_pessoas, f, indent=4)
+                self._gravar_pessoas(novas_pessoas)
                     
                 print("Migração concluída com sucesso!")
                 
         except Exception as e:
             print(f"Erro na migração dos dados: {e}")
 
-    def verificar_duplicidade(self, cpf):
-        """Verifica se já existe uma pessoa cadastrada com o CPF informado"""
-        with open(self.pessoas_file, 'r') as f:
-            pessoas = json.load(f)
+    def _gravar_pessoas(self, pessoas):
+        """
+        Grava pessoas_file de forma atômica: outros processos recarregam o
+        arquivo quando ele muda e nunca devem ler uma gravação pela metade
+        """
+        temp = self.pessoas_file + ".tmp"
+        with open(temp, 'w') as f:
+            json.dump(pessoas, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.pessoas_file)
+    
+    def _assinatura_arquivo(self):
+        """Retorna (mtime, tamanho) do arquivo de pessoas"""
+        st = os.stat(self.pessoas_file)
+        return (st.st_mtime_ns, st.st_size)
+    
+    def _indexar_pessoas(self, pessoas, assinatura):
+        """Reconstrói os mapas id -> pessoa e cpf -> pessoa"""
+        self._pessoas = pessoas
+        self._pessoas_por_id = {p['id']: p for p in pessoas}
+        self._pessoas_por_cpf = {p['cpf']: p for p in pessoas}
+        self._assinatura_pessoas = assinatura
+    
+    def _atualizar_indice(self, forcar=False):
+        """Recarrega o índice se pessoas_file foi alterado por outro processo"""
+        with self._lock:
+            agora = time.monotonic()
+            if (not forcar and self._assinatura_pessoas is not None and
+                    agora - self._ultima_verificacao < self.intervalo_verificacao):
+                return
+            self._ultima_verificacao = agora
             
-        for pessoa in pessoas:
-            if pessoa['cpf'] == cpf:
-                return True
+            assinatura = self._assinatura_arquivo()
+            if assinatura == self._assinatura_pessoas:
+                return
                 
-        return False
+            with open(self.pessoas_file, 'r') as f:
+                pessoas = json.load(f)
+            self._indexar_pessoas(pessoas, assinatura)
+
+    def verificar_duplicidade(self, cpf):
+        """Verifica se já existe uma pessoa cadastrada com o CPF informado"""
+        self._atualizar_indice(forcar=True)
+        return cpf in self._pessoas_por_cpf
 
     def cadastrar_pessoa(self, nome, cpf, email, face_paths):
         """Cadastra uma nova pessoa com CPF e e-mail"""
-        with open(self.pessoas_file, 'r') as f:
-            pessoas = json.load(f)
+        with self._lock:
+            self._atualizar_indice(forcar=True)
             
-        # Gerar novo ID
-        if pessoas:
-            novo_id = max(p['id'] for p in pessoas) + 1
-        else:
-            novo_id = 1
+            # Gerar novo ID
+            if self._pessoas_por_id:
+                novo_id = max(self._pessoas_por_id) + 1
+            else:
+                novo_id = 1
+                
+            nova_pessoa = {
+                'id': novo_id,
+                'nome': nome,
+                'cpf': cpf,
+                'email': email,
+                'face_paths': face_paths,
+                'data_cadastro': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
             
-        nova_pessoa = {
-            'id': novo_id,
-            'nome': nome,
-            'cpf': cpf,
-            'email': email,
-            'face_paths': face_paths,
-            'data_cadastro': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-        
-        pessoas.append(nova_pessoa)
-        
-        with open(self.pessoas_file, 'w') as f:
-            json.dump(pessoas, f, indent=4)
+            pessoas = self._pessoas + [nova_pessoa]
             
+            self._gravar_pessoas(pessoas)
+                
+            # Write-through: o índice em memória reflete a gravação sem reler o arquivo
+            self._pessoas = pessoas
+            self._pessoas_por_id[novo_id] = nova_pessoa
+            self._pessoas_por_cpf[cpf] = nova_pessoa
+            self._assinatura_pessoas = self._assinatura_arquivo()
+                
         return novo_id
     
+    def cadastrar_pessoas(self, pessoas):
+        """
+        Cadastra várias pessoas (nome, cpf, email, face_paths) com uma única
+        gravação de pessoas_file; retorna os IDs na mesma ordem. Nenhuma é
+        gravada se algum CPF já estiver cadastrado ou se repetir na lista.
+        """
+        with self._lock:
+            self._atualizar_indice(forcar=True)
+            
+            vistos = set()
+            duplicados = set()
+            for _, cpf, _, _ in pessoas:
+                if cpf in vistos or cpf in self._pessoas_por_cpf:
+                    duplicados.add(cpf)
+                vistos.add(cpf)
+            if duplicados:
+                raise ValueError(f"CPFs já cadastrados ou repetidos: {', '.join(sorted(duplicados)[:10])}")
+            
+            proximo_id = max(self._pessoas_por_id) + 1 if self._pessoas_por_id else 1
+            data_cadastro = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            novas = [{
+                'id': proximo_id + i,
+                'nome': nome,
+                'cpf': cpf,
+                'email': email,
+                'face_paths': face_paths,
+                'data_cadastro': data_cadastro
+            } for i, (nome, cpf, email, face_paths) in enumerate(pessoas)]
+            
+            todas = self._pessoas + novas
+            self._gravar_pessoas(todas)
+            
+            self._pessoas = todas
+            for pessoa in novas:
+                self._pessoas_por_id[pessoa['id']] = pessoa
+                self._pessoas_por_cpf[pessoa['cpf']] = pessoa
+            self._assinatura_pessoas = self._assinatura_arquivo()
+            
+        return [pessoa['id'] for pessoa in novas]
+    
     def carregar_faces_treinamento(self):
         """Carrega faces para treinamento do modelo"""
-        with open(self.pessoas_file, 'r') as f:
-            pessoas = json.load(f)
-            
+        self._atualizar_indice(forcar=True)
+        self._faces_carregadas = set()
+        return self._carregar_faces(self._pessoas)
+    
+    def listar_faces_treinamento(self):
+        """Lista (id, face_path, tamanho, mtime_ns) das faces de treino sem decodificá-las"""
+        self._atualizar_indice(forcar=True)
+        entradas = []
+        for pessoa in self._pessoas:
+            for face_path in pessoa['face_paths']:
+                try:
+                    st = os.stat(face_path)
+                except OSError:
+                    continue
+                entradas.append((pessoa['id'], face_path, st.st_size, st.st_mtime_ns))
+        return entradas
+    
+    def marcar_faces_carregadas(self, entradas):
+        """Marca faces como já entregues (ex.: modelo carregado de um snapshot)"""
+        self._faces_carregadas = {(e[0], e[1]) for e in entradas}
+    
+    def listar_faces_novas(self):
+        """Lista (id, face_path, tamanho, mtime_ns) das faces ainda não entregues e as marca como entregues"""
+        novas = [e for e in self.listar_faces_treinamento() if (e[0], e[1]) not in self._faces_carregadas]
+        self._faces_carregadas.update((e[0], e[1]) for e in novas)
+        return novas
+    
+    def carregar_faces_novas(self):
+        """Carrega apenas as faces ainda não entregues por carregar_faces_treinamento/carregar_faces_novas"""
+        self._atualizar_indice(forcar=True)
+        return self._carregar_faces(self._pessoas)
+    
+    def _carregar_faces(self, pessoas):
+        """Lê do disco as faces das pessoas que ainda não foram carregadas"""
         faces = []
         labels = []
         
         for pessoa in pessoas:
             for face_path in pessoa['face_paths']:
+                if (pessoa['id'], face_path) in self._faces_carregadas:
+                    continue
                 if os.path.exists(face_path):
                     face = cv2.imread(face_path, cv2.IMREAD_GRAYSCALE)
                     if face is not None:
                         faces.append(face)
                         labels.append(pessoa['id'])
+                        self._faces_carregadas.add((pessoa['id'], face_path))
                         
         return faces, labels
     
     def get_pessoa_info(self, pessoa_id):
         """Retorna informações da pessoa pelo ID"""
-        with open(self.pessoas_file, 'r') as f:
-            pessoas = json.load(f)
-            for pessoa in pessoas:
-                if pessoa['id'] == pessoa_id:
-                    return pessoa
-        return None
-    
-    def registrar_reconhecimento(self, pessoa_id, confianca, face_path):
-        """Registra um reconhecimento e retorna os dados da pessoa"""
-        with open(self.pessoas_file, 'r') as f:
-            pessoas = json.load(f)
-            
-        pessoa = next((p for p in pessoas if p['id'] == pessoa_id), None)
+        self._atualizar_indice()
+        return self._pessoas_por_id.get(pessoa_id)
+    
+    def registrar_reconhecimento(self, pessoa_id, confianca, face_path, ocorrencias=1,
+                                 inicio=None, fim=None, camera=None):
+        """
+        Registra um reconhecimento e retorna os dados da pessoa. Para eventos
+        agrupados (debounce), ocorrencias, inicio e fim descrevem as detecções
+        cobertas pelo evento.
+        """
+        pessoa = self.get_pessoa_info(pessoa_id)
         if not pessoa:
             return None
             
-        with open(self.reconhecimentos_file, 'r') as f:
-            reconhecimentos = json.load(f)
+        # Outros processos podem gravar na mesma partição: o append é feito sob o
+        # flock do índice e a data/hora é tomada dentro dele, de modo que as
+        # linhas continuam em ordem cronológica (busca binária dos relatórios)
+        with self._lock, self._bloquear_indice():
+            novo_reconhecimento = {
+                'pessoa_id': pessoa_id,
+                'nome': pessoa['nome'],
+                'cpf': pessoa['cpf'],
+                'email': pessoa['email'],
+                'confianca': confianca,
+                'face_path': face_path,
+                'data_hora': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            }
+            if inicio is not None:
+                novo_reconhecimento.update({'ocorrencias': ocorrencias, 'inicio': inicio, 'fim': fim or inicio})
+            if camera is not None:
+                novo_reconhecimento['camera'] = camera
+            
+            # Append de uma linha na partição do período: custo constante,
+            # independente do histórico
+            self._anexar(novo_reconhecimento)
             
-        novo_reconhecimento = {
-            'pessoa_id': pessoa_id,
-            'nome': pessoa['nome'],
-            'cpf': pessoa['cpf'],
-            'email': pessoa['email'],
-            'confianca': confianca,
-            'face_path': face_path,
-            'data_hora': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
+            # fsync em lotes: no máximo fsync_a_cada eventos ou fsync_intervalo
+            # segundos ficam expostos a uma queda de energia
+            self._pendentes_fsync += 1
+            if (self._pendentes_fsync >= self.fsync_a_cada or
+                    time.monotonic() - self._ultimo_fsync >= self.fsync_intervalo):
+                self.sincronizar()
+            
+        return pessoa
+    
+    def _anexar(self, reconhecimento):
+        """Grava o reconhecimento na partição do seu período e atualiza o índice"""
+        data_hora = reconhecimento['data_hora']
+        log = self._abrir_log(data_hora[:self._tamanho_chave])
+        self._conciliar_particao()
+        linha = (json.dumps(reconhecimento, ensure_ascii=False) + "\n").encode('utf-8')
+        log.write(linha)
+        log.flush()
         
-        reconhecimentos.append(novo_reconhecimento)
+        particao = self._particoes[self._chave_log]
+        if particao['min'] is None or data_hora < particao['min']:
+            particao['min'] = data_hora
+        if particao['max'] is None or data_hora > particao['max']:
+            particao['max'] = data_hora
+        particao['linhas'] += 1
+        particao['bytes'] += len(linha)
+        self._indice_alterado = True
         
+        self.rollups.adicionar(reconhecimento, self._chave_log)
+        self._rollups_alterados = True
+    
+    def _conciliar_particao(self):
+        """
+        Incorpora à entrada da partição aberta as linhas que outros processos
+        acrescentaram a ela (o tamanho do arquivo é a referência) e, se os
+        agregados estavam em dia com a entrada, também a eles. Chamado sob
+        _bloquear_indice.
+        """
+        if self._log is None:
+            return
+        chave = self._chave_log
+        particao = self._particoes[chave]
+        tamanho = os.fstat(self._log.fileno()).st_size
+        if tamanho <= particao['bytes']:
+            return
+        
+        em_dia = self.rollups.aplicadas.get(chave, 0) == particao['linhas']
+        with open(self._caminho_particao(chave), 'rb') as f:
+            f.seek(particao['bytes'])
+            dados = f.read(tamanho - particao['bytes'])
+        for linha in dados.splitlines():
+            try:
+                r = json.loads(linha)
+                data_hora = r['data_hora']
+            except (json.JSONDecodeError, KeyError):
+                continue
+            if particao['min'] is None or data_hora < particao['min']:
+                particao['min'] = data_hora
+            if particao['max'] is None or data_hora > particao['max']:
+                particao['max'] = data_hora
+            particao['linhas'] += 1
+            if em_dia:
+                self.rollups.adicionar(r, chave)
+        particao['bytes'] = tamanho
+        self._indice_alterado = True
+        if not em_dia:
+            # Entrada lida do índice de outro processo: relê a partição
+            self._aplicar_rollups_pendentes(chave)
+        self._rollups_alterados = True
+    
+    def _aplicar_rollups_pendentes(self, chave):
+        """Incorpora aos agregados as linhas da partição posteriores às já aplicadas"""
+        ja_aplicadas = self.rollups.aplicadas.get(chave, 0)
+        if self._particoes[chave]['linhas'] <= ja_aplicadas:
+            return False
+        for i, r in enumerate(ler_particao(self._caminho_particao(chave))):
+            if i >= ja_aplicadas:
+                self.rollups.adicionar(r, chave)
+        return True
+    
+    def sincronizar(self):
+        """Força a gravação em disco dos reconhecimentos pendentes e do índice"""
+        with self._lock:
+            if self._log is not None and self._pendentes_fsync:
+                self._log.flush()
+                os.fsync(self._log.fileno())
+            if self._indice_alterado:
+                self._salvar_indice_particoes()
+            # Os agregados só refletem linhas já sincronizadas; os eventos
+            # posteriores são reaplicados a partir das partições na inicialização
+            if (self._rollups_alterados and
+                    time.monotonic() - self._ultimo_rollup >= self.rollups_intervalo):
+                self._salvar_rollups()
+            self._pendentes_fsync = 0
+            self._ultimo_fsync = time.monotonic()
+    
+    def fechar(self):
+        """Sincroniza e fecha o log de reconhecimentos"""
+        with self._lock:
+            self.sincronizar()
+            if self._rollups_alterados:
+                self._salvar_rollups()
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+                self._chave_log = None
+    
+    def _abrir_log(self, chave):
+        """Abre (uma vez por partição) a partição chave para append"""
+        if self._chave_log == chave:
+            return self._log
+        
+        # Mudança de período: sincroniza a partição anterior antes de trocá-la
+        if self._log is not None:
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._log.close()
+            self._log = None
+        
+        self._recarregar_indice_particoes()
+        particao = self._particoes.get(chave)
+        if particao is not None and particao['arquivo'].endswith(".gz"):
+            self._desarquivar(chave)
+        elif particao is None:
+            self._particoes[chave] = {'arquivo': f"{chave}.jsonl", 'min': None, 'max': None,
+                                      'linhas': 0, 'bytes': 0}
+            self._indice_alterado = True
+        # Entrada possivelmente vinda do índice de outro processo
+        if self._aplicar_rollups_pendentes(chave):
+            self._rollups_alterados = True
+        
+        self._log = open(self._caminho_particao(chave), 'ab')
+        self._chave_log = chave
+        return self._log
+    
+    def _caminho_particao(self, chave):
+        return os.path.join(self.historico_dir, self._particoes[chave]['arquivo'])
+    
+    @contextlib.contextmanager
+    def _bloquear_indice(self):
+        """Exclusão mútua entre processos sobre o índice e as partições (reentrante)"""
+        if self._trava_indice is not None:
+            yield
+            return
+        with open(os.path.join(self.historico_dir, "indice.lock"), 'a') as trava:
+            fcntl.flock(trava, fcntl.LOCK_EX)
+            self._trava_indice = trava
+            try:
+                yield
+            finally:
+                self._trava_indice = None
+    
+    def _assinatura_do_indice(self):
+        """Retorna (mtime, tamanho) do índice das partições, ou None se não existir"""
+        try:
+            st = os.stat(self._indice_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+    
+    def _recarregar_indice_particoes(self, forcar=False):
+        """
+        Relê o índice se outro processo o gravou (ex.: partições arquivadas); a
+        entrada da partição aberta para append é mantida, pois só este processo
+        grava nela
+        """
+        with self._lock:
+            assinatura = self._assinatura_do_indice()
+            if assinatura is None or (not forcar and assinatura == self._assinatura_indice):
+                return
+            try:
+                with open(self._indice_file, 'r') as f:
+                    indice = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                return
+            indice.pop('_migracao', None)
+            for chave, entrada in indice.items():
+                if chave != self._chave_log:
+                    self._particoes[chave] = entrada
+            self._assinatura_indice = assinatura
+    
+    def _salvar_indice_particoes(self):
+        """Grava o índice das partições de forma atômica, sem perder as gravações de outros processos"""
+        with self._bloquear_indice():
+            self._recarregar_indice_particoes()
+            self._conciliar_particao()
+            indice = dict(self._particoes)
+            if self._migracao is not None:
+                indice['_migracao'] = self._migracao
+            temp_file = self._indice_file + ".tmp"
+            with open(temp_file, 'w') as f:
+                json.dump(indice, f, indent=1, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self._indice_file)
+            self._assinatura_indice = self._assinatura_do_indice()
+            self._indice_alterado = False
+    
+    def _carregar_indice_particoes(self):
+        """
+        Carrega o índice e reindexa apenas as partições cujo tamanho não confere
+        (normalmente só a atual, após uma queda antes da gravação do índice).
+        Conclui uma migração interrompida depois de gravadas as partições;
+        retorna True nesse caso.
+        """
+        with self._bloquear_indice():
+            try:
+                with open(self._indice_file, 'r') as f:
+                    indice = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                indice = {}
+            self._assinatura_indice = self._assinatura_do_indice()
+            
+            migracao = indice.pop('_migracao', None)
+            if migracao is not None:
+                # As partições migradas já estavam completas em disco quando a marca
+                # foi gravada: termina as substituições e descarta o legado
+                for chave in migracao:
+                    caminho = os.path.join(self.historico_dir, f"{chave}.jsonl")
+                    if os.path.exists(caminho + ".migracao"):
+                        os.replace(caminho + ".migracao", caminho)
+                self._descartar_legado()
+                self._indice_alterado = True
+            
+            particoes = {}
+            nomes = set(os.listdir(self.historico_dir))
+            for nome in sorted(nomes):
+                if nome.endswith((".tmp", ".migracao")):
+                    # Arquivamento ou migração interrompidos: o original continua válido
+                    os.remove(os.path.join(self.historico_dir, nome))
+                    continue
+                if nome.endswith(".jsonl") and nome + ".gz" in nomes:
+                    # Queda entre a compressão e a remoção do original
+                    os.remove(os.path.join(self.historico_dir, nome))
+                    continue
+                if nome.endswith(".jsonl.gz"):
+                    chave = nome[:-len(".jsonl.gz")]
+                elif nome.endswith(".jsonl"):
+                    chave = nome[:-len(".jsonl")]
+                else:
+                    continue
+                caminho = os.path.join(self.historico_dir, nome)
+                if nome.endswith(".jsonl"):
+                    self._reparar_log(caminho)
+                entrada = indice.get(chave)
+                if (entrada is None or entrada.get('arquivo') != nome or
+                        entrada.get('bytes') != os.path.getsize(caminho)):
+                    entrada = self._indexar_particao(caminho)
+                    self._indice_alterado = True
+                particoes[chave] = entrada
+            
+            if set(particoes) != set(indice):
+                self._indice_alterado = True
+            self._particoes = particoes
+            if self._indice_alterado:
+                self._salvar_indice_particoes()
+            else:
+                self._assinatura_indice = self._assinatura_do_indice()
+            return migracao is not None
+    
+    def _indexar_particao(self, caminho):
+        """Lê uma partição inteira para recalcular sua entrada no índice"""
+        entrada = {'arquivo': os.path.basename(caminho), 'min': None, 'max': None,
+                   'linhas': 0, 'bytes': os.path.getsize(caminho)}
+        for r in ler_particao(caminho):
+            data_hora = r['data_hora']
+            if entrada['min'] is None or data_hora < entrada['min']:
+                entrada['min'] = data_hora
+            if entrada['max'] is None or data_hora > entrada['max']:
+                entrada['max'] = data_hora
+            entrada['linhas'] += 1
+        return entrada
+    
+    def _gravar_json(self, caminho, dados):
+        """Grava dados em caminho de forma atômica"""
+        temp_file = caminho + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(dados, f, ensure_ascii=False)
+        os.replace(temp_file, caminho)
+    
+    def _salvar_rollups(self):
+        """
+        Grava de forma atômica as visitas por dia apenas das partições alteradas
+        (normalmente só a atual) e depois os agregados gerais, cujo tamanho não
+        cresce com o número de dias do histórico
+        """
+        for chave in sorted(self.rollups.alteradas):
+            self._gravar_json(os.path.join(self._rollups_dir, f"{chave}.json"), {
+                'dias': self.rollups.dias_da_particao(chave),
+                'aplicadas': self.rollups.aplicadas.get(chave, 0)
+            })
+        self._gravar_json(self._rollups_file, self.rollups.para_dict())
+        self.rollups.alteradas.clear()
+        self._rollups_alterados = False
+        self._ultimo_rollup = time.monotonic()
+    
+    def _carregar_rollups(self):
+        """
+        Carrega os agregados e incorpora apenas as linhas das partições
+        gravadas depois deles; reconstrói se não corresponderem ao histórico
+        """
+        try:
+            with open(self._rollups_file, 'r', encoding='utf-8') as f:
+                self.rollups = RecognitionRollups(json.load(f))
+            # Formato anterior (visitas por dia dentro de rollups.json): as
+            # partições já estão marcadas como alteradas e são gravadas abaixo
+            if not self.rollups.alteradas:
+                for chave, n in self.rollups.aplicadas.items():
+                    with open(os.path.join(self._rollups_dir, f"{chave}.json"), 'r', encoding='utf-8') as f:
+                        dados = json.load(f)
+                    # Queda entre a gravação das partições e a dos agregados gerais
+                    if dados['aplicadas'] != n:
+                        raise ValueError(f"Agregados da partição {chave} não conferem")
+                    self.rollups.dias.update(dados['dias'])
+        except (FileNotFoundError, ValueError, KeyError):
+            self.reconstruir_rollups()
+            return
+        
+        aplicadas = self.rollups.aplicadas
+        if any(n > self._particoes.get(chave, {}).get('linhas', 0) for chave, n in aplicadas.items()):
+            self.reconstruir_rollups()
+            return
+        
+        for chave in sorted(self._particoes):
+            if self._aplicar_rollups_pendentes(chave):
+                self._rollups_alterados = True
+        if self._rollups_alterados or self.rollups.alteradas:
+            self._salvar_rollups()
+    
+    def reconstruir_rollups(self):
+        """Recalcula os agregados a partir de todas as partições do histórico"""
+        with self._lock:
+            self.sincronizar()
+            self.rollups = RecognitionRollups()
+            for chave in sorted(self._particoes):
+                for r in ler_particao(self._caminho_particao(chave)):
+                    self.rollups.adicionar(r, chave)
+            for nome in os.listdir(self._rollups_dir):
+                if nome[:-len(".json")] not in self.rollups.aplicadas:
+                    os.remove(os.path.join(self._rollups_dir, nome))
+            self._salvar_rollups()
+        return self.rollups.total
+    
+    def resumo_pessoa(self, pessoa_id):
+        """Total, primeira/última ocorrência, histograma por hora e confiança de uma pessoa"""
+        with self._lock:
+            return self.rollups.resumo_pessoa(pessoa_id)
+    
+    def visitas_por_dia(self, data_inicio, data_fim, pessoa_id=None):
+        """Reconhecimentos por dia no período, de todos ou de uma pessoa"""
+        with self._lock:
+            return self.rollups.visitas_por_dia(data_inicio, data_fim, pessoa_id)
+    
+    def horarios_movimentados(self, n=5):
+        """As n horas do dia com mais reconhecimentos"""
+        with self._lock:
+            return self.rollups.horarios_movimentados(n)
+    
+    def totais_reconhecimentos(self):
+        """Total de reconhecimentos, pessoas distintas e confiança geral"""
+        with self._lock:
+            return self.rollups.totais()
+    
+    def migrar_historico(self):
+        """
+        Distribui o histórico legado (reconhecimentos.json e o log .jsonl não
+        particionado) entre as partições, antes dos eventos que elas já tenham
+        """
+        with self._lock, self._bloquear_indice():
+            self.fechar()
+            
+            legados = []
+            if os.path.getsize(self.reconhecimentos_file) > len("[]"):
+                with open(self.reconhecimentos_file, 'r') as f:
+                    legados = json.load(f)
+            
+            def iterar_legado():
+                yield from legados
+                if os.path.exists(self.reconhecimentos_log):
+                    self._reparar_log(self.reconhecimentos_log)
+                    yield from ler_particao(self.reconhecimentos_log)
+            
+            # Cada partição afetada é reescrita em um temporário: eventos legados
+            # (mais antigos) seguidos do conteúdo atual da partição
+            temporarios = {}
+            indices = {}  # Entradas do índice calculadas durante a cópia
+            total = 0
+            try:
+                for r in iterar_legado():
+                    if 'data_hora' not in r:
+                        continue
+                    chave = r['data_hora'][:self._tamanho_chave]
+                    f = temporarios.get(chave)
+                    if f is None:
+                        if chave in self._particoes and self._particoes[chave]['arquivo'].endswith(".gz"):
+                            self._desarquivar(chave)
+                        f = temporarios[chave] = open(
+                            os.path.join(self.historico_dir, f"{chave}.jsonl.migracao"), 'wb')
+                        indices[chave] = {'arquivo': f"{chave}.jsonl", 'min': r['data_hora'],
+                                          'max': r['data_hora'], 'linhas': 0, 'bytes': 0}
+                    f.write((json.dumps(r, ensure_ascii=False) + "\n").encode('utf-8'))
+                    entrada = indices[chave]
+                    entrada['min'] = min(entrada['min'], r['data_hora'])
+                    entrada['max'] = max(entrada['max'], r['data_hora'])
+                    entrada['linhas'] += 1
+                    total += 1
+                
+                for chave, f in temporarios.items():
+                    atual = self._particoes.get(chave)
+                    if atual is not None:
+                        with open(self._caminho_particao(chave), 'rb') as f_atual:
+                            shutil.copyfileobj(f_atual, f)
+                        if atual['linhas']:
+                            entrada = indices[chave]
+                            entrada['min'] = min(entrada['min'], atual['min'])
+                            entrada['max'] = max(entrada['max'], atual['max'])
+                            entrada['linhas'] += atual['linhas']
+                    indices[chave]['bytes'] = f.tell()
+                    f.flush()
+                    os.fsync(f.fileno())
+            finally:
+                for f in temporarios.values():
+                    f.close()
+            
+            # Marca no índice antes das substituições: após uma queda, a
+            # inicialização as conclui e descarta o legado em vez de migrá-lo de novo
+            self._migracao = sorted(temporarios)
+            self._salvar_indice_particoes()
+            for chave in temporarios:
+                caminho = os.path.join(self.historico_dir, f"{chave}.jsonl")
+                os.replace(caminho + ".migracao", caminho)
+                self._particoes[chave] = indices[chave]
+            
+            # Só depois das partições gravadas o legado é descartado
+            self._descartar_legado()
+            self._migracao = None
+            self._salvar_indice_particoes()
+            
+        print(f"Histórico migrado para partições: {total} reconhecimentos")
+        return total
+    
+    def _descartar_legado(self):
+        """Esvazia o histórico legado já migrado para as partições"""
         with open(self.reconhecimentos_file, 'w') as f:
-            json.dump(reconhecimentos, f, indent=4)
+            json.dump([], f)
+        if os.path.exists(self.reconhecimentos_log):
+            os.remove(self.reconhecimentos_log)
+    
+    def arquivar_particoes(self, ate):
+        """
+        Comprime (gzip) as partições até a chave ate (ex.: "2024-12"), exceto a do
+        período atual. Continuam consultáveis; apenas não são mais lidas por busca
+        binária. Retorna as chaves arquivadas.
+        """
+        atual = datetime.now().strftime("%Y-%m-%d %H:%M:%S")[:self._tamanho_chave]
+        arquivadas = []
+        with self._lock, self._bloquear_indice():
+            self._recarregar_indice_particoes()
+            for chave in sorted(self._particoes):
+                particao = self._particoes[chave]
+                if chave > ate or chave >= atual or particao['arquivo'].endswith(".gz"):
+                    continue
+                if chave == self._chave_log:
+                    self.fechar()
+                origem = self._caminho_particao(chave)
+                destino = origem + ".gz"
+                with open(origem, 'rb') as f_in, gzip.open(destino + ".tmp", 'wb') as f_out:
+                    shutil.copyfileobj(f_in, f_out)
+                os.replace(destino + ".tmp", destino)
+                particao['arquivo'] += ".gz"
+                particao['bytes'] = os.path.getsize(destino)
+                self._salvar_indice_particoes()
+                os.remove(origem)
+                arquivadas.append(chave)
+        return arquivadas
+    
+    def _desarquivar(self, chave):
+        """Descomprime uma partição arquivada que voltou a receber eventos"""
+        with self._bloquear_indice():
+            self._recarregar_indice_particoes()
+            origem = self._caminho_particao(chave)
+            destino = origem[:-len(".gz")]
+            with gzip.open(origem, 'rb') as f_in, open(destino + ".tmp", 'wb') as f_out:
+                shutil.copyfileobj(f_in, f_out)
+            os.replace(destino + ".tmp", destino)
+            particao = self._particoes[chave]
+            particao['arquivo'] = os.path.basename(destino)
+            particao['bytes'] = os.path.getsize(destino)
+            self._salvar_indice_particoes()
+            os.remove(origem)
+    
+
+    def _reparar_log(self, caminho):
+        """Remove uma última linha incompleta (escrita interrompida) do arquivo"""
+        if not os.path.exists(caminho):
+            return
             
-        return pessoa
+        with open(caminho, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            tamanho = f.tell()
+            if tamanho == 0:
+                return
+            f.seek(tamanho - 1)
+            if f.read(1) == b"\n":
+                return
+                
+            # Procura a última quebra de linha a partir do fim
+            pos = tamanho
+            bloco = 4096
+            while pos > 0:
+                inicio = max(0, pos - bloco)
+                f.seek(inicio)
+                dados = f.read(pos - inicio)
+                idx = dados.rfind(b"\n")
+                if idx != -1:
+                    f.truncate(inicio + idx + 1)
+                    return
+                pos = inicio
+            f.truncate(0)
+    
+    def _intervalo(self, data_inicio, data_fim):
+        """Valida as datas e converte para o formato armazenado (comparação de strings)"""
+        inicio = datetime.strptime(data_inicio, "%Y-%m-%d").strftime("%Y-%m-%d %H:%M:%S")
+        fim = datetime.strptime(data_fim, "%Y-%m-%d").strftime("%Y-%m-%d %H:%M:%S")
+        return inicio, fim
+    
+    def _buscar_posicao(self, f, anterior, tamanho, janela=65536):
+        """
+        Busca binária em uma partição (em ordem cronológica, pois só recebe appends):
+        retorna o início de uma linha, no máximo janela bytes antes da primeira
+        linha cuja data_hora não satisfaz anterior(data_hora)
+        """
+        baixo, alto = 0, tamanho
+        while alto - baixo > janela:
+            meio = (baixo + alto) // 2
+            f.seek(meio)
+            f.readline()  # Descarta a linha parcial
+            posicao = f.tell()
+            linha = f.readline()
+            try:
+                antes = bool(linha) and anterior(json.loads(linha)['data_hora'])
+            except (json.JSONDecodeError, KeyError):
+                antes = False
+            if antes:
+                baixo = posicao
+            else:
+                alto = meio
+        return baixo
+    
+    def particoes_do_periodo(self, inicio, fim):
+        """Chaves das partições cujo intervalo [min, max] do índice cruza [inicio, fim]"""
+        with self._lock:
+            self._recarregar_indice_particoes()
+            return [
+                chave for chave, p in sorted(self._particoes.items())
+                if p['linhas'] and p['min'] <= fim and p['max'] >= inicio
+            ]
+    
+    def _abrir_particao(self, chave):
+        """
+        Abre uma partição para leitura; se o arquivo sumiu (arquivado por outro
+        processo depois da última leitura do índice), relê o índice e tenta de novo
+        """
+        for tentativa in range(2):
+            with self._lock:
+                particao = dict(self._particoes[chave])
+                caminho = self._caminho_particao(chave)
+            try:
+                if caminho.endswith(".gz"):
+                    return gzip.open(caminho, 'rb'), particao
+                return open(caminho, 'rb'), particao
+            except FileNotFoundError:
+                if tentativa:
+                    raise
+                self._recarregar_indice_particoes(forcar=True)
+    
+    def iterar_reconhecimentos(self, data_inicio, data_fim, progresso=None):
+        """
+        Gera os reconhecimentos do período sem carregar o histórico. Apenas as
+        partições que cruzam o período são abertas e, nelas, apenas o trecho que o
+        cobre é lido; progresso(bytes_lidos, total) é chamado durante a leitura.
+        """
+        inicio, fim = self._intervalo(data_inicio, data_fim)
+        
+        with contextlib.ExitStack() as arquivos:
+            # Trecho (arquivo, início, fim) de cada partição a ler; arquivadas são
+            # lidas inteiras. Todas são abertas antes da leitura: uma partição
+            # arquivada por outro processo durante o relatório continua legível
+            trechos = []
+            for chave in self.particoes_do_periodo(inicio, fim):
+                f, particao = self._abrir_particao(chave)
+                arquivos.enter_context(f)
+                if isinstance(f, gzip.GzipFile):
+                    trechos.append((f, 0, particao['bytes']))
+                    continue
+                tamanho = os.fstat(f.fileno()).st_size
+                posicao = 0
+                if particao['min'] < inicio:
+                    posicao = self._buscar_posicao(f, lambda d: d < inicio, tamanho)
+                final = tamanho
+                if particao['max'] > fim:
+                    # Fim aproximado do período, apenas para o progresso
+                    final = min(tamanho, self._buscar_posicao(f, lambda d: d <= fim, tamanho) + 65536)
+                trechos.append((f, posicao, final))
+            
+            total = max(1, sum(final - posicao for _, posicao, final in trechos))
+            lidos = 0
+            proximo_aviso = 0
+            for f, posicao, final in trechos:
+                if isinstance(f, gzip.GzipFile):
+                    lido_no_arquivo = f.fileobj.tell  # Progresso em bytes comprimidos
+                else:
+                    f.seek(posicao)
+                    lido_no_arquivo = f.tell
+                base = lidos
+                for linha in f:
+                    lidos = base + min(lido_no_arquivo() - posicao, final - posicao)
+                    if progresso and lidos >= proximo_aviso:
+                        progresso(min(lidos, total), total)
+                        proximo_aviso = lidos + max(1, total // 100)
+                    try:
+                        r = json.loads(linha)
+                        data_hora = r['data_hora']
+                    except (json.JSONDecodeError, KeyError):
+                        continue
+                    if data_hora > fim:
+                        break
+                    if data_hora >= inicio:
+                        yield r
+                lidos = base + final - posicao
+        if progresso:
+            progresso(total, total)
     
     def gerar_relatorio_periodo(self, data_inicio, data_fim):
         """Gera relatório de reconhecimentos no período especificado"""
-        with open(self.reconhecimentos_file, 'r') as f:
-            reconhecimentos = json.load(f)
-            
-        data_inicio = datetime.strptime(data_inicio, "%Y-%m-%d")
-        data_fim = datetime.strptime(data_fim, "%Y-%m-%d")
-        
-        reconhecimentos_periodo = []
-        for r in reconhecimentos:
-            data_hora = datetime.strptime(r['data_hora'], "%Y-%m-%d %H:%M:%S")
-            if data_inicio <= data_hora <= data_fim:
-                reconhecimentos_periodo.append(r)
-                
-        return reconhecimentos_periodo 
\ No newline at end of file
+        return list(self.iterar_reconhecimentos(data_inicio, data_fim))
+
+def ler_particao(caminho):
+    """Itera sobre os reconhecimentos válidos de uma partição (.jsonl ou .jsonl.gz)"""
+    abrir = gzip.open if caminho.endswith(".gz") else open
+    with abrir(caminho, 'rb') as f:
+        for linha in f:
+            linha = linha.strip()
+            if not linha:
+                continue
+            try:
+                yield json.loads(linha)
+            except json.JSONDecodeError:
+                continue
+
+def iterar_historico(historico_dir):
+    """Itera sobre todas as partições do histórico em ordem cronológica"""
+    if not os.path.isdir(historico_dir):
+        return
+    for nome in sorted(os.listdir(historico_dir)):
+        if nome.endswith(".jsonl") or nome.endswith(".jsonl.gz"):
+            yield from ler_particao(os.path.join(historico_dir, nome))
+
+def main():
+    """Manutenção do histórico particionado"""
+    parser = argparse.ArgumentParser(description="Manutenção do histórico de reconhecimentos")
+    parser.add_argument("--arquivar-ate", metavar="CHAVE",
+                        help="Comprime as partições até a chave informada (ex.: 2024-12)")
+    parser.add_argument("--reconstruir-rollups", action="store_true",
+                        help="Recalcula os agregados a partir do histórico completo")
+    parser.add_argument("--resumo", action="store_true",
+                        help="Exibe os agregados (totais, horários mais movimentados e pessoas)")
+    args = parser.parse_args()
+
+    database = FaceDatabase()
+    try:
+        if args.reconstruir_rollups:
+            print(f"Agregados reconstruídos: {database.reconstruir_rollups()} reconhecimentos")
+        if args.resumo:
+            totais = database.totais_reconhecimentos()
+            print(f"Reconhecimentos: {totais['reconhecimentos']} | Pessoas: {totais['pessoas']}")
+            horas = ", ".join(f"{h:02d}h ({n})" for h, n in database.horarios_movimentados())
+            print(f"Horários mais movimentados: {horas}")
+            for chave in sorted(database.rollups.pessoas, key=int):
+                r = database.resumo_pessoa(int(chave))
+                print(f"{r['nome']}: {r['total']} reconhecimentos, de {r['primeiro']} a {r['ultimo']}, "
+                      f"confiança média {r['confianca']['media']:.2f}")
+        if args.arquivar_ate:
+            arquivadas = database.arquivar_particoes(args.arquivar_ate)
+            print(f"Partições arquivadas: {', '.join(arquivadas) or 'nenhuma'}")
+        for chave, p in sorted(database._particoes.items()):
+            print(f"{p['arquivo']}: {p['linhas']} reconhecimentos ({p['min']} a {p['max']})")
+    finally:
+        database.fechar()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+import os
+import json
+import sqlite3
+import argparse
+import threading
+from datetime import datetime
+import cv2
+from database import iterar_historico
+
+class SQLiteFaceDatabase:
+    """Backend SQLite com a mesma interface de FaceDatabase"""
+
+    def __init__(self, db_file="faces.db", faces_dir="faces"):
+        """Inicializa o banco de dados SQLite"""
+        self.db_file = db_file
+        self.faces_dir = faces_dir
+
+        # Criar diretórios se não existirem
+        os.makedirs(self.faces_dir, exist_ok=True)
+
+        # Conexão única compartilhada entre threads, protegida por lock
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self._faces_carregadas = set()  # (id, face_path) já entregues para treino
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._criar_tabelas()
+
+    def _criar_tabelas(self):
+        """Cria tabelas e índices se não existirem"""
+        with self._lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS pessoas (
+                    id INTEGER PRIMARY KEY,
+                    nome TEXT NOT NULL,
+                    cpf TEXT NOT NULL,
+                    email TEXT,
+                    face_paths TEXT NOT NULL,
+                    data_cadastro TEXT NOT NULL
+                );
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_pessoas_cpf ON pessoas (cpf);
+
+                CREATE TABLE IF NOT EXISTS reconhecimentos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    pessoa_id INTEGER NOT NULL,
+                    nome TEXT,
+                    cpf TEXT,
+                    email TEXT,
+                    confianca REAL,
+                    face_path TEXT,
+                    data_hora TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_reconhecimentos_data_hora
+                    ON reconhecimentos (data_hora);
+                CREATE INDEX IF NOT EXISTS idx_reconhecimentos_pessoa
+                    ON reconhecimentos (pessoa_id, data_hora);
+            """)
+
+            # Colunas dos eventos agrupados (bancos criados antes delas)
+            colunas = {row['name'] for row in self.conn.execute("PRAGMA table_info(reconhecimentos)")}
+            for coluna, tipo in (('ocorrencias', 'INTEGER'), ('inicio', 'TEXT'), ('fim', 'TEXT'), ('camera', 'INTEGER')):
+                if coluna not in colunas:
+                    self.conn.execute(f"ALTER TABLE reconhecimentos ADD COLUMN {coluna} {tipo}")
+
+    @staticmethod
+    def _pessoa_dict(row):
+        """Converte uma linha da tabela pessoas no formato usado pelo sistema"""
+        if row is None:
+            return None
+        pessoa = dict(row)
+        pessoa['face_paths'] = json.loads(pessoa['face_paths'])
+        return pessoa
+
+    def verificar_duplicidade(self, cpf):
+        """Verifica se já existe uma pessoa cadastrada com o CPF informado"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM pessoas WHERE cpf = ?", (cpf,)
+            ).fetchone()
+        return row is not None
+
+    def cadastrar_pessoa(self, nome, cpf, email, face_paths):
+        """Cadastra uma nova pessoa com CPF e e-mail"""
+        data_cadastro = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock, self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO pessoas (nome, cpf, email, face_paths, data_cadastro) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (nome, cpf, email, json.dumps(face_paths), data_cadastro)
+            )
+        return cursor.lastrowid
+
+    def cadastrar_pessoas(self, pessoas):
+        """
+        Cadastra várias pessoas (nome, cpf, email, face_paths) em uma única
+        transação; retorna os IDs na mesma ordem. Nenhuma é gravada se algum
+        CPF já estiver cadastrado ou se repetir na lista.
+        """
+        data_cadastro = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            with self._lock, self.conn:
+                proximo_id = self.conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM pessoas").fetchone()[0]
+                ids = list(range(proximo_id, proximo_id + len(pessoas)))
+                self.conn.executemany(
+                    "INSERT INTO pessoas (id, nome, cpf, email, face_paths, data_cadastro) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(pessoa_id, nome, cpf, email, json.dumps(face_paths), data_cadastro)
+                     for pessoa_id, (nome, cpf, email, face_paths) in zip(ids, pessoas)]
+                )
+        except sqlite3.IntegrityError as e:
+            # Índice único de CPF: a transação inteira é desfeita
+            raise ValueError(f"CPFs já cadastrados ou repetidos: {e}") from e
+        return ids
+
+    def carregar_faces_treinamento(self):
+        """Carrega faces para treinamento do modelo"""
+        self._faces_carregadas = set()
+        return self.carregar_faces_novas()
+
+    def listar_faces_treinamento(self):
+        """Lista (id, face_path, tamanho, mtime_ns) das faces de treino sem decodificá-las"""
+        with self._lock:
+            rows = self.conn.execute("SELECT id, face_paths FROM pessoas").fetchall()
+
+        entradas = []
+        for row in rows:
+            for face_path in json.loads(row['face_paths']):
+                try:
+                    st = os.stat(face_path)
+                except OSError:
+                    continue
+                entradas.append((row['id'], face_path, st.st_size, st.st_mtime_ns))
+        return entradas
+
+    def marcar_faces_carregadas(self, entradas):
+        """Marca faces como já entregues (ex.: modelo carregado de um snapshot)"""
+        self._faces_carregadas = {(e[0], e[1]) for e in entradas}
+
+    def listar_faces_novas(self):
+        """Lista (id, face_path, tamanho, mtime_ns) das faces ainda não entregues e as marca como entregues"""
+        novas = [e for e in self.listar_faces_treinamento() if (e[0], e[1]) not in self._faces_carregadas]
+        self._faces_carregadas.update((e[0], e[1]) for e in novas)
+        return novas
+
+    def carregar_faces_novas(self):
+        """Carrega apenas as faces ainda não entregues por carregar_faces_treinamento/carregar_faces_novas"""
+        with self._lock:
+            rows = self.conn.execute("SELECT id, face_paths FROM pessoas").fetchall()
+
+        faces = []
+        labels = []
+
+        for row in rows:
+            for face_path in json.loads(row['face_paths']):
+                if (row['id'], face_path) in self._faces_carregadas:
+                    continue
+                if os.path.exists(face_path):
+                    face = cv2.imread(face_path, cv2.IMREAD_GRAYSCALE)
+                    if face is not None:
+                        faces.append(face)
+                        labels.append(row['id'])
+                        self._faces_carregadas.add((row['id'], face_path))
+
+        return faces, labels
+
+    def get_pessoa_info(self, pessoa_id):
+        """Retorna informações da pessoa pelo ID"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT * FROM pessoas WHERE id = ?", (pessoa_id,)
+            ).fetchone()
+        return self._pessoa_dict(row)
+
+    def registrar_reconhecimento(self, pessoa_id, confianca, face_path, ocorrencias=1,
+                                 inicio=None, fim=None, camera=None):
+        """Registra um reconhecimento (ou evento agrupado) e retorna os dados da pessoa"""
+        pessoa = self.get_pessoa_info(pessoa_id)
+        if not pessoa:
+            return None
+
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO reconhecimentos "
+                "(pessoa_id, nome, cpf, email, confianca, face_path, data_hora, ocorrencias, inicio, fim, camera) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (pessoa_id, pessoa['nome'], pessoa['cpf'], pessoa['email'],
+                 confianca, face_path, datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                 ocorrencias, inicio, fim or inicio, camera)
+            )
+
+        return pessoa
+
+    def iterar_reconhecimentos(self, data_inicio, data_fim, progresso=None, tamanho_lote=500):
+        """
+        Gera os reconhecimentos do período em lotes, por uma conexão de leitura
+        própria (WAL: não bloqueia as gravações); progresso(linhas, total)
+        """
+        # Valida as datas e converte para o formato armazenado; a comparação
+        # de strings "YYYY-MM-DD HH:MM:SS" respeita a ordem cronológica
+        inicio = datetime.strptime(data_inicio, "%Y-%m-%d").strftime("%Y-%m-%d %H:%M:%S")
+        fim = datetime.strptime(data_fim, "%Y-%m-%d").strftime("%Y-%m-%d %H:%M:%S")
+
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        try:
+            total = conn.execute(
+                "SELECT COUNT(*) FROM reconhecimentos WHERE data_hora BETWEEN ? AND ?",
+                (inicio, fim)
+            ).fetchone()[0]
+            cursor = conn.execute(
+                "SELECT pessoa_id, nome, cpf, email, confianca, face_path, data_hora, "
+                "ocorrencias, inicio, fim, camera "
+                "FROM reconhecimentos WHERE data_hora BETWEEN ? AND ? "
+                "ORDER BY data_hora, id",
+                (inicio, fim)
+            )
+            lidos = 0
+            while True:
+                rows = cursor.fetchmany(tamanho_lote)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+                lidos += len(rows)
+                if progresso:
+                    progresso(lidos, total)
+            if progresso and lidos != total:
+                progresso(total, total)
+        finally:
+            conn.close()
+
+    def gerar_relatorio_periodo(self, data_inicio, data_fim):
+        """Gera relatório de reconhecimentos no período especificado"""
+        return list(self.iterar_reconhecimentos(data_inicio, data_fim))
+
+    def sincronizar(self):
+        """Grava um checkpoint do WAL no arquivo principal"""
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def fechar(self):
+        """Fecha a conexão com o banco"""
+        with self._lock:
+            self.conn.close()
+
+    def importar_json(self, pessoas_file="pessoas.json", reconhecimentos_file="reconhecimentos.json",
+                      tamanho_lote=10000, historico_dir=None):
+        """
+        Importa pessoas e reconhecimentos dos arquivos JSON/JSONL e das partições
+        do histórico (padrão: "historico" ao lado de reconhecimentos_file) em uma
+        única transação
+        """
+        reconhecimentos_log = os.path.splitext(reconhecimentos_file)[0] + ".jsonl"
+        if historico_dir is None:
+            historico_dir = os.path.join(os.path.dirname(reconhecimentos_file), "historico")
+
+        with open(pessoas_file, 'r') as f:
+            pessoas = json.load(f)
+
+        def iterar_reconhecimentos():
+            if os.path.exists(reconhecimentos_file):
+                with open(reconhecimentos_file, 'r') as f:
+                    yield from json.load(f)
+            if os.path.exists(reconhecimentos_log):
+                with open(reconhecimentos_log, 'r', encoding='utf-8') as f:
+                    for linha in f:
+                        try:
+                            yield json.loads(linha)
+                        except json.JSONDecodeError:
+                            continue
+            yield from iterar_historico(historico_dir)
+
+        total_pessoas = 0
+        total_reconhecimentos = 0
+        with self._lock, self.conn:
+            ja_importado = self.conn.execute(
+                "SELECT 1 FROM reconhecimentos LIMIT 1"
+            ).fetchone() is not None
+
+            for p in pessoas:
+                cursor = self.conn.execute(
+                    "INSERT OR IGNORE INTO pessoas "
+                    "(id, nome, cpf, email, face_paths, data_cadastro) VALUES (?, ?, ?, ?, ?, ?)",
+                    (p['id'], p['nome'], p['cpf'], p['email'],
+                     json.dumps(p['face_paths']), p['data_cadastro'])
+                )
+                total_pessoas += cursor.rowcount
+
+            # Insere em lotes para não manter o histórico inteiro em memória
+            if ja_importado:
+                print("Histórico de reconhecimentos já importado; apenas pessoas foram atualizadas")
+            lote = []
+            for r in ([] if ja_importado else iterar_reconhecimentos()):
+                lote.append((r['pessoa_id'], r['nome'], r['cpf'], r['email'],
+                             r['confianca'], r['face_path'], r['data_hora'],
+                             r.get('ocorrencias', 1), r.get('inicio'), r.get('fim'), r.get('camera')))
+                if len(lote) >= tamanho_lote:
+                    self.conn.executemany(
+                        "INSERT INTO reconhecimentos "
+                        "(pessoa_id, nome, cpf, email, confianca, face_path, data_hora, ocorrencias, inicio, fim, camera) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", lote
+                    )
+                    total_reconhecimentos += len(lote)
+                    lote = []
+            if lote:
+                self.conn.executemany(
+                    "INSERT INTO reconhecimentos "
+                    "(pessoa_id, nome, cpf, email, confianca, face_path, data_hora, ocorrencias, inicio, fim, camera) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", lote
+                )
+                total_reconhecimentos += len(lote)
+
+        print(f"Importação concluída: {total_pessoas} pessoas, "
+              f"{total_reconhecimentos} reconhecimentos")
+        return total_pessoas, total_reconhecimentos
+
+def main():
+    """Importa os arquivos JSON para o banco SQLite"""
+    parser = argparse.ArgumentParser(description="Importa pessoas.json/reconhecimentos.json para SQLite")
+    parser.add_argument("--db", default="faces.db", help="Arquivo do banco SQLite")
+    parser.add_argument("--pessoas", default="pessoas.json", help="Arquivo de pessoas")
+    parser.add_argument("--reconhecimentos", default="reconhecimentos.json",
+                        help="Arquivo de reconhecimentos (o log .jsonl correspondente também é lido)")
+    args = parser.parse_args()
+
+    database = SQLiteFaceDatabase(args.db)
+    database.importar_json(args.pessoas, args.reconhecimentos)
+    database.fechar()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import time
+from datetime import datetime
+
+class RecognitionCoalescer:
+    """
+    Agrupa reconhecimentos repetidos da mesma pessoa na mesma câmera em um
+    único evento. Cada evento fica aberto enquanto novas detecções chegarem
+    com intervalo menor que janela segundos (ou até duracao_maxima) e, ao
+    fechar, carrega o número de ocorrências, a maior confiança e o período.
+    """
+
+    def __init__(self, janela=10.0, duracao_maxima=300.0):
+        """
+        janela: segundos sem nova detecção da pessoa após os quais o evento é fechado.
+        duracao_maxima: uma pessoa parada diante da câmera gera um evento a cada
+            duracao_maxima segundos.
+        """
+        self.janela = janela
+        self.duracao_maxima = duracao_maxima
+        self._abertos = {}  # (pessoa_id, camera) -> evento em formação
+
+        # Contadores
+        self.recebidos = 0
+        self.emitidos = 0
+
+    def adicionar(self, deteccao, camera=None, agora=None):
+        """Incorpora uma detecção reconhecida (dict com 'pessoa_id' e 'confianca')"""
+        agora = time.monotonic() if agora is None else agora
+        momento = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        chave = (deteccao['pessoa_id'], camera)
+        self.recebidos += 1
+
+        aberto = self._abertos.get(chave)
+        if aberto is None:
+            self._abertos[chave] = {
+                'evento': dict(deteccao, ocorrencias=1, inicio=momento, fim=momento, camera=camera),
+                'aberto_em': agora,
+                'ultimo': agora
+            }
+            return
+
+        evento = aberto['evento']
+        if deteccao['confianca'] > evento['confianca']:
+            # A detecção de maior confiança representa o evento
+            evento.update(deteccao)
+        evento['ocorrencias'] += 1
+        evento['fim'] = momento
+        aberto['ultimo'] = agora
+
+    def vencidos(self, agora=None):
+        """Fecha e retorna os eventos cuja janela terminou"""
+        agora = time.monotonic() if agora is None else agora
+        fechados = [
+            chave for chave, aberto in self._abertos.items()
+            if agora - aberto['ultimo'] >= self.janela or agora - aberto['aberto_em'] >= self.duracao_maxima
+        ]
+        return [self._fechar(chave) for chave in fechados]
+
+    def encerrar(self):
+        """Fecha e retorna todos os eventos abertos (fim do monitoramento)"""
+        return [self._fechar(chave) for chave in list(self._abertos)]
+
+    def _fechar(self, chave):
+        self.emitidos += 1
+        return self._abertos.pop(chave)['evento']
+
+    def __len__(self):
+        return len(self._abertos)
+
+    def stats(self):
+        """Detecções recebidas, eventos emitidos e fator de redução"""
+        return {
+            'deteccoes': self.recebidos,
+            'eventos': self.emitidos,
+            'abertos': len(self._abertos),
+            'reducao': self.recebidos / self.emitidos if self.emitidos else 0.0
+        }
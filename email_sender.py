@@ -1,63 +1,377 @@
+import os
+import json
+import time
+import uuid
+import random
 import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 
 class EmailSender:
-    def __init__(self, smtp_server, smtp_port, email, password):
+    def __init__(self, smtp_server, smtp_port, email, password, usar_tls=True, timeout=30):
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
         self.email = email
         self.password = password
+        self.usar_tls = usar_tls  # False para servidores locais de teste (sem STARTTLS/login)
+        self.timeout = timeout
 
-    def enviar_email_reconhecimento(self, destinatario, nome, confianca, tipo="cadastro"):
-        """Envia e-mail de notificação"""
-        try:
-            # Criar mensagem
-            msg = MIMEMultipart()
-            msg['From'] = self.email
-            msg['To'] = destinatario
-            
-            if tipo == "cadastro":
-                msg['Subject'] = "Cadastro no Sistema de Reconhecimento Facial"
-                corpo = f"""
+    def montar_mensagem(self, destinatario, nome, confianca, tipo="cadastro", data_hora=None):
+        """Monta a mensagem de notificação (data_hora: momento do evento, padrão agora)"""
+        data_hora = data_hora or datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+
+        # Criar mensagem
+        msg = MIMEMultipart()
+        msg['From'] = self.email
+        msg['To'] = destinatario
+
+        if tipo == "cadastro":
+            msg['Subject'] = "Cadastro no Sistema de Reconhecimento Facial"
+            corpo = f"""
                 Olá {nome},
 
                 Seu cadastro no sistema de reconhecimento facial foi realizado com sucesso!
 
                 Detalhes do cadastro:
-                - Data/Hora: {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}
+                - Data/Hora: {data_hora}
                 - Status: Cadastro concluído
 
                 Este é um e-mail automático, por favor não responda.
                 """
-            else:
-                msg['Subject'] = "Reconhecimento Facial - Sistema de Monitoramento"
-                corpo = f"""
+        else:
+            msg['Subject'] = "Reconhecimento Facial - Sistema de Monitoramento"
+            corpo = f"""
                 Olá {nome},
 
                 Você foi reconhecido pelo sistema de monitoramento facial.
 
                 Detalhes do reconhecimento:
-                - Data/Hora: {datetime.now().strftime("%d/%m/%Y %H:%M:%S")}
+                - Data/Hora: {data_hora}
                 - Nível de confiança: {confianca:.2f}%
 
                 Este é um e-mail automático, por favor não responda.
                 """
-            
-            msg.attach(MIMEText(corpo, 'plain'))
 
-            # Enviar e-mail
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.ehlo()  # Identifica-se com o servidor
+        msg.attach(MIMEText(corpo, 'plain'))
+        return msg
+
+    def conectar(self):
+        """Abre uma sessão SMTP autenticada, reutilizável para várias mensagens"""
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        try:
+            server.ehlo()  # Identifica-se com o servidor
+            if self.usar_tls:
                 server.starttls()  # Inicia conexão segura
                 server.ehlo()  # Identifica-se novamente após TLS
                 server.login(self.email, self.password)
+        except Exception:
+            server.close()
+            raise
+        return server
+
+    def enviar_email_reconhecimento(self, destinatario, nome, confianca, tipo="cadastro"):
+        """Envia e-mail de notificação"""
+        try:
+            msg = self.montar_mensagem(destinatario, nome, confianca, tipo)
+
+            # Enviar e-mail
+            with self.conectar() as server:
                 server.send_message(msg)
-                
+
             print(f"E-mail enviado com sucesso para {destinatario}")
             return True
-            
+
         except Exception as e:
             print(f"Erro ao enviar e-mail: {e}")
-            return False 
\ No newline at end of file
+            return False
+
+class EmailQueue:
+    """
+    Fila assíncrona de notificações. Cada mensagem é gravada em um arquivo da
+    caixa de saída antes de enviar() retornar e só é removida depois de aceita
+    pelo servidor, então nada se perde entre reinicializações. Uma thread envia
+    em lotes por uma sessão SMTP persistente, respeitando um limite de mensagens
+    por minuto, e reagenda falhas com backoff exponencial.
+    """
+
+    def __init__(self, sender, outbox_dir="outbox", tamanho_lote=20, max_por_minuto=30,
+                 max_tentativas=6, backoff_inicial=5.0, backoff_maximo=600.0, sessao_ociosa=60.0):
+        """
+        sender: EmailSender usado para montar as mensagens e abrir a sessão.
+        sessao_ociosa: segundos sem envio após os quais a sessão SMTP é fechada.
+        Mensagens que esgotam max_tentativas vão para outbox_dir/falhas.
+        """
+        self.sender = sender
+        self.outbox_dir = outbox_dir
+        self.falhas_dir = os.path.join(outbox_dir, "falhas")
+        self.tamanho_lote = tamanho_lote
+        self.max_por_minuto = max_por_minuto
+        self.max_tentativas = max_tentativas
+        self.backoff_inicial = backoff_inicial
+        self.backoff_maximo = backoff_maximo
+        self.sessao_ociosa = sessao_ociosa
+
+        os.makedirs(self.falhas_dir, exist_ok=True)
+
+        self._cond = threading.Condition()
+        self._pendentes = {}  # id -> registro (também gravado em outbox_dir/<id>.json)
+        self._stop = False
+        self._thread = None
+        self._sessao = None
+        self._ultimo_uso = 0.0
+        self._envios = []  # Horários dos envios no último minuto (limite de taxa)
+        self._pausa_ate = 0.0  # Backoff da fila inteira após falha de conexão
+        self._falhas_conexao = 0
+
+        # Contadores
+        self.enviados = 0
+        self.descartados = 0
+
+        self._carregar_outbox()
+
+    def _caminho(self, msg_id):
+        return os.path.join(self.outbox_dir, f"{msg_id}.json")
+
+    def _gravar(self, registro):
+        """Grava o registro de forma atômica e durável"""
+        caminho = self._caminho(registro['id'])
+        temp = caminho + ".tmp"
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(registro, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, caminho)
+
+    def _carregar_outbox(self):
+        """Recupera as mensagens que ficaram na caixa de saída"""
+        for nome in sorted(os.listdir(self.outbox_dir)):
+            caminho = os.path.join(self.outbox_dir, nome)
+            if nome.endswith(".tmp"):
+                os.remove(caminho)  # Gravação interrompida: enviar() não chegou a retornar
+                continue
+            if not nome.endswith(".json"):
+                continue
+            try:
+                with open(caminho, 'r', encoding='utf-8') as f:
+                    registro = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                print(f"Mensagem ilegível na caixa de saída ({nome}): {e}")
+                continue
+            registro['proxima_tentativa'] = 0.0  # Horário monotônico de outra execução
+            self._pendentes[registro['id']] = registro
+        if self._pendentes:
+            print(f"{len(self._pendentes)} e-mails pendentes recuperados da caixa de saída")
+
+    def enviar(self, destinatario, nome, confianca, tipo="cadastro"):
+        """Enfileira uma notificação e retorna imediatamente o id da mensagem"""
+        agora = datetime.now()
+        registro = {
+            # Prefixo com a data mantém a ordem de chegada entre reinicializações
+            'id': f"{agora.strftime('%Y%m%d%H%M%S%f')}_{uuid.uuid4().hex[:8]}",
+            'destinatario': destinatario,
+            'nome': nome,
+            'confianca': confianca,
+            'tipo': tipo,
+            'data_hora': agora.strftime("%d/%m/%Y %H:%M:%S"),
+            'tentativas': 0,
+            'proxima_tentativa': 0.0,
+            'ultimo_erro': None
+        }
+        self._gravar(registro)
+        with self._cond:
+            self._pendentes[registro['id']] = registro
+            self._cond.notify()
+        return registro['id']
+
+    def pendentes(self):
+        """Número de mensagens ainda não enviadas"""
+        with self._cond:
+            return len(self._pendentes)
+
+    def start(self):
+        """Inicia a thread de envio"""
+        with self._cond:
+            self._stop = False
+        self._thread = threading.Thread(target=self._executar, name="email", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=10.0):
+        """
+        Tenta enviar o que está pronto até o timeout e encerra a thread; o que
+        sobrar continua na caixa de saída para a próxima execução
+        """
+        limite = time.monotonic() + timeout
+        with self._cond:
+            while self._pendentes and time.monotonic() < limite and self._thread is not None:
+                prontas = any(r['proxima_tentativa'] <= time.monotonic() for r in self._pendentes.values())
+                if not prontas or self._pausa_ate > time.monotonic():
+                    break
+                self._cond.wait(0.1)
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(max(0.1, limite - time.monotonic()))
+            self._thread = None
+        self._fechar_sessao()
+
+    def wait(self, timeout=None):
+        """Aguarda a fila esvaziar; retorna True se esvaziou"""
+        limite = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pendentes:
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    return False
+                self._cond.wait(0.1 if restante is None else min(0.1, restante))
+            return True
+
+    def _proximo_lote(self):
+        """Mensagens prontas para envio, da mais antiga para a mais nova"""
+        agora = time.monotonic()
+        prontas = [r for r in self._pendentes.values() if r['proxima_tentativa'] <= agora]
+        prontas.sort(key=lambda r: r['id'])
+        return prontas[:self.tamanho_lote]
+
+    def _espera(self):
+        """Segundos até a próxima mensagem ficar pronta (None se não houver)"""
+        if not self._pendentes:
+            return None
+        agora = time.monotonic()
+        proxima = min(r['proxima_tentativa'] for r in self._pendentes.values())
+        return max(0.0, max(proxima, self._pausa_ate) - agora)
+
+    def _aguardar_taxa(self):
+        """Limite de taxa: no máximo max_por_minuto envios em qualquer janela de 60 s"""
+        while True:
+            agora = time.monotonic()
+            self._envios = [t for t in self._envios if agora - t < 60.0]
+            if len(self._envios) < self.max_por_minuto:
+                self._envios.append(agora)
+                return True
+            with self._cond:
+                if self._stop:
+                    return False
+                self._cond.wait(60.0 - (agora - self._envios[0]))
+
+    def _executar(self):
+        """Laço da thread de envio"""
+        while True:
+            ociosa = False
+            with self._cond:
+                while not self._stop:
+                    espera = self._espera()
+                    if espera is not None and espera <= 0:
+                        break
+                    # Sessão ociosa é fechada em vez de ficar presa até o servidor derrubá-la
+                    if self._sessao is not None and time.monotonic() - self._ultimo_uso > self.sessao_ociosa:
+                        ociosa = True
+                        break
+                    self._cond.wait(self.sessao_ociosa if espera is None else min(espera, self.sessao_ociosa))
+                if self._stop:
+                    return
+                lote = [] if ociosa else self._proximo_lote()
+
+            if ociosa:
+                self._fechar_sessao()
+            else:
+                self._enviar_lote(lote)
+
+    def _enviar_lote(self, lote):
+        """Envia um lote pela sessão persistente, reconectando quando necessário"""
+        for registro in lote:
+            if not self._aguardar_taxa():
+                return
+            try:
+                sessao = self._obter_sessao()
+            except Exception as e:
+                # Falha de conexão/login: a fila inteira espera antes de tentar de novo
+                self._falhas_conexao += 1
+                atraso = self._backoff(self._falhas_conexao)
+                print(f"Erro ao conectar ao servidor SMTP: {e} (nova tentativa em {atraso:.0f} s)")
+                with self._cond:
+                    self._pausa_ate = time.monotonic() + atraso
+                return
+
+            try:
+                msg = self.sender.montar_mensagem(
+                    registro['destinatario'], registro['nome'], registro['confianca'],
+                    registro['tipo'], registro['data_hora']
+                )
+                sessao.send_message(msg)
+            except smtplib.SMTPServerDisconnected as e:
+                # Sessão derrubada pelo servidor: reconecta no próximo envio. Conta como
+                # tentativa (com backoff) para que um servidor que sempre derruba a sessão
+                # não prenda a fila na mesma mensagem
+                self._fechar_sessao()
+                self._falhou(registro, e)
+                continue
+            except Exception as e:
+                # Destinatário recusado ou erro 5xx: repetir não adianta
+                permanente = isinstance(e, smtplib.SMTPRecipientsRefused) or (
+                    isinstance(e, smtplib.SMTPResponseException) and e.smtp_code >= 500
+                )
+                self._falhou(registro, e, permanente)
+                if not isinstance(e, smtplib.SMTPException):
+                    # Erro de rede: a sessão não é mais confiável
+                    self._fechar_sessao()
+                continue
+
+            self._ultimo_uso = time.monotonic()
+            self._falhas_conexao = 0
+            self._concluir(registro)
+
+    def _obter_sessao(self):
+        """Sessão SMTP atual ou uma nova conexão"""
+        if self._sessao is None:
+            self._sessao = self.sender.conectar()
+            self._ultimo_uso = time.monotonic()
+        return self._sessao
+
+    def _fechar_sessao(self):
+        if self._sessao is not None:
+            try:
+                self._sessao.quit()
+            except Exception:
+                self._sessao.close()
+            self._sessao = None
+
+    def _backoff(self, tentativas):
+        """Atraso exponencial com jitter para a tentativa informada"""
+        atraso = min(self.backoff_maximo, self.backoff_inicial * 2 ** (tentativas - 1))
+        return atraso * random.uniform(0.8, 1.2)
+
+    def _concluir(self, registro):
+        """Remove a mensagem enviada da fila e da caixa de saída"""
+        try:
+            os.remove(self._caminho(registro['id']))
+        except FileNotFoundError:
+            pass
+        with self._cond:
+            self._pendentes.pop(registro['id'], None)
+            self.enviados += 1
+            self._cond.notify_all()
+        print(f"E-mail enviado com sucesso para {registro['destinatario']}")
+
+    def _falhou(self, registro, erro, permanente=False):
+        """Reagenda a mensagem com backoff ou a move para falhas/ (erro permanente ou max_tentativas)"""
+        registro['tentativas'] += 1
+        registro['ultimo_erro'] = str(erro)
+        if permanente or registro['tentativas'] >= self.max_tentativas:
+            print(f"Erro ao enviar e-mail para {registro['destinatario']}: {erro} "
+                  f"(desistindo após {registro['tentativas']} tentativas)")
+            self._gravar(registro)
+            os.replace(self._caminho(registro['id']), os.path.join(self.falhas_dir, f"{registro['id']}.json"))
+            with self._cond:
+                self._pendentes.pop(registro['id'], None)
+                self.descartados += 1
+                self._cond.notify_all()
+            return
+
+        atraso = self._backoff(registro['tentativas'])
+        print(f"Erro ao enviar e-mail para {registro['destinatario']}: {erro} "
+              f"(nova tentativa em {atraso:.0f} s)")
+        self._gravar(registro)
+        with self._cond:
+            registro['proxima_tentativa'] = time.monotonic() + atraso
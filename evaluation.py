@@ -5,7 +5,7 @@ def run_tests(scenarios, model, preprocess_fn, csv_path="resultados.csv"):
     """
     Executa testes em múltiplos cenários, mede métricas e salva resultados em um CSV.
     scenarios: lista de dicionários com chaves 'images', 'labels', 'nome'.
-    model: instância do modelo com método predict().
+    model: instância do modelo com método predict_batch().
     preprocess_fn: função para pré-processar as imagens.
     csv_path: caminho do arquivo CSV de saída.
     """
@@ -14,13 +14,10 @@ def run_tests(scenarios, model, preprocess_fn, csv_path="resultados.csv"):
         images = scenario['images']
         labels = scenario['labels']
         nome = scenario.get('nome', 'cenário')
-        y_true = []
-        y_pred = []
-        for img, label in zip(images, labels):
-            img_proc = preprocess_fn(img)
-            pred, _ = model.predict(img_proc)
-            y_true.append(label)
-            y_pred.append(pred)
+        # Predição em lote: o modelo reaproveita o pré-processamento entre as imagens
+        imgs_proc = [preprocess_fn(img) for img in images]
+        y_true = list(labels)
+        y_pred = [pred for pred, _ in model.predict_batch(imgs_proc)]
         acc = accuracy_score(y_true, y_pred)
         prec = precision_score(y_true, y_pred, average='weighted', zero_division=0)
         rec = recall_score(y_true, y_pred, average='weighted', zero_division=0)
@@ -1,12 +1,65 @@
 import cv2
 import numpy as np
+from motion import MotionGate
+
+def non_max_suppression(boxes, limiar=0.5, scores=None):
+    """
+    Supressão de não-máximos vetorizada sobre caixas (x, y, w, h): descarta as
+    caixas cuja interseção com uma caixa de maior score passa de limiar vezes a
+    área da menor das duas. Sem scores, as maiores caixas têm prioridade.
+    Retorna os índices mantidos, em ordem crescente.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if len(boxes) <= 1:
+        return np.arange(len(boxes))
+
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+    prioridade = areas if scores is None else np.asarray(scores, dtype=np.float32)
+    ordem = np.argsort(-prioridade, kind='stable')
+
+    mantidas = []
+    while ordem.size:
+        i, resto = ordem[0], ordem[1:]
+        mantidas.append(i)
+        inter_w = np.clip(np.minimum(x2[i], x2[resto]) - np.maximum(x1[i], x1[resto]), 0, None)
+        inter_h = np.clip(np.minimum(y2[i], y2[resto]) - np.maximum(y1[i], y1[resto]), 0, None)
+        ordem = resto[inter_w * inter_h <= limiar * np.minimum(areas[i], areas[resto])]
+    return np.sort(np.array(mantidas, dtype=np.intp))
 
 class FaceDetector:
-    def __init__(self):
+    """
+    Motor de detecção de faces compartilhado por cadastro e monitoramento.
+    A imagem é reduzida para a menor resolução em que a menor face esperada
+    ainda ocupa janela_minima pixels, e o cascade só procura faces entre
+    min_face_size e max_face_size (os limites do FaceQualityChecker).
+    """
+    
+    def __init__(self, min_face_size=100, max_face_size=400, scale_factor=1.3, min_neighbors=5,
+                 escala=None, janela_minima=48, nms_limiar=0.5, usar_movimento=False):
+        """
+        min_face_size/max_face_size: tamanho das faces procuradas, em pixels do frame.
+        escala: redução aplicada antes da detecção; None calcula a partir de min_face_size.
+        janela_minima: lado, na imagem reduzida, da menor face procurada (a janela
+            base do Haar cascade tem 24 pixels).
+        """
         # Carrega o classificador Haar Cascade para detecção facial
         self.face_cascade = cv2.CascadeClassifier(
             cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
         )
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.nms_limiar = nms_limiar
+        self.escala = escala if escala is not None else min(1.0, janela_minima / float(min_face_size))
+        
+        # Limites de tamanho na imagem reduzida
+        self.min_size = max(24, int(min_face_size * self.escala))
+        self.max_size = max(self.min_size, int(np.ceil(max_face_size * self.escala)))
+        
+        # Filtro de movimento: frames estáticos sem faces não passam pelo detector
+        # (as regiões precisam comportar a menor face procurada)
+        self.motion_gate = MotionGate(tamanho_minimo=int(1.2 * self.min_size)) if usar_movimento else None
         self.last_frame = None
         self.last_faces = []
     
@@ -14,54 +67,49 @@ class FaceDetector:
         """
         Detecta faces em um frame e retorna uma lista de regiões (x, y, w, h)
         """
-        # Reduz o tamanho do frame para melhor performance
-        small_frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-        gray = cv2.cvtColor(small_frame, cv2.COLOR_BGR2GRAY)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = self.detect_gray(gray)
         
-        # Otimizações para detecção mais rápida
-        faces = self.face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=3,  # Reduzido para detecção mais rápida
-            minSize=(30, 30),
-            flags=cv2.CASCADE_SCALE_IMAGE
-        )
+        self.last_frame = frame
+        self.last_faces = faces
+        return faces
+    
+    def detect_gray(self, gray):
+        """Detecta faces em uma imagem em escala de cinza; coordenadas na resolução original"""
+        # Reduz o frame para a resolução necessária para as faces procuradas
+        if self.escala < 1.0:
+            small = cv2.resize(gray, None, fx=self.escala, fy=self.escala, interpolation=cv2.INTER_AREA)
+        else:
+            small = gray
+        
+        if self.motion_gate is not None:
+            faces = self.motion_gate.detectar(self._detect, small)
+        else:
+            faces = self._detect(small)
         
         # Ajusta as coordenadas para o tamanho original
-        faces = [(x*2, y*2, w*2, h*2) for (x, y, w, h) in faces]
+        faces = np.asarray(faces, dtype=np.float32).reshape(-1, 4)
+        if self.escala != 1.0:
+            faces = faces / self.escala
+        faces = np.round(faces).astype(int)
         
         # Filtra faces muito próximas
-        faces = self._filter_overlapping_faces(faces)
-        
-        self.last_frame = frame
-        self.last_faces = faces
-        return faces
+        return [tuple(int(v) for v in f) for f in faces[non_max_suppression(faces, self.nms_limiar)]]
+    
+    def _detect(self, gray):
+        """Roda o Haar cascade em uma imagem (ou região) em escala de cinza"""
+        return self.face_cascade.detectMultiScale(
+            gray,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=(self.min_size, self.min_size),
+            maxSize=(self.max_size, self.max_size),
+            flags=cv2.CASCADE_SCALE_IMAGE
+        )
     
     def _filter_overlapping_faces(self, faces):
         """Remove detecções redundantes de faces"""
-        if len(faces) <= 1:
-            return faces
-            
-        filtered = []
-        for i, (x1, y1, w1, h1) in enumerate(faces):
-            keep = True
-            for j, (x2, y2, w2, h2) in enumerate(faces):
-                if i != j:
-                    # Calcula a interseção
-                    x_overlap = max(0, min(x1 + w1, x2 + w2) - max(x1, x2))
-                    y_overlap = max(0, min(y1 + h1, y2 + h2) - max(y1, y2))
-                    overlap_area = x_overlap * y_overlap
-                    
-                    # Se a interseção for maior que 50% da área menor, remove uma
-                    if overlap_area > 0.5 * min(w1*h1, w2*h2):
-                        if w1*h1 < w2*h2:
-                            keep = False
-                            break
-            
-            if keep:
-                filtered.append((x1, y1, w1, h1))
-        
-        return filtered
+        return [faces[i] for i in non_max_suppression(faces, self.nms_limiar)]
     
     def extract_face(self, frame, face_region, size=(100, 100)):
         """
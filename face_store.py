@@ -0,0 +1,193 @@
+import os
+import json
+import hashlib
+import cv2
+import numpy as np
+
+_MAGICO = b"FACEPACK"
+_VERSAO = 1
+_CABECALHO = 64  # Mágico, versão, altura, largura e hash dos parâmetros do modelo
+
+class FaceStore:
+    """
+    Arquivo único com as faces de treino já normalizadas e pré-processadas.
+    Cada registro tem tamanho fixo: label, tamanho e mtime da imagem de origem,
+    SHA-256 do conteúdo dela, chave do caminho e os pixels da face. A carga é
+    uma leitura sequencial; apenas imagens novas ou alteradas são decodificadas
+    e pré-processadas, e o resultado é acrescentado ao fim do arquivo.
+    """
+
+    def __init__(self, path="modelos/faces.pack", compactar_acima=0.5):
+        """compactar_acima: fração de registros obsoletos que dispara a compactação"""
+        self.path = path
+        self.compactar_acima = compactar_acima
+
+        # Contadores da última carga
+        self.reutilizadas = 0
+        self.processadas = 0
+
+    @staticmethod
+    def _chave(face_path):
+        return np.frombuffer(hashlib.blake2b(face_path.encode('utf-8'), digest_size=16).digest(), np.uint8)
+
+    @staticmethod
+    def _checksum(face_path):
+        with open(face_path, 'rb') as f:
+            return np.frombuffer(hashlib.sha256(f.read()).digest(), np.uint8)
+
+    @staticmethod
+    def _tipo(face_size):
+        largura, altura = face_size
+        return np.dtype([
+            ('label', '<i8'),
+            ('tamanho', '<i8'),
+            ('mtime_ns', '<i8'),
+            ('sha256', 'u1', (32,)),
+            ('chave', 'u1', (16,)),
+            ('face', 'u1', (altura, largura))
+        ])
+
+    @staticmethod
+    def _assinatura(model):
+        """Hash dos parâmetros que determinam o pré-processamento gravado"""
+        conteudo = json.dumps(model.parameters(), sort_keys=True).encode('utf-8')
+        return hashlib.sha256(conteudo).digest()
+
+    def _cabecalho(self, model):
+        largura, altura = model.face_size
+        dados = _MAGICO + np.array([_VERSAO, altura, largura], dtype='<u4').tobytes() + self._assinatura(model)
+        return dados.ljust(_CABECALHO, b"\0")
+
+    def _validar(self, model, tipo):
+        """
+        Confere apenas o cabeçalho (sem ler os registros) e descarta um registro
+        incompleto no fim (gravação interrompida). Retorna False se o arquivo
+        não existe ou é de outros parâmetros.
+        """
+        try:
+            with open(self.path, 'rb+') as f:
+                if f.read(_CABECALHO) != self._cabecalho(model):
+                    return False
+                tamanho = os.fstat(f.fileno()).st_size
+                sobra = (tamanho - _CABECALHO) % tipo.itemsize
+                if sobra:
+                    f.truncate(tamanho - sobra)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _ler(self, model, tipo):
+        """Registros gravados, ou None se o arquivo não existe ou é de outros parâmetros"""
+        if not self._validar(model, tipo):
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(_CABECALHO)
+            return np.fromfile(f, dtype=tipo)
+
+    def _processar(self, entradas, model, tipo):
+        """Decodifica e pré-processa as imagens das entradas (label, face_path, tamanho, mtime_ns)"""
+        registros = np.zeros(len(entradas), dtype=tipo)
+        n = 0
+        for label, face_path, tamanho, mtime_ns in entradas:
+            try:
+                checksum = self._checksum(face_path)
+            except OSError:
+                continue
+            face = cv2.imread(face_path, cv2.IMREAD_GRAYSCALE)
+            if face is None:
+                continue
+            r = registros[n]
+            r['label'] = label
+            r['tamanho'] = tamanho
+            r['mtime_ns'] = mtime_ns
+            r['sha256'] = checksum
+            r['chave'] = self._chave(face_path)
+            r['face'] = model._preprocess(face)
+            n += 1
+        self.processadas += n
+        return registros[:n]
+
+    def _gravar(self, model, registros):
+        """Reescreve o arquivo inteiro de forma atômica"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp = self.path + ".tmp"
+        with open(temp, 'wb') as f:
+            f.write(self._cabecalho(model))
+            registros.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+
+    def _acrescentar(self, registros):
+        with open(self.path, 'ab') as f:
+            registros.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def carregar(self, entradas, model):
+        """
+        Retorna (faces, labels) pré-processadas das entradas (label, face_path,
+        tamanho, mtime_ns). Registros com tamanho/mtime diferentes da imagem são
+        reaproveitados se o SHA-256 ainda coincidir; os demais são refeitos.
+        """
+        tipo = self._tipo(model.face_size)
+        registros = self._ler(model, tipo)
+        self.reutilizadas = self.processadas = 0
+
+        if registros is None:
+            # Arquivo inexistente ou de outros parâmetros: reconstrói
+            novos = self._processar(entradas, model, tipo)
+            self._gravar(model, novos)
+            return novos['face'], novos['label'].astype(np.int32)
+
+        # O registro mais recente de cada caminho prevalece
+        indice = {r.tobytes(): i for i, r in enumerate(registros['chave'])}
+        validos = []
+        pendentes = []
+        stat_alterado = False
+        for entrada in entradas:
+            label, face_path, tamanho, mtime_ns = entrada
+            i = indice.get(self._chave(face_path).tobytes())
+            if i is not None and registros['label'][i] == label:
+                r = registros[i]
+                if r['tamanho'] == tamanho and r['mtime_ns'] == mtime_ns:
+                    validos.append(i)
+                    continue
+                try:
+                    mesmo_conteudo = np.array_equal(self._checksum(face_path), r['sha256'])
+                except OSError:
+                    continue
+                if mesmo_conteudo:
+                    # Apenas os metadados mudaram (ex.: cópia/restauração do arquivo)
+                    r['tamanho'] = tamanho
+                    r['mtime_ns'] = mtime_ns
+                    stat_alterado = True
+                    validos.append(i)
+                    continue
+            pendentes.append(entrada)
+
+        self.reutilizadas = len(validos)
+        novos = self._processar(pendentes, model, tipo)
+        mantidos = registros[validos]
+
+        obsoletos = len(registros) - len(validos)
+        if stat_alterado or obsoletos > self.compactar_acima * max(1, len(registros)):
+            self._gravar(model, np.concatenate([mantidos, novos]))
+        elif len(novos):
+            self._acrescentar(novos)
+
+        faces = np.concatenate([mantidos['face'], novos['face']])
+        labels = np.concatenate([mantidos['label'], novos['label']]).astype(np.int32)
+        return faces, labels
+
+    def adicionar(self, entradas, model):
+        """Pré-processa e acrescenta apenas as entradas informadas (cadastro); retorna (faces, labels)"""
+        tipo = self._tipo(model.face_size)
+        # Apenas o cabeçalho é conferido: o custo não cresce com a galeria
+        if not self._validar(model, tipo):
+            self._gravar(model, np.zeros(0, dtype=tipo))
+        self.reutilizadas = self.processadas = 0
+        novos = self._processar(entradas, model, tipo)
+        if len(novos):
+            self._acrescentar(novos)
+        return novos['face'], novos['label'].astype(np.int32)
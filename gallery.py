@@ -0,0 +1,353 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import threading
+import contextlib
+import numpy as np
+from lbph_numpy import NumpyLBPHModel, chi_square_distances
+
+# Tabela de amostras: label e soma do histograma (termo constante do qui-quadrado)
+_AMOSTRA = np.dtype([('label', '<i4'), ('soma', '<f8')])
+
+class MappedGallery:
+    """
+    Galeria de histogramas LBP em arquivos mapeados em memória (np.memmap).
+    Os histogramas ficam em segmentos de tamanho fixo com o mesmo layout
+    transposto (bins, amostras) da galeria em memória; labels e somas ficam em
+    uma tabela à parte. Abrir não lê os dados, vários processos compartilham as
+    páginas pelo cache do sistema e acrescentar amostras apenas estende os
+    arquivos. Uma amostra só passa a existir quando sua linha na tabela é
+    gravada, depois do histograma.
+
+    Os arquivos ficam no diretório da geração atual (g<N>, indicada por
+    geracao.json). Um novo treino grava outra geração e só então troca
+    geracao.json: arquivos mapeados por outros processos nunca são truncados.
+    Escritas são serializadas entre processos por flock no diretório.
+    """
+
+    def __init__(self, directory, histogram_size, segmento=1024, intervalo_verificacao=1.0):
+        """
+        segmento: amostras por segmento (cada linha de um segmento ocupa segmento*4 bytes).
+        intervalo_verificacao: tempo mínimo (s) entre verificações de amostras
+            acrescentadas por outros processos.
+        """
+        self.directory = directory
+        self.histogram_size = histogram_size
+        self.segmento = segmento
+        self.intervalo_verificacao = intervalo_verificacao
+        self._geracao_path = os.path.join(directory, "geracao.json")
+        self._bytes_segmento = histogram_size * segmento * 4
+        self._trava = None  # Descritor do diretório enquanto o flock é mantido
+        self._escrita = threading.RLock()  # O flock é por processo: serializa também as threads
+        self._lock = threading.RLock()  # Troca dos mapas (lidos pelos workers do pipeline)
+        self._construindo = False  # Em reconstruir(): a geração nova ainda não é a publicada
+
+        os.makedirs(directory, exist_ok=True)
+        self._verificar_cabecalho()
+
+        self._histogramas = None  # memmap (segmentos, bins, segmento)
+        self._amostras = None  # memmap da tabela de amostras
+        self._count = 0
+        self._ultima_verificacao = 0.0
+        with self._bloquear():
+            if not os.path.exists(self._geracao_path):
+                self._criar_primeira_geracao()
+        self._usar_geracao(self._ler_geracao())
+        self.mapear()
+
+    def _verificar_cabecalho(self):
+        """Cria ou confere o arquivo com as dimensões da galeria"""
+        caminho = os.path.join(self.directory, "galeria.json")
+        dimensoes = {'histogram_size': self.histogram_size, 'segmento': self.segmento}
+        if os.path.exists(caminho):
+            with open(caminho, 'r') as f:
+                existentes = json.load(f)
+            if existentes != dimensoes:
+                raise ValueError(f"Galeria em {self.directory} tem outras dimensões: {existentes}")
+            return
+        temp = caminho + ".tmp"
+        with open(temp, 'w') as f:
+            json.dump(dimensoes, f)
+        os.replace(temp, caminho)
+
+    @contextlib.contextmanager
+    def _bloquear(self):
+        """flock no diretório da galeria: uma escrita por vez entre processos (reentrante)"""
+        with self._escrita:
+            if self._trava is not None:
+                yield
+                return
+            fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                self._trava = fd
+                yield
+            finally:
+                self._trava = None
+                os.close(fd)
+
+    def _diretorio_geracao(self, geracao):
+        return os.path.join(self.directory, f"g{geracao}")
+
+    def _geracoes(self):
+        """Gerações presentes no diretório (publicadas ou interrompidas)"""
+        return [
+            int(nome[1:]) for nome in os.listdir(self.directory)
+            if nome[:1] == "g" and nome[1:].isdigit()
+        ]
+
+    def _ler_geracao(self):
+        with open(self._geracao_path, 'r') as f:
+            return json.load(f)['geracao']
+
+    def _gravar_geracao(self, geracao):
+        """Publica a geração com uma troca atômica de geracao.json"""
+        temp = self._geracao_path + ".tmp"
+        with open(temp, 'w') as f:
+            json.dump({'geracao': geracao}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self._geracao_path)
+
+    def _criar_primeira_geracao(self):
+        """Cria a geração 1, movendo para ela os arquivos do formato sem gerações"""
+        destino = self._diretorio_geracao(1)
+        os.makedirs(destino, exist_ok=True)
+        for nome in ("histogramas.f32", "amostras.bin"):
+            if os.path.exists(os.path.join(self.directory, nome)):
+                os.replace(os.path.join(self.directory, nome), os.path.join(destino, nome))
+        self._gravar_geracao(1)
+
+    def _usar_geracao(self, geracao):
+        """Passa a mapear os arquivos da geração (os mapas anteriores são descartados)"""
+        with self._lock:
+            self._geracao = geracao
+            self.histogramas_path = os.path.join(self._diretorio_geracao(geracao), "histogramas.f32")
+            self.amostras_path = os.path.join(self._diretorio_geracao(geracao), "amostras.bin")
+            self._histogramas = self._amostras = None
+            self._count = 0
+
+    def _tamanho(self, caminho):
+        try:
+            return os.path.getsize(caminho)
+        except FileNotFoundError:
+            return 0
+
+    def mapear(self):
+        """(Re)mapeia os arquivos se cresceram ou se outra geração foi publicada; retorna o número de amostras"""
+        with self._lock:
+            self._ultima_verificacao = time.monotonic()
+            if not self._construindo:
+                geracao = self._ler_geracao()
+                if geracao != self._geracao:
+                    self._usar_geracao(geracao)
+            segmentos = self._tamanho(self.histogramas_path) // self._bytes_segmento
+            count = min(self._tamanho(self.amostras_path) // _AMOSTRA.itemsize, segmentos * self.segmento)
+
+            # Mapas novos em vez de alterados: quem já obteve um instantâneo segue com o anterior
+            if self._histogramas is None or len(self._histogramas) != segmentos:
+                self._histogramas = np.memmap(
+                    self.histogramas_path, dtype=np.float32, mode='r+',
+                    shape=(segmentos, self.histogram_size, self.segmento)
+                ) if segmentos else None
+            if count != self._count or (count and self._amostras is None):
+                self._amostras = np.memmap(self.amostras_path, dtype=_AMOSTRA, mode='r+', shape=(count,)) if count else None
+            self._count = count
+            return count
+
+    def atualizar(self):
+        """Incorpora amostras acrescentadas por outros processos (no máximo a cada intervalo_verificacao)"""
+        if time.monotonic() - self._ultima_verificacao >= self.intervalo_verificacao:
+            self.mapear()
+
+    def instantaneo(self):
+        """(histogramas, amostras, count) de um mesmo mapeamento, consistentes entre si"""
+        with self._lock:
+            return self._histogramas, self._amostras, self._count
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def labels(self):
+        _, amostras, count = self.instantaneo()
+        if not count:
+            return np.empty(0, dtype=np.int32)
+        return amostras['label']
+
+    @property
+    def histograms(self):
+        """Matriz (amostras, dimensão) dos histogramas (cópia; apenas para inspeção)"""
+        histogramas, _, count = self.instantaneo()
+        if not count:
+            return np.empty((0, self.histogram_size), dtype=np.float32)
+        return np.concatenate([
+            histogramas[k, :, :min(self.segmento, count - k * self.segmento)].T
+            for k in range(-(-count // self.segmento))
+        ])
+
+    @contextlib.contextmanager
+    def reconstruir(self):
+        """
+        Reconstrói a galeria em uma geração nova e vazia: as amostras acrescentadas
+        dentro do bloco vão para ela, publicada ao final. Outros processos seguem
+        lendo a geração anterior até a próxima verificação; suas escritas aguardam.
+        Em caso de erro a geração nova é descartada.
+        """
+        with self._bloquear():
+            anterior = self._ler_geracao()
+            nova = max([anterior] + self._geracoes()) + 1
+            os.makedirs(self._diretorio_geracao(nova))
+            self._usar_geracao(nova)
+            self._construindo = True
+            try:
+                yield
+            except BaseException:
+                self._construindo = False
+                self._usar_geracao(anterior)
+                self.mapear()
+                shutil.rmtree(self._diretorio_geracao(nova), ignore_errors=True)
+                raise
+            self._construindo = False
+            self._gravar_geracao(nova)
+            # A geração anterior fica para quem acabou de ler o ponteiro antigo;
+            # remover as mais antigas é seguro mesmo se mapeadas (não há truncamento)
+            for geracao in self._geracoes():
+                if geracao < anterior or anterior < geracao < nova:
+                    shutil.rmtree(self._diretorio_geracao(geracao), ignore_errors=True)
+            self.mapear()
+
+    def clear(self):
+        """Remove todas as amostras (publica uma geração vazia)"""
+        with self.reconstruir():
+            pass
+
+    def append(self, histograms, labels):
+        """Acrescenta amostras (histograms: (n, dimensão)) ao fim da galeria"""
+        if len(histograms) == 0:
+            return
+        # O início é lido sob o flock: appends concorrentes não se sobrepõem
+        with self._bloquear():
+            self._append(histograms, labels)
+
+    def _append(self, histograms, labels):
+        self.mapear()
+        inicio = self._count
+        fim = inicio + len(histograms)
+
+        # Novos segmentos: o arquivo é estendido (esparso) sem reescrever os existentes
+        segmentos = -(-fim // self.segmento)
+        if self._histogramas is None or len(self._histogramas) < segmentos:
+            with open(self.histogramas_path, 'ab') as f:
+                f.truncate(segmentos * self._bytes_segmento)
+            self.mapear()
+        histogramas, _, _ = self.instantaneo()
+
+        for k in range(inicio // self.segmento, segmentos):
+            a = max(inicio, k * self.segmento)
+            b = min(fim, (k + 1) * self.segmento)
+            base = k * self.segmento
+            histogramas[k, :, a - base:b - base] = histograms[a - inicio:b - inicio].T
+        histogramas.flush()
+
+        amostras = np.empty(len(histograms), dtype=_AMOSTRA)
+        amostras['label'] = labels
+        amostras['soma'] = histograms.sum(axis=1, dtype=np.float64)
+        with open(self.amostras_path, 'r+b' if os.path.exists(self.amostras_path) else 'wb') as f:
+            # Descarta uma linha parcial deixada por uma gravação interrompida
+            f.truncate(inicio * _AMOSTRA.itemsize)
+            f.seek(inicio * _AMOSTRA.itemsize)
+            amostras.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        self.mapear()
+
+    def consultar(self, query, block_bins=256):
+        """
+        Distâncias qui-quadrado da consulta para todas as amostras, segmento a
+        segmento, e os labels dessas amostras, ambos do mesmo instantâneo
+        (outras threads podem remapear a galeria durante o cálculo)
+        """
+        self.atualizar()
+        histogramas, amostras, count = self.instantaneo()
+        distancias = np.empty(count, dtype=np.float64)
+        for k in range(-(-count // self.segmento)):
+            a = k * self.segmento
+            b = min(count, a + self.segmento)
+            distancias[a:b] = chi_square_distances(
+                histogramas[k, :, :b - a], amostras['soma'][a:b], query, block_bins
+            )
+        labels = amostras['label'] if count else np.empty(0, dtype=np.int32)
+        return distancias, labels
+
+    def distances(self, query, block_bins=256):
+        """Distâncias qui-quadrado da consulta para todas as amostras"""
+        return self.consultar(query, block_bins)[0]
+
+class MappedLBPHModel(NumpyLBPHModel):
+    """
+    NumpyLBPHModel com a galeria em arquivos mapeados (MappedGallery), para
+    conjuntos de identidades que não cabem na memória de cada processo
+    """
+
+    def __init__(self, directory="modelos/galeria", block_bins=256, segmento=1024):
+        self.directory = directory
+        self.segmento = segmento
+        super().__init__(block_bins)
+        # O snapshot registra apenas o número de amostras; os dados já estão em directory
+        self.snapshot_file = "galeria_mapeada.json"
+
+    def _create_engine(self):
+        """Abre (sem ler) a galeria mapeada"""
+        self.num_patterns = 2 ** self.neighbors
+        self.histogram_size = self.grid_x * self.grid_y * self.num_patterns
+        self._mapped = MappedGallery(self.directory, self.histogram_size, self.segmento)
+        return None
+
+    @property
+    def histograms(self):
+        return self._mapped.histograms
+
+    @property
+    def labels(self):
+        return self._mapped.labels
+
+    def _append(self, histograms, labels):
+        self._mapped.append(histograms, labels)
+
+    def _train_engine(self, processed_faces, labels):
+        """Treina a galeria do zero em uma nova geração, publicada ao final"""
+        with self._mapped.reconstruir():
+            self._update_engine(processed_faces, labels)
+
+    def _update_engine(self, processed_faces, labels):
+        """Acrescenta os histogramas em lotes de um segmento (memória limitada)"""
+        labels = np.asarray(labels, dtype=np.int32)
+        for inicio in range(0, len(processed_faces), self.segmento):
+            lote = processed_faces[inicio:inicio + self.segmento]
+            histograms = np.vstack([self.extract_histogram(face) for face in lote])
+            self._append(histograms, labels[inicio:inicio + self.segmento])
+
+    def distances(self, histogram):
+        return self._mapped.distances(histogram, self.block_bins)
+
+    def _consultar(self, histogram):
+        # Distâncias e labels do mesmo mapeamento da galeria
+        return self._mapped.consultar(histogram, self.block_bins)
+
+    def sample_count(self):
+        return len(self._mapped)
+
+    def _write_engine(self, path):
+        """Registra quantas amostras da galeria pertencem ao snapshot"""
+        with open(path, 'w') as f:
+            json.dump({'directory': self.directory, 'samples': len(self._mapped)}, f)
+
+    def _read_engine(self, path):
+        """Mapeia a galeria gravada (tempo constante) e confere o número de amostras"""
+        with open(path, 'r') as f:
+            snapshot = json.load(f)
+        if self._mapped.mapear() != snapshot['samples']:
+            raise ValueError("Galeria mapeada não corresponde ao snapshot")
@@ -1,7 +1,106 @@
-class Webcam:
-    def __init__(self, camera_index=0):
+import os
+import time
+
+class FrameSourceEnded(RuntimeError):
+    """A fonte não tem mais frames (fim do vídeo, da pasta ou da sequência)"""
+
+class FrameSource:
+    """
+    Interface comum das fontes de frames.
+    Com tempo_real=True, fontes gravadas respeitam o fps original; com
+    tempo_real=False (modo velocidade máxima) os frames são entregues sem pausa.
+    """
+    live = False  # Fontes ao vivo (câmera, stream) ditam o próprio ritmo
+
+    def __init__(self, fps=None, tempo_real=True):
         import cv2
         self.cv2 = cv2
+        self.fps = fps
+        self.tempo_real = tempo_real
+        self.ended = False
+        self._proximo_frame = None
+
+    def start(self):
+        pass
+
+    def _read(self):
+        """Lê o próximo frame; deve lançar FrameSourceEnded no fim da fonte"""
+        raise NotImplementedError
+
+    def read_frame(self):
+        if self.ended:
+            raise FrameSourceEnded("Fonte de frames encerrada.")
+        try:
+            frame = self._read()
+        except FrameSourceEnded:
+            self.ended = True
+            raise
+        self._pace()
+        return frame
+
+    def read_into(self, out):
+        """Lê o próximo frame diretamente em out (array do mesmo formato do frame)"""
+        if self.ended:
+            raise FrameSourceEnded("Fonte de frames encerrada.")
+        try:
+            self._read_into(out)
+        except FrameSourceEnded:
+            self.ended = True
+            raise
+        self._pace()
+        return out
+
+    def _read_into(self, out):
+        """Implementação padrão: uma cópia; fontes do cv2.VideoCapture decodificam direto em out"""
+        frame = self._read()
+        if frame.shape != out.shape:
+            raise RuntimeError(f"Frame {frame.shape} incompatível com o buffer {out.shape}")
+        out[...] = frame
+
+    def marca_frame(self):
+        """Identifica o último frame entregue, para frame_intacto; None se o frame pertence a quem o leu"""
+        return None
+
+    def frame_intacto(self, marca):
+        """Indica se o frame identificado por marca não foi sobrescrito desde a leitura"""
+        return True
+
+    def read(self):
+        """Interface compatível com cv2.VideoCapture: retorna (ret, frame)"""
+        try:
+            return True, self.read_frame()
+        except RuntimeError as e:
+            if not self.ended:
+                print(f"Erro ao ler frame: {e}")
+            return False, None
+
+    def _pace(self):
+        """Aguarda até o horário do próximo frame (apenas fontes gravadas em tempo real)"""
+        if self.live or not self.tempo_real or not self.fps:
+            return
+        agora = time.monotonic()
+        if self._proximo_frame is None or agora - self._proximo_frame > 1.0:
+            self._proximo_frame = agora
+        elif self._proximo_frame > agora:
+            time.sleep(self._proximo_frame - agora)
+        self._proximo_frame += 1.0 / self.fps
+
+    def release(self):
+        pass
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+        return False
+
+class Webcam(FrameSource):
+    live = True
+
+    def __init__(self, camera_index=0):
+        super().__init__()
         self.camera_index = camera_index
         self.cap = None
 
@@ -10,7 +109,7 @@ class Webcam:
         if not self.cap.isOpened():
             raise RuntimeError(f"Não foi possível abrir a webcam no índice {self.camera_index}")
 
-    def read_frame(self):
+    def _read(self):
         if self.cap is None:
             raise RuntimeError("Webcam não iniciada. Chame start() antes.")
         ret, frame = self.cap.read()
@@ -18,6 +117,174 @@ class Webcam:
             raise RuntimeError("Não foi possível capturar frame da webcam.")
         return frame
 
+    def _read_into(self, out):
+        if self.cap is None:
+            raise RuntimeError("Webcam não iniciada. Chame start() antes.")
+        ret, frame = self.cap.read(out)
+        if not ret:
+            raise RuntimeError("Não foi possível capturar frame da webcam.")
+        if frame is not out:
+            # Formato diferente do buffer: o OpenCV alocou um novo array
+            raise RuntimeError(f"Frame {frame.shape} incompatível com o buffer {out.shape}")
+
     def release(self):
         if self.cap:
-            self.cap.release() 
\ No newline at end of file
+            self.cap.release()
+
+class StreamSource(Webcam):
+    """Stream de rede (RTSP/HTTP) lido pelo cv2.VideoCapture"""
+
+    def __init__(self, url):
+        super().__init__(camera_index=url)
+        self.url = url
+
+    def start(self):
+        self.cap = self.cv2.VideoCapture(self.url)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Não foi possível abrir o stream {self.url}")
+
+class VideoFileSource(FrameSource):
+    """Arquivo de vídeo; com loop=True recomeça do início ao terminar"""
+
+    def __init__(self, path, tempo_real=True, loop=False):
+        super().__init__(tempo_real=tempo_real)
+        self.path = path
+        self.loop = loop
+        self.cap = None
+
+    def start(self):
+        self.cap = self.cv2.VideoCapture(self.path)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Não foi possível abrir o vídeo {self.path}")
+        self.fps = self.cap.get(self.cv2.CAP_PROP_FPS) or 30.0
+
+    def _read(self):
+        if self.cap is None:
+            raise RuntimeError("Vídeo não iniciado. Chame start() antes.")
+        return self._read_cap()
+
+    def _read_into(self, out):
+        if self.cap is None:
+            raise RuntimeError("Vídeo não iniciado. Chame start() antes.")
+        if self._read_cap(out) is not out:
+            raise RuntimeError(f"Frame incompatível com o buffer {out.shape}")
+
+    def _read_cap(self, out=None):
+        """Lê o próximo frame (em out, se informado), recomeçando o vídeo com loop=True"""
+        ret, frame = self.cap.read(out)
+        if not ret and self.loop:
+            self.cap.set(self.cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read(out)
+        if not ret:
+            raise FrameSourceEnded(f"Fim do vídeo {self.path}")
+        return frame
+
+    def release(self):
+        if self.cap:
+            self.cap.release()
+
+class ImageFolderSource(FrameSource):
+    """Imagens de um diretório em ordem alfabética (ex.: reconhecimentos/)"""
+    extensoes = ('.png', '.jpg', '.jpeg', '.bmp')
+
+    def __init__(self, directory, fps=10, tempo_real=True, loop=False):
+        super().__init__(fps=fps, tempo_real=tempo_real)
+        self.directory = directory
+        self.loop = loop
+        self.paths = []
+        self._pos = 0
+
+    def start(self):
+        if not os.path.isdir(self.directory):
+            raise RuntimeError(f"Diretório de imagens não encontrado: {self.directory}")
+        self.paths = sorted(
+            os.path.join(self.directory, nome) for nome in os.listdir(self.directory)
+            if nome.lower().endswith(self.extensoes)
+        )
+        if not self.paths:
+            raise RuntimeError(f"Nenhuma imagem encontrada em {self.directory}")
+        self._pos = 0
+
+    def _read(self):
+        while True:
+            if self._pos >= len(self.paths):
+                if not self.loop or not self.paths:
+                    raise FrameSourceEnded(f"Fim das imagens em {self.directory}")
+                self._pos = 0
+            path = self.paths[self._pos]
+            self._pos += 1
+            frame = self.cv2.imread(path, self.cv2.IMREAD_COLOR)
+            if frame is not None:
+                return frame
+
+class SyntheticSource(FrameSource):
+    """
+    Sequência sintética reprodutível: fundo com ruído e, opcionalmente, faces
+    (imagens em escala de cinza ou BGR) deslizando pelo frame.
+    """
+
+    def __init__(self, width=640, height=480, fps=30, num_frames=None, faces=None,
+                 seed=0, tempo_real=True):
+        super().__init__(fps=fps, tempo_real=tempo_real)
+        self.width = width
+        self.height = height
+        self.num_frames = num_frames
+        self.faces = faces or []
+        self.seed = seed
+        self._index = 0
+        self._rng = None
+        self._fundo = None
+
+    def start(self):
+        import numpy as np
+        self._rng = np.random.default_rng(self.seed)
+        self._fundo = self._rng.integers(90, 140, (self.height, self.width, 3), dtype=np.uint8)
+        self._faces_bgr = [
+            self.cv2.cvtColor(f, self.cv2.COLOR_GRAY2BGR) if f.ndim == 2 else f
+            for f in self.faces
+        ]
+        self._index = 0
+
+    def _read(self):
+        if self._fundo is None:
+            raise RuntimeError("Fonte sintética não iniciada. Chame start() antes.")
+        if self.num_frames is not None and self._index >= self.num_frames:
+            raise FrameSourceEnded("Fim da sequência sintética")
+
+        frame = self._fundo.copy()
+        # Ruído leve para que frames consecutivos nunca sejam idênticos
+        ruido = self._rng.integers(0, 8, (self.height, self.width, 1), dtype=frame.dtype)
+        frame += ruido  # Fundo em [90, 140): a soma não transborda
+
+        for i, face in enumerate(self._faces_bgr):
+            h, w = face.shape[:2]
+            if h > self.height or w > self.width:
+                continue
+            # Movimento horizontal lento, cada face em uma faixa diferente
+            curso = max(1, self.width - w)
+            x = (self._index * 2 + i * curso // max(1, len(self._faces_bgr))) % curso
+            y = min(self.height - h, (i * h) % max(1, self.height - h + 1))
+            frame[y:y + h, x:x + w] = face
+
+        self._index += 1
+        return frame
+
+def open_source(spec, tempo_real=True, loop=False):
+    """
+    Cria a fonte de frames a partir de uma especificação:
+    índice da webcam (0, "1"), URL (rtsp://, http://), diretório de imagens,
+    "sintetico[:N]" (N frames) ou caminho de um arquivo de vídeo.
+    """
+    if isinstance(spec, FrameSource):
+        return spec
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return Webcam(int(spec))
+    if spec.startswith(("rtsp://", "rtmp://", "http://", "https://")):
+        return StreamSource(spec)
+    if spec.split(":")[0] in ("sintetico", "synthetic"):
+        partes = spec.split(":")
+        num_frames = int(partes[1]) if len(partes) > 1 and partes[1] else None
+        return SyntheticSource(num_frames=num_frames, tempo_real=tempo_real)
+    if os.path.isdir(spec):
+        return ImageFolderSource(spec, tempo_real=tempo_real, loop=loop)
+    return VideoFileSource(spec, tempo_real=tempo_real, loop=loop)
@@ -0,0 +1,214 @@
+import sys
+import numpy as np
+from model import LBPHModel
+
+def lbp_image(image, radius=1, neighbors=8):
+    """
+    Calcula os códigos LBP circulares (mesma amostragem bilinear do OpenCV).
+    Retorna uma matriz (altura - 2*radius, largura - 2*radius) de códigos.
+    """
+    src = image.astype(np.float32)
+    rows, cols = src.shape
+    h = rows - 2 * radius
+    w = cols - 2 * radius
+    if h <= 0 or w <= 0:
+        raise ValueError("Imagem menor que o raio do LBP")
+
+    center = src[radius:radius + h, radius:radius + w]
+    codes = np.zeros((h, w), dtype=np.int32)
+    eps = np.finfo(np.float32).eps
+
+    for n in range(neighbors):
+        # Posição do vizinho n no círculo de raio "radius"
+        x = radius * np.cos(2.0 * np.pi * n / neighbors)
+        y = -radius * np.sin(2.0 * np.pi * n / neighbors)
+        fx, fy = int(np.floor(x)), int(np.floor(y))
+        cx, cy = int(np.ceil(x)), int(np.ceil(y))
+        tx, ty = x - fx, y - fy
+        w1 = (1 - tx) * (1 - ty)
+        w2 = tx * (1 - ty)
+        w3 = (1 - tx) * ty
+        w4 = tx * ty
+
+        # Interpolação bilinear sobre fatias deslocadas da imagem inteira
+        t = (w1 * src[radius + fy:radius + fy + h, radius + fx:radius + fx + w] +
+             w2 * src[radius + fy:radius + fy + h, radius + cx:radius + cx + w] +
+             w3 * src[radius + cy:radius + cy + h, radius + fx:radius + fx + w] +
+             w4 * src[radius + cy:radius + cy + h, radius + cx:radius + cx + w])
+
+        bit = (t > center) | (np.abs(t - center) < eps)
+        codes |= bit.astype(np.int32) << n
+
+    return codes
+
+def spatial_histogram(codes, num_patterns, grid_x=8, grid_y=8):
+    """Histogramas normalizados de cada célula da grade, concatenados (float32)"""
+    cell_h = codes.shape[0] // grid_y
+    cell_w = codes.shape[1] // grid_x
+    if cell_h == 0 or cell_w == 0:
+        raise ValueError("Imagem menor que a grade do LBPH")
+
+    # Índice da célula de cada pixel, combinado ao código LBP em um único bincount
+    cropped = codes[:grid_y * cell_h, :grid_x * cell_w]
+    cell_row = np.arange(grid_y * cell_h) // cell_h
+    cell_col = np.arange(grid_x * cell_w) // cell_w
+    cell_index = cell_row[:, None] * grid_x + cell_col[None, :]
+    combined = cell_index * num_patterns + cropped
+
+    hist = np.bincount(combined.ravel(), minlength=grid_x * grid_y * num_patterns)
+    return hist.astype(np.float32) / np.float32(cell_h * cell_w)
+
+def chi_square_distances(gallery_t, gallery_sums, query, block_bins=256):
+    """
+    Distância qui-quadrado (variante alternativa do OpenCV) entre a consulta
+    e todas as amostras da galeria, em forma matricial:
+        2 * sum((g - q)^2 / (g + q)) = 2 * (sum(g) + sum(q) - 4 * sum(g*q / (g + q)))
+    gallery_t é a galeria transposta (bins, amostras). O último termo só é não
+    nulo onde q > 0, então apenas essas linhas (contíguas) da galeria são lidas.
+    """
+    nz = np.flatnonzero(query)
+    cross = np.zeros(gallery_t.shape[1], dtype=np.float64)
+    tiny = np.float32(1e-30)
+    for start in range(0, len(nz), block_bins):
+        bins = nz[start:start + block_bins]
+        q = query[bins, None]
+        g = gallery_t[bins]
+        denom = g + q
+        denom += tiny  # q > 0 nessas linhas, o termo só evita divisões por zero
+        num = g * q
+        num /= denom
+        cross += num.sum(axis=0, dtype=np.float64)
+
+    # Cancelamento numérico pode gerar valores levemente negativos
+    return np.maximum(2.0 * (gallery_sums + float(query.sum()) - 4.0 * cross), 0.0)
+
+class NumpyLBPHModel(LBPHModel):
+    """Motor LBPH vetorizado em NumPy com a mesma interface de LBPHModel"""
+
+    def __init__(self, block_bins=256):
+        self.block_bins = block_bins  # Bins da galeria comparados por bloco (limita a memória)
+        super().__init__()
+        self.snapshot_file = "lbph_numpy.npz"
+
+    def _create_engine(self):
+        """Galeria vazia: histogramas em uma matriz float32 contígua (bins, amostras)"""
+        self.num_patterns = 2 ** self.neighbors
+        self.histogram_size = self.grid_x * self.grid_y * self.num_patterns
+        self._gallery = np.empty((self.histogram_size, 0), dtype=np.float32)
+        self._sums = np.empty(0, dtype=np.float64)
+        self._labels = np.empty(0, dtype=np.int32)
+        self._count = 0
+        return None
+
+    @property
+    def histograms(self):
+        """Matriz (amostras, dimensão) dos histogramas da galeria"""
+        return self._gallery[:, :self._count].T
+
+    @property
+    def labels(self):
+        """Labels das amostras da galeria"""
+        return self._labels[:self._count]
+
+    def extract_histogram(self, enhanced):
+        """Histograma espacial LBP de uma face pré-processada"""
+        codes = lbp_image(enhanced, self.radius, self.neighbors)
+        return spatial_histogram(codes, self.num_patterns, self.grid_x, self.grid_y)
+
+    def _append(self, histograms, labels):
+        """Acrescenta linhas à galeria, dobrando a capacidade quando necessário"""
+        needed = self._count + len(histograms)
+        if needed > self._gallery.shape[1]:
+            capacity = max(needed, 2 * self._gallery.shape[1], 64)
+            grown = np.empty((self.histogram_size, capacity), dtype=np.float32)
+            grown[:, :self._count] = self._gallery[:, :self._count]
+            self._gallery = grown
+            grown_labels = np.empty(capacity, dtype=np.int32)
+            grown_labels[:self._count] = self._labels[:self._count]
+            self._labels = grown_labels
+            grown_sums = np.empty(capacity, dtype=np.float64)
+            grown_sums[:self._count] = self._sums[:self._count]
+            self._sums = grown_sums
+
+        self._gallery[:, self._count:needed] = histograms.T
+        self._labels[self._count:needed] = labels
+        self._sums[self._count:needed] = histograms.sum(axis=1, dtype=np.float64)
+        self._count = needed
+
+    def _train_engine(self, processed_faces, labels):
+        """Treina a galeria do zero"""
+        self._create_engine()
+        self._update_engine(processed_faces, labels)
+
+    def _update_engine(self, processed_faces, labels):
+        """Acrescenta os histogramas das novas faces à galeria"""
+        histograms = np.vstack([self.extract_histogram(face) for face in processed_faces])
+        self._append(histograms, np.asarray(labels, dtype=np.int32))
+
+    def distances(self, histogram):
+        """Distâncias qui-quadrado da consulta para todas as amostras da galeria"""
+        return chi_square_distances(
+            self._gallery[:, :self._count], self._sums[:self._count], histogram, self.block_bins
+        )
+
+    def _consultar(self, histogram):
+        """Distâncias da consulta e labels das mesmas amostras"""
+        return self.distances(histogram), self._labels
+
+    def _match(self, enhanced):
+        """Retorna (label, distância) da amostra mais próxima, respeitando o limiar"""
+        labels, distances = self._rank(*self._consultar(self.extract_histogram(enhanced)), 1)
+        if not len(labels) or distances[0] >= self.threshold:
+            return -1, sys.float_info.max
+        return int(labels[0]), float(distances[0])
+
+    def _rank(self, distances, sample_labels, k):
+        """Top-k identidades distintas (menor distância por label)"""
+        if not len(distances):
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+
+        # Pré-seleciona candidatos com argpartition e só ordena os selecionados
+        candidates = min(len(distances), max(k * 8, 32))
+        if candidates < len(distances):
+            idx = np.argpartition(distances, candidates - 1)[:candidates]
+        else:
+            idx = np.arange(len(distances))
+        idx = idx[np.argsort(distances[idx], kind='stable')]
+
+        labels = sample_labels[idx]
+        _, first = np.unique(labels, return_index=True)
+        if len(first) < k and candidates < len(distances):
+            # Poucas identidades distintas entre os candidatos: ordena tudo
+            idx = np.argsort(distances, kind='stable')
+            labels = sample_labels[idx]
+            _, first = np.unique(labels, return_index=True)
+
+        first = np.sort(first)[:k]
+        return labels[first], distances[idx[first]]
+
+    def predict_top_k(self, face_img, k=5):
+        """Retorna as k identidades mais próximas como listas (labels, distâncias)"""
+        if not self.trained:
+            raise ValueError("Modelo ainda não foi treinado")
+        enhanced = self._preprocess(face_img)
+        labels, distances = self._rank(*self._consultar(self.extract_histogram(enhanced)), k)
+        return labels.tolist(), distances.tolist()
+
+    def sample_count(self):
+        """Número de amostras de treino no modelo"""
+        return self._count
+
+    def _write_engine(self, path):
+        """Grava histogramas e labels em um único arquivo .npz"""
+        with open(path, 'wb') as f:
+            np.savez(f, histograms=self.histograms, labels=self.labels)
+
+    def _read_engine(self, path):
+        """Lê histogramas e labels gravados por _write_engine"""
+        with np.load(path) as data:
+            histograms = data['histograms']
+            labels = data['labels']
+        if histograms.shape[1] != self.histogram_size:
+            raise ValueError("Snapshot incompatível com os parâmetros do modelo")
+        self._create_engine()
+        self._append(histograms, labels)
@@ -2,24 +2,55 @@ import cv2
 import numpy as np
 from datetime import datetime
 import os
+import time
 import logging
+import argparse
 from model import LBPHModel
 from quality_check import FaceQualityChecker
 from database import FaceDatabase
-from email_sender import EmailSender
+from database_sqlite import SQLiteFaceDatabase
+from email_sender import EmailSender, EmailQueue
+from pipeline import MonitoringPipeline
+from recognizer import FaceRecognizer, carregar_ou_treinar, criar_modelo
+from face_detection import FaceDetector
+from face_store import FaceStore
+from hardware import open_source
+from report import FORMATOS, barra_progresso, gerar_relatorio
 
 class FaceRecognitionSystem:
-    def __init__(self):
+    def __init__(self, database=None, model=None, fonte=0, tempo_real=True, exibir=True,
+                 rastreamento=False, intervalo_deteccao=5, detectar_movimento=False,
+                 janela_eventos=0.0):
         """Inicializa o sistema de reconhecimento facial"""
+        # Fonte de frames (webcam, vídeo, stream, pasta de imagens ou sintética)
+        self.fonte = fonte
+        self.tempo_real = tempo_real
+        self.exibir = exibir
+        
+        # Modo detectar-e-rastrear: detecção completa apenas a cada N frames
+        self.rastreamento = rastreamento
+        self.intervalo_deteccao = intervalo_deteccao
+        
+        # Filtro de movimento: detecção apenas em regiões com movimento ou faces recentes
+        self.detectar_movimento = detectar_movimento
+        
+        # Agrupamento de reconhecimentos repetidos (0: cada detecção é um registro)
+        self.janela_eventos = janela_eventos
+        
         # Configurar sistema de logs
         self.setup_logging()
         
         self.logger.info("Iniciando sistema de reconhecimento facial")
         
-        self.face_detector = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
         self.quality_checker = FaceQualityChecker()
-        self.model = LBPHModel()
-        self.database = FaceDatabase()
+        # No cadastro, faces fora dos limites de qualidade também são detectadas
+        # para que o usuário receba a orientação (aproximar/afastar)
+        self.face_detector = FaceDetector(
+            min_face_size=self.quality_checker.min_face_size // 2,
+            max_face_size=int(self.quality_checker.max_face_size * 1.5)
+        )
+        self.model = model if model is not None else LBPHModel()
+        self.database = database if database is not None else FaceDatabase()
         
         # Configurações de e-mail
         self.email_sender = EmailSender(
@@ -28,13 +59,31 @@ class FaceRecognitionSystem:
             email="lucasfotesm00@gmail.com",
             password="87199738Lu"
         )
+        # Notificações enviadas em segundo plano; pendentes ficam na caixa de saída
+        self.email_queue = EmailQueue(self.email_sender)
+        self.email_queue.start()
+        
+        # Reconhecimentos exibidos no console ao gerar um relatório (o arquivo tem todos)
+        self.limite_console_relatorio = 20
+        
+        # Threads de detecção/reconhecimento no monitoramento
+        self.num_workers = 2
+        
+        # Snapshot do modelo treinado (reutilizado enquanto o conjunto de treino não mudar)
+        self.snapshot_dir = "modelos"
+        self.snapshot_desatualizado = False
         
-        # Treinar modelo com dados existentes
+        # Faces de treino já pré-processadas em um único arquivo
+        self.face_store = FaceStore(os.path.join(self.snapshot_dir, "faces.pack"))
+        
+        # Carregar snapshot ou treinar modelo com dados existentes
         try:
-            faces, labels = self.database.carregar_faces_treinamento()
-            if faces and labels:
-                self.model.train(faces, labels)
-                self.logger.info(f"Modelo treinado com sucesso! ({len(faces)} faces)")
+            origem, total = carregar_ou_treinar(self.model, self.database, self.snapshot_dir, self.face_store)
+            if origem == 'snapshot':
+                self.logger.info(f"Modelo carregado do snapshot ({total} faces)")
+                print("Modelo carregado do snapshot!")
+            elif origem == 'treinado':
+                self.logger.info(f"Modelo treinado com sucesso! ({total} faces)")
                 print("Modelo treinado com sucesso!")
             else:
                 self.logger.warning("Nenhuma face cadastrada para treinamento")
@@ -42,6 +91,27 @@ class FaceRecognitionSystem:
         except Exception as e:
             self.logger.error(f"Erro ao treinar modelo: {e}")
             print(f"Erro ao treinar modelo: {e}")
+        
+        # Detecção/reconhecimento dos workers do monitoramento
+        self.recognizer = FaceRecognizer(
+            self.model, self.quality_checker,
+            rastreamento=self.rastreamento,
+            intervalo_deteccao=self.intervalo_deteccao,
+            detectar_movimento=self.detectar_movimento,
+            logger=self.logger
+        )
+    
+    def salvar_snapshot(self):
+        """Salva o snapshot do modelo se ele mudou desde o último salvamento"""
+        if not self.snapshot_desatualizado or not self.model.trained:
+            return
+        try:
+            fingerprint = self.model.fingerprint(self.database.listar_faces_treinamento())
+            self.model.save_snapshot(self.snapshot_dir, fingerprint)
+            self.snapshot_desatualizado = False
+            self.logger.info("Snapshot do modelo salvo")
+        except Exception as e:
+            self.logger.error(f"Erro ao salvar snapshot do modelo: {e}")
     
     def setup_logging(self):
         """Configura o sistema de logs"""
@@ -84,14 +154,16 @@ class FaceRecognitionSystem:
         # Capturar foto
         print("\nPosicione seu rosto na área verde e mantenha a posição por 3 segundos...")
         self.logger.info("Iniciando captura de foto")
-        cap = cv2.VideoCapture(0)
+        cap = open_source(self.fonte, self.tempo_real)
+        try:
+            cap.start()
+        except RuntimeError as e:
+            self.logger.error(f"Não foi possível abrir a fonte de vídeo: {e}")
+            print(f"Erro: {e}")
+            return
         
-        # Definir área de guia
-        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         guide_size = 300
-        guide_x = (frame_width - guide_size) // 2
-        guide_y = (frame_height - guide_size) // 2
+        guide_x = guide_y = None
         
         face_capturada = None
         start_time = None
@@ -101,6 +173,12 @@ class FaceRecognitionSystem:
             if not ret:
                 print("Erro ao acessar a câmera")
                 break
+            
+            # Definir área de guia a partir do tamanho do primeiro frame
+            if guide_x is None:
+                frame_height, frame_width = frame.shape[:2]
+                guide_x = (frame_width - guide_size) // 2
+                guide_y = (frame_height - guide_size) // 2
                 
             # Desenhar área de guia
             cv2.rectangle(frame, (guide_x, guide_y), 
@@ -109,7 +187,7 @@ class FaceRecognitionSystem:
             
             # Detectar faces
             gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_detector.detectMultiScale(gray, 1.3, 5)
+            faces = self.face_detector.detect_gray(gray)
             
             if len(faces) == 1:
                 (x, y, w, h) = faces[0]
@@ -146,12 +224,14 @@ class FaceRecognitionSystem:
                 cv2.putText(frame, "Nenhuma face detectada", (10, 30),
                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
             
-            cv2.imshow('Cadastro', frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+            if self.exibir:
+                cv2.imshow('Cadastro', frame)
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
         
         cap.release()
-        cv2.destroyAllWindows()
+        if self.exibir:
+            cv2.destroyAllWindows()
         
         if face_capturada is not None:
             # Salvar face
@@ -164,17 +244,27 @@ class FaceRecognitionSystem:
                 self.logger.info(f"Pessoa cadastrada com sucesso - ID: {pessoa_id}, Nome: {nome}")
                 print(f"\nPessoa cadastrada com sucesso! ID: {pessoa_id}")
                 
-                # Enviar e-mail de confirmação
-                self.email_sender.enviar_email_reconhecimento(
-                    email, nome, 100.0, tipo="cadastro"
-                )
-                self.logger.info(f"Email de confirmação enviado para {email}")
+                # Enfileirar e-mail de confirmação (envio em segundo plano)
+                self.email_queue.enviar(email, nome, 100.0, tipo="cadastro")
+                self.logger.info(f"Email de confirmação enfileirado para {email}")
                 
-                # Treinar modelo
-                faces, labels = self.database.carregar_faces_treinamento()
-                self.model.train(faces, labels)
-                self.logger.info("Modelo retreinado com sucesso")
-                print("Modelo treinado com sucesso!")
+                # Atualizar modelo apenas com as faces novas
+                if self.model.trained:
+                    faces, labels = self.face_store.adicionar(self.database.listar_faces_novas(), self.model)
+                    if len(faces):
+                        self.model.update_processed(faces, labels)
+                    self.logger.info(f"Modelo atualizado com sucesso ({len(faces)} faces novas)")
+                    print("Modelo atualizado com sucesso!")
+                else:
+                    entradas = self.database.listar_faces_treinamento()
+                    faces, labels = self.face_store.carregar(entradas, self.model)
+                    self.database.marcar_faces_carregadas(entradas)
+                    self.model.train_processed(faces, labels)
+                    self.logger.info("Modelo retreinado com sucesso")
+                    print("Modelo treinado com sucesso!")
+                
+                # O snapshot é regravado ao encerrar, fora do caminho do cadastro
+                self.snapshot_desatualizado = True
             except Exception as e:
                 self.logger.error(f"Erro ao cadastrar pessoa: {e}")
                 print(f"Erro ao cadastrar pessoa: {e}")
@@ -189,71 +279,96 @@ class FaceRecognitionSystem:
         print("Pressione 'q' para sair")
         
         # Verificar se há faces cadastradas
-        faces, labels = self.database.carregar_faces_treinamento()
-        if not faces or not labels:
+        if not self.model.trained:
             self.logger.error("Tentativa de monitoramento sem faces cadastradas")
             print("Erro: Nenhuma face cadastrada para reconhecimento")
             return
         
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
-            self.logger.error("Não foi possível acessar a câmera")
+        cap = open_source(self.fonte, self.tempo_real)
+        try:
+            cap.start()
+        except RuntimeError as e:
+            self.logger.error(f"Não foi possível acessar a câmera: {e}")
             print("Erro: Não foi possível acessar a câmera")
             return
-            
-        ultimo_reconhecimento = {}  # Cache de reconhecimentos recentes
         
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                self.logger.error("Erro ao capturar frame da câmera")
-                print("Erro ao capturar frame da câmera")
-                break
-            
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_detector.detectMultiScale(gray, 1.3, 5)
-            
-            for (x, y, w, h) in faces:
-                face_region = gray[y:y+h, x:x+w]
+        # Captura, detecção/reconhecimento e persistência rodam em threads separadas;
+        # esta thread apenas exibe o frame processado mais recente
+        pipeline = MonitoringPipeline(
+            cap, self.recognizer.criar_processador, self._persistir_reconhecimento,
+            # O rastreador depende da ordem dos frames: um único worker
+            num_workers=1 if self.rastreamento else self.num_workers,
+            # Fontes gravadas em velocidade máxima não descartam frames
+            descartar_frames=cap.live or self.tempo_real,
+            janela_eventos=self.janela_eventos
+        )
+        pipeline.start()
+        
+        try:
+            while pipeline.running:
+                resultado = pipeline.get_event()
+                if resultado is not None:
+                    deteccao, pessoa = resultado
+                    confianca = deteccao['confianca']
+                    self.logger.info(f"Pessoa reconhecida - ID: {pessoa['id']}, Nome: {pessoa['nome']}, Confiança: {confianca:.2f}%")
+                    print(f"\nPessoa identificada: {pessoa['nome']}")
+                    print(f"CPF: {pessoa['cpf']}")
+                    print(f"E-mail: {pessoa['email']}")
+                    print(f"Confiança: {confianca:.2f}%")
+                    
+                    # Aguardar 2 segundos e fechar
+                    ultimo = pipeline.latest_result()
+                    if self.exibir and ultimo is not None:
+                        cv2.imshow('Monitoramento', self._desenhar_deteccoes(*ultimo))
+                        cv2.waitKey(2000)
+                    break
                 
-                # Verificar qualidade
-                try:
-                    quality_msg = self.quality_checker.check_quality(face_region, (x, y, w, h))
-                    if quality_msg == "OK":
-                        # Prever pessoa
-                        pessoa_id, confianca = self.model.predict(face_region)
-                        
-                        if pessoa_id != -1 and confianca >= 80:
-                            # Registrar reconhecimento
-                            pessoa = self.database.registrar_reconhecimento(
-                                pessoa_id, confianca, "monitoramento.png"
-                            )
-                            
-                            if pessoa:
-                                self.logger.info(f"Pessoa reconhecida - ID: {pessoa_id}, Nome: {pessoa['nome']}, Confiança: {confianca:.2f}%")
-                                print(f"\nPessoa identificada: {pessoa['nome']}")
-                                print(f"CPF: {pessoa['cpf']}")
-                                print(f"E-mail: {pessoa['email']}")
-                                print(f"Confiança: {confianca:.2f}%")
-                                
-                                # Aguardar 2 segundos e fechar
-                                cv2.imshow('Monitoramento', frame)
-                                cv2.waitKey(2000)
-                                cap.release()
-                                cv2.destroyAllWindows()
-                                return
-                            
-                except Exception as e:
-                    self.logger.error(f"Erro no processamento: {e}")
-                    print(f"Erro no processamento: {e}")
-            
-            cv2.imshow('Monitoramento', frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                self.logger.info("Monitoramento interrompido pelo usuário")
-                break
+                if not self.exibir:
+                    time.sleep(0.01)
+                    continue
+                
+                ultimo = pipeline.latest_result()
+                if ultimo is not None:
+                    cv2.imshow('Monitoramento', self._desenhar_deteccoes(*ultimo))
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    self.logger.info("Monitoramento interrompido pelo usuário")
+                    break
+        finally:
+            pipeline.stop()
+            cap.release()
+            if self.exibir:
+                cv2.destroyAllWindows()
         
-        cap.release()
-        cv2.destroyAllWindows()
+        if pipeline.erro:
+            self.logger.error(pipeline.erro)
+            print(pipeline.erro)
+        
+        stats = pipeline.stats()
+        self.logger.info(
+            f"Monitoramento encerrado - frames capturados: {stats['frames_capturados']}, "
+            f"processados: {stats['frames_processados']}, descartados: {stats['frames_descartados']}, "
+            f"latência média: {stats['latencia_media_ms']:.1f} ms, "
+            f"acertos no cache de predições: {100 * self.model.last_predictions.stats()['taxa_acerto']:.0f}%"
+        )
+    
+    def _persistir_reconhecimento(self, deteccao):
+        """Registra um reconhecimento (estágio de persistência do pipeline)"""
+        pessoa = self.database.registrar_reconhecimento(
+            deteccao['pessoa_id'], deteccao['confianca'], "monitoramento.png",
+            deteccao.get('ocorrencias', 1), deteccao.get('inicio'), deteccao.get('fim')
+        )
+        if pessoa:
+            return deteccao, pessoa
+        return None
+    
+    def _desenhar_deteccoes(self, frame, deteccoes):
+        """Desenha as detecções em uma cópia do frame (verde: reconhecida, vermelho: não)"""
+        frame = frame.copy()
+        for deteccao in deteccoes:
+            x, y, w, h = deteccao['bbox']
+            cor = (0, 255, 0) if deteccao['reconhecido'] else (0, 0, 255)
+            cv2.rectangle(frame, (x, y), (x + w, y + h), cor, 2)
+        return frame
 
     def gerar_relatorio(self):
         """Gera relatório de reconhecimentos"""
@@ -261,68 +376,97 @@ class FaceRecognitionSystem:
         print("\n=== Gerar Relatório ===")
         data_inicio = input("Data inicial (YYYY-MM-DD): ")
         data_fim = input("Data final (YYYY-MM-DD): ")
+        formato = input(f"Formato ({'/'.join(FORMATOS)}) [txt]: ").strip().lower() or "txt"
+        if formato not in FORMATOS:
+            print("\nFormato inválido!")
+            return
         
-        self.logger.info(f"Gerando relatório para o período: {data_inicio} a {data_fim}")
+        self.logger.info(f"Gerando relatório para o período: {data_inicio} a {data_fim} ({formato})")
         print("\nGerando relatório...")
         
-        # Simular progresso
-        for i in range(101):
-            barra = "=" * (i // 2) + ">" + " " * (50 - (i // 2))
-            print(f"\rProgresso: [{barra}] {i}%", end="", flush=True)
-            if i < 100:
-                import time
-                time.sleep(0.02)
-        print()
-        
-        reconhecimentos = self.database.gerar_relatorio_periodo(data_inicio, data_fim)
+        # Apenas os primeiros reconhecimentos são exibidos no console
+        exibidos = []
+        def ao_escrever(r):
+            if len(exibidos) < self.limite_console_relatorio:
+                exibidos.append(r)
         
-        # Gerar nome do arquivo
-        nome_arquivo = f"relatorio_{data_inicio}_a_{data_fim}.txt"
-        caminho_completo = os.path.join(os.getcwd(), "relatorios", nome_arquivo)
-        
-        # Criar diretório de relatórios se não existir
-        os.makedirs("relatorios", exist_ok=True)
-        
-        # Salvar relatório em arquivo
-        with open(caminho_completo, "w", encoding="utf-8") as f:
-            f.write("="*50 + "\n")
-            f.write("RELATÓRIO DE RECONHECIMENTOS".center(50) + "\n")
-            f.write("="*50 + "\n\n")
-            f.write(f"Período: {data_inicio} a {data_fim}\n")
-            f.write(f"Data de geração: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            
-            if reconhecimentos:
-                self.logger.info(f"Encontrados {len(reconhecimentos)} reconhecimentos no período")
-                f.write("Reconhecimentos encontrados:\n")
-                for r in reconhecimentos:
-                    f.write("\n" + "-"*30 + "\n")
-                    f.write(f"Nome: {r['nome']}\n")
-                    f.write(f"CPF: {r['cpf']}\n")
-                    f.write(f"E-mail: {r['email']}\n")
-                    f.write(f"Data/Hora: {r['data_hora']}\n")
-                    f.write(f"Confiança: {r['confianca']:.2f}%\n")
-            else:
-                self.logger.info("Nenhum reconhecimento encontrado no período")
-                f.write("\nNenhum reconhecimento encontrado no período")
+        try:
+            caminho_completo, total = gerar_relatorio(
+                self.database, data_inicio, data_fim, formato,
+                progresso=barra_progresso, ao_escrever=ao_escrever
+            )
+        except ValueError as e:
+            self.logger.error(f"Período inválido: {e}")
+            print(f"\nPeríodo inválido: {e}")
+            return
+        except OSError as e:
+            self.logger.error(f"Erro ao ler o histórico: {e}")
+            print(f"\nErro ao ler o histórico: {e}")
+            return
+        print()
         
+        if total:
+            self.logger.info(f"Encontrados {total} reconhecimentos no período")
+        else:
+            self.logger.info("Nenhum reconhecimento encontrado no período")
         self.logger.info(f"Relatório gerado com sucesso: {caminho_completo}")
         print(f"\nRelatório gerado com sucesso!")
         print(f"Local do arquivo: {caminho_completo}")
         
-        # Mostrar conteúdo do relatório no console
-        if reconhecimentos:
-            print("\nReconhecimentos encontrados:")
-            for r in reconhecimentos:
+        # Mostrar os primeiros reconhecimentos no console
+        if exibidos:
+            print(f"\nReconhecimentos encontrados: {total}")
+            for r in exibidos:
                 print(f"\nNome: {r['nome']}")
                 print(f"CPF: {r['cpf']}")
                 print(f"E-mail: {r['email']}")
                 print(f"Data/Hora: {r['data_hora']}")
                 print(f"Confiança: {r['confianca']:.2f}%")
+            if total > len(exibidos):
+                print(f"\n... e mais {total - len(exibidos)} (ver arquivo)")
         else:
             print("\nNenhum reconhecimento encontrado no período")
 
 def main():
-    system = FaceRecognitionSystem()
+    parser = argparse.ArgumentParser(description="Sistema de reconhecimento facial")
+    parser.add_argument("--banco", choices=["json", "sqlite"], default="json",
+                        help="Backend de armazenamento (padrão: json)")
+    parser.add_argument("--db", default="faces.db", help="Arquivo do banco SQLite")
+    parser.add_argument("--motor", choices=["opencv", "numpy", "mapeado"], default="opencv",
+                        help="Motor LBPH; mapeado mantém a galeria em arquivos mapeados em memória (padrão: opencv)")
+    parser.add_argument("--fonte", default="0",
+                        help="Fonte de frames: índice da webcam, arquivo de vídeo, URL rtsp://, "
+                             "diretório de imagens ou sintetico[:N] (padrão: 0)")
+    parser.add_argument("--velocidade-maxima", action="store_true",
+                        help="Não respeitar o fps de fontes gravadas (medição de throughput)")
+    parser.add_argument("--sem-janela", action="store_true",
+                        help="Não abrir janelas (execução headless)")
+    parser.add_argument("--rastrear", action="store_true",
+                        help="Modo detectar-e-rastrear: detecção completa apenas a cada N frames")
+    parser.add_argument("--intervalo-deteccao", type=int, default=5,
+                        help="Frames entre detecções completas no modo --rastrear (padrão: 5)")
+    parser.add_argument("--detectar-movimento", action="store_true",
+                        help="Detectar faces apenas em regiões com movimento (câmeras ociosas quase sem custo)")
+    parser.add_argument("--janela-eventos", type=float, default=0.0,
+                        help="Segundos para agrupar reconhecimentos repetidos da mesma pessoa "
+                             "em um único registro (padrão: 0, cada detecção é registrada)")
+    args = parser.parse_args()
+    
+    if args.banco == "sqlite":
+        database = SQLiteFaceDatabase(args.db)
+    else:
+        database = FaceDatabase()
+    model = criar_modelo(args.motor)
+    system = FaceRecognitionSystem(
+        database, model,
+        fonte=args.fonte,
+        tempo_real=not args.velocidade_maxima,
+        exibir=not args.sem_janela,
+        rastreamento=args.rastrear,
+        intervalo_deteccao=args.intervalo_deteccao,
+        detectar_movimento=args.detectar_movimento,
+        janela_eventos=args.janela_eventos
+    )
     
     while True:
         print("\n" + "="*50)
@@ -344,6 +488,9 @@ def main():
             system.gerar_relatorio()
         elif opcao == "4":
             system.logger.info("Encerrando o programa")
+            system.salvar_snapshot()
+            system.email_queue.stop()
+            system.database.fechar()
             print("\nEncerrando o programa...")
             break
         else:
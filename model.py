@@ -1,6 +1,103 @@
+import os
+import json
+import hashlib
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
 import cv2
 import numpy as np
 
+# Número de bits 1 de cada byte (distância de Hamming entre assinaturas)
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+class PredictionCache:
+    """
+    Cache LRU de predições indexado por uma assinatura perceptual (dHash) da
+    face pré-processada. Recortes quase idênticos (a mesma pessoa parada diante
+    da câmera, com a bbox oscilando alguns pixels) caem na mesma entrada.
+    """
+
+    def __init__(self, capacidade=256, ttl=2.0, hash_size=12, max_hamming=28):
+        """
+        ttl: segundos de validade de uma predição (a identidade volta a ser conferida).
+        hash_size: lado da grade do dHash (hash_size**2 bits, múltiplo de 8).
+        max_hamming: bits diferentes tolerados entre assinaturas. Medido na base:
+            com 144 bits, recortes de quadros consecutivos da mesma pessoa ficam
+            a até 28 bits (p95; mediana 15) e pessoas diferentes a 32 ou mais.
+            Com 256 bits as faixas se sobrepõem (jitter p95 de 56 contra mínimo
+            de 51), por isso a grade menor.
+        """
+        self.capacidade = capacidade
+        self.ttl = ttl
+        self.hash_size = hash_size
+        self.max_hamming = max_hamming
+        self._lock = threading.Lock()
+        self.clear()
+
+    def signature(self, enhanced):
+        """dHash: sinal do gradiente horizontal em uma versão reduzida da face"""
+        n = self.hash_size
+        small = cv2.resize(enhanced, (n + 1, n), interpolation=cv2.INTER_AREA)
+        return np.packbits(small[:, 1:] > small[:, :-1])
+
+    def clear(self):
+        """Descarta todas as predições (ex.: após treinar ou atualizar o modelo)"""
+        with self._lock:
+            n_bytes = self.hash_size * self.hash_size // 8
+            self._assinaturas = np.zeros((self.capacidade, n_bytes), dtype=np.uint8)
+            self._validas = np.zeros(self.capacidade, dtype=bool)
+            self._expira = np.zeros(self.capacidade, dtype=np.float64)
+            self._resultados = [None] * self.capacidade
+            self._ordem = OrderedDict()  # Posições ocupadas, da menos para a mais recente
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, assinatura):
+        """Retorna a predição da entrada mais próxima dentro da tolerância, ou None"""
+        with self._lock:
+            agora = time.monotonic()
+            self._validas &= self._expira > agora
+            if self._validas.any():
+                distancias = _POPCOUNT[self._assinaturas ^ assinatura].sum(axis=1, dtype=np.int32)
+                distancias[~self._validas] = self.max_hamming + 1
+                pos = int(np.argmin(distancias))
+                if distancias[pos] <= self.max_hamming:
+                    self._ordem.move_to_end(pos)
+                    self.hits += 1
+                    return self._resultados[pos]
+            self.misses += 1
+            return None
+
+    def put(self, assinatura, resultado):
+        """Armazena uma predição, reaproveitando posições expiradas ou a menos usada"""
+        with self._lock:
+            livres = np.flatnonzero(~self._validas)
+            if len(livres):
+                pos = int(livres[0])
+                self._ordem.pop(pos, None)
+            else:
+                pos, _ = self._ordem.popitem(last=False)
+            self._assinaturas[pos] = assinatura
+            self._validas[pos] = True
+            self._expira[pos] = time.monotonic() + self.ttl
+            self._resultados[pos] = resultado
+            self._ordem[pos] = None
+
+    def __len__(self):
+        with self._lock:
+            return int(np.count_nonzero(self._validas & (self._expira > time.monotonic())))
+
+    def stats(self):
+        """Acertos, falhas e taxa de acerto desde o último clear()"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'taxa_acerto': self.hits / total if total else 0.0
+            }
+
 class LBPHModel:
     def __init__(self):
         # Ajustando parâmetros para melhor precisão
@@ -9,53 +106,213 @@ class LBPHModel:
         self.grid_x = 8  # Mantido para boa resolução
         self.grid_y = 8  # Mantido para boa resolução
         self.threshold = 100  # Aumentado para ser mais tolerante
-        self.model = cv2.face.LBPHFaceRecognizer_create(
+        self.snapshot_file = "lbph.yml"
+        self.model = self._create_engine()
+        # Parâmetros de pré-processamento
+        self.face_size = (100, 100)  # (largura, altura) de normalização das faces
+        self.clahe_clip_limit = 2.0
+        self.clahe_tile_grid = (8, 8)
+        self.blur_kernel = (3, 3)
+        self.last_predictions = PredictionCache()  # Cache de predições recentes
+        self._local = threading.local()  # Objetos de pré-processamento por thread
+        self.trained = False
+    
+    def _create_engine(self):
+        """Cria o reconhecedor LBPH do OpenCV"""
+        return cv2.face.LBPHFaceRecognizer_create(
             radius=self.radius,
             neighbors=self.neighbors,
             grid_x=self.grid_x,
             grid_y=self.grid_y,
             threshold=self.threshold
         )
-        self.last_predictions = {}  # Cache de predições recentes
+    
+    def _train_engine(self, processed_faces, labels):
+        """Treina o reconhecedor com faces já pré-processadas"""
+        self.model.train(processed_faces, np.array(labels))
+    
+    def _update_engine(self, processed_faces, labels):
+        """Acrescenta faces já pré-processadas ao reconhecedor"""
+        self.model.update(processed_faces, np.array(labels))
+    
+    def _match(self, enhanced):
+        """Retorna (label, distância) da face pré-processada mais próxima"""
+        return self.model.predict(enhanced)
+    
+    def _write_engine(self, path):
+        """Grava o estado do reconhecedor em disco"""
+        self.model.write(path)
+    
+    def _read_engine(self, path):
+        """Lê o estado do reconhecedor do disco"""
+        self.model.read(path)
+    
+    def sample_count(self):
+        """Número de amostras de treino no modelo"""
+        return len(self.model.getLabels()) if self.trained else 0
+    
+    def _clahe(self):
+        """CLAHE reutilizável da thread atual (o objeto do OpenCV não é thread-safe)"""
+        clahe = getattr(self._local, 'clahe', None)
+        if clahe is None:
+            clahe = cv2.createCLAHE(clipLimit=self.clahe_clip_limit, tileGridSize=self.clahe_tile_grid)
+            self._local.clahe = clahe
+        return clahe
+    
+    def _preprocess(self, face):
+        """Aplica o pré-processamento usado no treino e na predição"""
+        # Normaliza o tamanho (faces de treino e consulta comparáveis célula a célula)
+        if face.shape[1::-1] != self.face_size:
+            face = cv2.resize(face, self.face_size, interpolation=cv2.INTER_AREA)
+        
+        # Aplica equalização adaptativa
+        enhanced = self._clahe().apply(face)
+        
+        # Aplica suavização leve
+        return cv2.GaussianBlur(enhanced, self.blur_kernel, 0)
+    
+    def parameters(self):
+        """Parâmetros do modelo e do pré-processamento que afetam os histogramas"""
+        return {
+            'engine': type(self).__name__,
+            'radius': self.radius,
+            'neighbors': self.neighbors,
+            'grid_x': self.grid_x,
+            'grid_y': self.grid_y,
+            'threshold': self.threshold,
+            'face_size': list(self.face_size),
+            'clahe_clip_limit': self.clahe_clip_limit,
+            'clahe_tile_grid': list(self.clahe_tile_grid),
+            'blur_kernel': list(self.blur_kernel)
+        }
+    
+    def fingerprint(self, face_entries):
+        """
+        Calcula a impressão digital do conjunto de treino.
+        face_entries: lista de (label, face_path, tamanho, mtime_ns).
+        """
+        conteudo = json.dumps({
+            'parameters': self.parameters(),
+            'faces': sorted([list(e) for e in face_entries])
+        }, sort_keys=True)
+        return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+    
+    def save_snapshot(self, directory, fingerprint):
+        """Salva o modelo treinado e o manifesto com a impressão digital do treino"""
+        if not self.trained:
+            raise ValueError("Modelo ainda não foi treinado")
+        
+        os.makedirs(directory, exist_ok=True)
+        model_path = os.path.join(directory, self.snapshot_file)
+        manifest_path = os.path.join(directory, "manifest.json")
+        
+        # Grava em arquivos temporários e troca de forma atômica, para que um
+        # snapshot incompleto nunca seja carregado
+        nome, extensao = os.path.splitext(self.snapshot_file)
+        temp_model = os.path.join(directory, nome + ".tmp" + extensao)
+        self._write_engine(temp_model)
+        os.replace(temp_model, model_path)
+        
+        manifest = {
+            'fingerprint': fingerprint,
+            'parameters': self.parameters(),
+            'samples': self.sample_count(),
+            'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        temp_manifest = manifest_path + ".tmp"
+        with open(temp_manifest, 'w') as f:
+            json.dump(manifest, f, indent=4)
+        os.replace(temp_manifest, manifest_path)
+    
+    def load_snapshot(self, directory, fingerprint):
+        """Carrega o snapshot se a impressão digital coincidir; retorna True se carregou"""
+        model_path = os.path.join(directory, self.snapshot_file)
+        manifest_path = os.path.join(directory, "manifest.json")
+        
+        if not (os.path.exists(model_path) and os.path.exists(manifest_path)):
+            return False
+        
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            if manifest.get('fingerprint') != fingerprint:
+                return False
+            
+            self._read_engine(model_path)
+        except Exception as e:
+            print(f"Erro ao carregar snapshot do modelo: {e}")
+            return False
+        
+        self.trained = True
+        self.last_predictions.clear()
+        return True
     
     def train(self, faces, labels):
         """Treina o modelo com as faces fornecidas"""
         if not faces or not labels:
             raise ValueError("Listas de faces e labels não podem estar vazias")
         
-        print(f"Treinando modelo com {len(faces)} faces...")  # Log de debug
-        
         # Aplica pré-processamento em todas as faces
-        processed_faces = []
-        for face in faces:
-            # Aplica equalização adaptativa
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            enhanced = clahe.apply(face)
-            
-            # Aplica suavização leve
-            enhanced = cv2.GaussianBlur(enhanced, (3,3), 0)
-            
-            processed_faces.append(enhanced)
+        self.train_processed([self._preprocess(face) for face in faces], labels)
+    
+    def train_processed(self, processed_faces, labels):
+        """Treina o modelo com faces já pré-processadas (ex.: lidas do FaceStore)"""
+        if not len(processed_faces) or not len(labels):
+            raise ValueError("Listas de faces e labels não podem estar vazias")
         
-        self.model.train(processed_faces, np.array(labels))
+        print(f"Treinando modelo com {len(processed_faces)} faces...")  # Log de debug
+        
+        self._train_engine(list(processed_faces), labels)
+        self.trained = True
         self.last_predictions.clear()  # Limpa cache ao treinar
         print("Modelo treinado com sucesso!")  # Log de debug
     
+    def update(self, faces, labels):
+        """Acrescenta novas faces ao modelo sem retreinar as existentes"""
+        if not faces or not labels:
+            raise ValueError("Listas de faces e labels não podem estar vazias")
+        
+        # Apenas as amostras novas são pré-processadas; o LBPH calcula os
+        # histogramas delas e os acrescenta aos já existentes
+        self.update_processed([self._preprocess(face) for face in faces], labels)
+    
+    def update_processed(self, processed_faces, labels):
+        """Acrescenta faces já pré-processadas ao modelo"""
+        if not len(processed_faces) or not len(labels):
+            raise ValueError("Listas de faces e labels não podem estar vazias")
+        
+        if not self.trained:
+            self.train_processed(processed_faces, labels)
+            return
+        
+        print(f"Atualizando modelo com {len(processed_faces)} faces novas...")  # Log de debug
+        
+        self._update_engine(list(processed_faces), labels)
+        self.last_predictions.clear()  # Limpa cache ao atualizar
+        print("Modelo atualizado com sucesso!")  # Log de debug
+    
+    def _cache_key(self, enhanced):
+        """Chave do cache de predições: assinatura perceptual da face pré-processada"""
+        return self.last_predictions.signature(enhanced)
+    
+    def _cache_store(self, key, result):
+        """Armazena uma predição no cache"""
+        self.last_predictions.put(key, result)
+    
     def predict(self, face_img):
         """Faz a predição para uma face"""
         try:
             # Aplica o mesmo pré-processamento do treino
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-            enhanced = clahe.apply(face_img)
-            enhanced = cv2.GaussianBlur(enhanced, (3,3), 0)
+            enhanced = self._preprocess(face_img)
             
             # Verifica cache
-            face_hash = hash(enhanced.tobytes())
-            if face_hash in self.last_predictions:
-                return self.last_predictions[face_hash]
+            face_hash = self._cache_key(enhanced)
+            cached = self.last_predictions.get(face_hash)
+            if cached is not None:
+                return cached
             
             # Faz predição
-            label, confidence = self.model.predict(enhanced)
+            label, confidence = self._match(enhanced)
             
             # Ajusta a confiança para ser mais intuitiva
             # Quanto menor o valor, melhor a confiança
@@ -64,14 +321,57 @@ class LBPHModel:
             print(f"Predição: ID={label}, Confiança={adjusted_confidence:.2f}")  # Log de debug
             
             # Armazena no cache
-            self.last_predictions[face_hash] = (label, adjusted_confidence)
-            
-            # Limita tamanho do cache
-            if len(self.last_predictions) > 100:
-                self.last_predictions.pop(next(iter(self.last_predictions)))
+            self._cache_store(face_hash, (label, adjusted_confidence))
             
             return label, adjusted_confidence
             
         except Exception as e:
             print(f"Erro na predição: {e}")  # Log de erro
-            return -1, 100  # Retorna desconhecido em caso de erro 
\ No newline at end of file
+            return -1, 100  # Retorna desconhecido em caso de erro
+    
+    def predict_batch(self, face_imgs):
+        """Faz a predição para várias faces em uma única chamada"""
+        results = []
+        pending = []  # (posição, chave do cache, face pré-processada)
+        
+        for i, face_img in enumerate(face_imgs):
+            try:
+                enhanced = self._preprocess(face_img)
+            except Exception as e:
+                print(f"Erro na predição: {e}")  # Log de erro
+                results.append((-1, 100))
+                continue
+            
+            face_hash = self._cache_key(enhanced)
+            cached = self.last_predictions.get(face_hash)
+            results.append(cached)
+            if cached is None:
+                pending.append((i, face_hash, enhanced))
+        
+        if pending:
+            matches = self._match_batch([enhanced for _, _, enhanced in pending])
+            for (i, face_hash, _), match in zip(pending, matches):
+                if match is None:
+                    results[i] = (-1, 100)  # Desconhecido em caso de erro
+                    continue
+                label, confidence = match
+                adjusted_confidence = min(100, max(0, confidence))
+                results[i] = (label, adjusted_confidence)
+                self._cache_store(face_hash, results[i])
+        
+        if face_imgs:
+            reconhecidas = sum(1 for label, _ in results if label != -1)
+            print(f"Predição em lote: {len(face_imgs)} faces, {reconhecidas} identificadas")  # Log de debug
+        
+        return results
+    
+    def _match_batch(self, enhanced_faces):
+        """Retorna (label, distância) para cada face pré-processada (None em caso de erro)"""
+        matches = []
+        for enhanced in enhanced_faces:
+            try:
+                matches.append(self._match(enhanced))
+            except Exception as e:
+                print(f"Erro na predição: {e}")  # Log de erro
+                matches.append(None)
+        return matches
@@ -0,0 +1,161 @@
+import cv2
+import numpy as np
+from tracking import iou_matrix
+
+def unir_regioes(regioes):
+    """
+    Une regiões (x, y, w, h) sobrepostas quando o retângulo envolvente não é
+    maior que a soma das duas (regiões vizinhas continuam separadas)
+    """
+    regioes = [list(r) for r in regioes]
+    unidas = True
+    while unidas and len(regioes) > 1:
+        unidas = False
+        resultado = []
+        for r in regioes:
+            for u in resultado:
+                x1, y1 = min(r[0], u[0]), min(r[1], u[1])
+                x2, y2 = max(r[0] + r[2], u[0] + u[2]), max(r[1] + r[3], u[1] + u[3])
+                if (x2 - x1) * (y2 - y1) <= r[2] * r[3] + u[2] * u[3]:
+                    u[:] = [x1, y1, x2 - x1, y2 - y1]
+                    unidas = True
+                    break
+            else:
+                resultado.append(r)
+        regioes = resultado
+    return [tuple(r) for r in regioes]
+
+def detectar_em_regioes(detectar, gray, regioes, iou_duplicada=0.5):
+    """Roda o detector em cada região e devolve as faces em coordenadas do frame"""
+    faces = []
+    for x, y, w, h in regioes:
+        for (fx, fy, fw, fh) in detectar(gray[y:y + h, x:x + w]):
+            faces.append((int(fx) + x, int(fy) + y, int(fw), int(fh)))
+
+    # A mesma face pode ser detectada em duas regiões que se sobrepõem
+    if len(faces) > 1:
+        ious = iou_matrix(faces, faces)
+        mantidas = []
+        for i in sorted(range(len(faces)), key=lambda i: -faces[i][2] * faces[i][3]):
+            if all(ious[i, j] < iou_duplicada for j in mantidas):
+                mantidas.append(i)
+        faces = [faces[i] for i in sorted(mantidas)]
+    return faces
+
+class MotionGate:
+    """
+    Filtro de movimento para a detecção de faces. Um modelo de fundo (média
+    móvel) em baixa resolução indica onde houve movimento; a detecção roda
+    apenas em regiões dilatadas ao redor do movimento e das últimas faces
+    detectadas. Frames estáticos sem faces não passam pelo detector, e a cada
+    intervalo_completo frames a detecção roda no frame inteiro.
+    """
+
+    def __init__(self, escala=0.25, limiar=20, taxa_fundo=0.05, area_minima=0.001,
+                 margem=0.25, tamanho_minimo=120, fracao_maxima=0.6, intervalo_completo=30):
+        """
+        escala: redução da imagem usada na análise de movimento.
+        limiar: diferença de intensidade (0-255) em relação ao fundo considerada movimento.
+        area_minima: fração do frame que uma região de movimento precisa ocupar.
+        margem: expansão das regiões (fração do tamanho) antes da detecção.
+        tamanho_minimo: lado mínimo da região, em pixels do frame (deve comportar uma face).
+        fracao_maxima: acima dessa fração do frame, detecta no frame inteiro.
+        """
+        self.escala = escala
+        self.limiar = limiar
+        self.taxa_fundo = taxa_fundo
+        self.area_minima = area_minima
+        self.margem = margem
+        self.tamanho_minimo = tamanho_minimo
+        self.fracao_maxima = fracao_maxima
+        self.intervalo_completo = intervalo_completo
+        self._fundo = None
+        self._desde_completa = 0
+        self._kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+        self.ultimas_faces = []
+
+        # Contadores
+        self.frames = 0
+        self.frames_ignorados = 0
+        self.frames_completos = 0
+        self._area_processada = 0.0
+
+    def _expandir(self, regiao, largura, altura):
+        """Expande a região pela margem e até o tamanho mínimo, limitada ao frame"""
+        x, y, w, h = regiao
+        lado_w = max(w * (1 + 2 * self.margem), self.tamanho_minimo)
+        lado_h = max(h * (1 + 2 * self.margem), self.tamanho_minimo)
+        cx, cy = x + w / 2, y + h / 2
+        x1, y1 = max(0, int(cx - lado_w / 2)), max(0, int(cy - lado_h / 2))
+        x2, y2 = min(largura, int(cx + lado_w / 2)), min(altura, int(cy + lado_h / 2))
+        return (x1, y1, x2 - x1, y2 - y1)
+
+    def _regioes_movimento(self, gray):
+        """Atualiza o fundo e retorna as regiões com movimento (coordenadas do frame)"""
+        small = cv2.resize(gray, None, fx=self.escala, fy=self.escala, interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(small, (5, 5), 0)
+
+        if self._fundo is None or self._fundo.shape != small.shape:
+            self._fundo = small.astype(np.float32)
+            return None
+
+        diferenca = cv2.absdiff(small, cv2.convertScaleAbs(self._fundo))
+        cv2.accumulateWeighted(small, self._fundo, self.taxa_fundo)
+        _, mascara = cv2.threshold(diferenca, self.limiar, 255, cv2.THRESH_BINARY)
+        mascara = cv2.dilate(mascara, self._kernel, iterations=2)
+
+        n, _, stats, _ = cv2.connectedComponentsWithStats(mascara)
+        area_minima = self.area_minima * small.size
+        return [
+            tuple(int(round(v / self.escala)) for v in stats[i, :4])
+            for i in range(1, n) if stats[i, cv2.CC_STAT_AREA] >= area_minima
+        ]
+
+    def regioes(self, gray):
+        """
+        Regiões do frame onde a detecção deve rodar: None para o frame inteiro,
+        lista vazia quando o frame pode ser ignorado
+        """
+        self.frames += 1
+        altura, largura = gray.shape[:2]
+        movimento = self._regioes_movimento(gray)
+
+        self._desde_completa += 1
+        if movimento is None or self._desde_completa >= self.intervalo_completo:
+            return self._completo()
+
+        regioes = unir_regioes(
+            self._expandir(r, largura, altura) for r in movimento + list(self.ultimas_faces)
+        )
+        area = sum(w * h for _, _, w, h in regioes)
+        if area > self.fracao_maxima * largura * altura:
+            return self._completo()
+        if not regioes:
+            self.frames_ignorados += 1
+        self._area_processada += area / float(largura * altura)
+        return regioes
+
+    def _completo(self):
+        self._desde_completa = 0
+        self.frames_completos += 1
+        self._area_processada += 1.0
+        return None
+
+    def detectar(self, detectar, gray):
+        """Detecta faces apenas onde há movimento ou havia faces; detectar: gray -> faces"""
+        regioes = self.regioes(gray)
+        if regioes is None:
+            faces = [tuple(int(v) for v in f) for f in detectar(gray)]
+        else:
+            faces = detectar_em_regioes(detectar, gray, regioes)
+        self.ultimas_faces = faces
+        return faces
+
+    def stats(self):
+        """Frames ignorados, com detecção completa e fração média do frame processada"""
+        return {
+            'frames': self.frames,
+            'frames_ignorados': self.frames_ignorados,
+            'frames_completos': self.frames_completos,
+            'fracao_area_processada': self._area_processada / self.frames if self.frames else 0.0
+        }
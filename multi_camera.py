@@ -0,0 +1,386 @@
+import time
+import queue
+import signal
+import argparse
+import threading
+import multiprocessing as mp
+import cv2
+from database import FaceDatabase
+from database_sqlite import SQLiteFaceDatabase
+from pipeline import MonitoringPipeline
+from recognizer import FaceRecognizer, carregar_ou_treinar, criar_modelo
+from hardware import open_source
+from shared_frames import SharedFrameRing, SharedRingSource, publicar_frames
+
+# Modelo carregado no processo principal. Com fork, os processos das câmeras
+# herdam a galeria sem copiá-la (páginas compartilhadas, somente leitura);
+# com spawn, cada processo lê o snapshot salvo pelo principal.
+_MODELO = None
+
+def _processo_captura(camera, fonte, config, anel, consumido, parar):
+    """
+    Processo de captura (modo captura_separada): decodifica os frames direto em um
+    SharedFrameRing e envia a descrição do buffer ao processo de reconhecimento
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cv2.setNumThreads(1)
+
+    source = open_source(fonte, config['tempo_real'])
+    try:
+        source.start()
+        primeiro = source.read_frame()
+    except RuntimeError as e:
+        anel.put({'erro': str(e)})
+        return
+
+    # O formato do buffer vem do primeiro frame da fonte
+    ring = SharedFrameRing(primeiro.shape, slots=config['slots'], dtype=primeiro.dtype)
+    try:
+        ring.escrever(primeiro)
+        anel.put(ring.descricao())
+        publicar_frames(source, ring, parar)
+        # O segmento só é removido depois que o consumidor terminar
+        while not consumido.wait(0.1) and not parar.is_set():
+            pass
+    finally:
+        source.release()
+        ring.close()
+        ring.unlink()
+
+def _processo_camera(camera, fonte, config, eventos, parar, anel=None, consumido=None):
+    """Processo de uma câmera: pipeline de captura/reconhecimento; eventos vão para o principal"""
+    # Ctrl+C chega a todo o grupo de processos; o principal coordena o encerramento
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Um processo por câmera: as threads internas do OpenCV só disputariam os núcleos
+    cv2.setNumThreads(1)
+    try:
+        _reconhecer_camera(camera, fonte, config, eventos, parar, anel)
+    finally:
+        if consumido is not None:
+            consumido.set()
+
+def _reconhecer_camera(camera, fonte, config, eventos, parar, anel):
+    """Carrega o modelo, abre a fonte (ou o buffer compartilhado) e roda o pipeline"""
+    model = _MODELO
+    if model is None:
+        model = criar_modelo(config['motor'], config['snapshot_dir'])
+        if not model.load_snapshot(config['snapshot_dir'], config['fingerprint']):
+            eventos.put(('fim', camera, {'erro': "Snapshot do modelo indisponível"}))
+            return
+
+    recognizer = FaceRecognizer(
+        model,
+        rastreamento=config['rastreamento'],
+        intervalo_deteccao=config['intervalo_deteccao'],
+        detectar_movimento=config['detectar_movimento']
+    )
+
+    if anel is not None:
+        # Frames do processo de captura, lidos da memória compartilhada sem cópia
+        try:
+            descricao = anel.get(timeout=config['timeout_captura'])
+        except queue.Empty:
+            descricao = {'erro': "Processo de captura não respondeu"}
+        if 'erro' in descricao:
+            eventos.put(('fim', camera, {'erro': descricao['erro']}))
+            return
+        source = SharedRingSource(descricao)
+    else:
+        source = open_source(fonte, config['tempo_real'])
+    try:
+        source.start()
+    except RuntimeError as e:
+        eventos.put(('fim', camera, {'erro': str(e)}))
+        return
+
+    def persistir(deteccao):
+        # Apenas o necessário para o registro atravessa a fila entre processos
+        eventos.put(('evento', camera, {
+            'pessoa_id': int(deteccao['pessoa_id']),
+            'confianca': float(deteccao['confianca']),
+            'ocorrencias': deteccao.get('ocorrencias', 1),
+            'inicio': deteccao.get('inicio'),
+            'fim': deteccao.get('fim')
+        }))
+
+    pipeline = MonitoringPipeline(
+        source, recognizer.criar_processador, persistir,
+        # O rastreador depende da ordem dos frames: um único worker
+        num_workers=1 if config['rastreamento'] else config['num_workers'],
+        descartar_frames=source.live or config['tempo_real'],
+        janela_eventos=config['janela_eventos']
+    )
+    pipeline.start()
+    try:
+        ultimo_stats = time.monotonic()
+        while pipeline.running and not parar.is_set():
+            time.sleep(0.1)
+            if time.monotonic() - ultimo_stats >= config['intervalo_stats']:
+                eventos.put(('stats', camera, pipeline.stats()))
+                ultimo_stats = time.monotonic()
+    finally:
+        pipeline.stop()
+        source.release()
+
+    stats = pipeline.stats()
+    stats['erro'] = pipeline.erro
+    if anel is not None:
+        stats['frames_perdidos_buffer'] = source.frames_perdidos
+    eventos.put(('fim', camera, stats))
+
+class MultiCameraMonitor:
+    """
+    Monitoramento de várias fontes de frames, um processo por fonte. A galeria
+    é carregada uma vez no processo principal e os reconhecimentos de todas as
+    câmeras são gravados no banco por uma única thread.
+    """
+
+    def __init__(self, fontes, database, model, snapshot_dir="modelos", motor="opencv",
+                 tempo_real=True, rastreamento=False, intervalo_deteccao=5,
+                 detectar_movimento=False, num_workers=1, intervalo_stats=1.0,
+                 captura_separada=False, slots=8, janela_eventos=10.0):
+        """
+        fontes: especificações aceitas por hardware.open_source (uma por câmera).
+        model: modelo já treinado ou carregado do snapshot (ver carregar_ou_treinar).
+        num_workers: threads de detecção/reconhecimento por câmera.
+        captura_separada: a captura de cada câmera roda em outro processo e entrega
+            os frames por um SharedFrameRing de slots posições.
+        janela_eventos: segundos para agrupar reconhecimentos repetidos da mesma
+            pessoa em um único registro (0 grava cada detecção).
+        """
+        self.fontes = list(fontes)
+        self.database = database
+        self.model = model
+        self.config = {
+            'motor': motor,
+            'snapshot_dir': snapshot_dir,
+            'fingerprint': model.fingerprint(database.listar_faces_treinamento()),
+            'tempo_real': tempo_real,
+            'rastreamento': rastreamento,
+            'intervalo_deteccao': intervalo_deteccao,
+            'detectar_movimento': detectar_movimento,
+            'num_workers': num_workers,
+            'intervalo_stats': intervalo_stats,
+            'slots': slots,
+            'janela_eventos': janela_eventos,
+            'timeout_captura': 10.0
+        }
+        self.captura_separada = captura_separada
+
+        # fork compartilha a galeria já carregada; spawn é o padrão fora do Linux
+        metodo = "fork" if "fork" in mp.get_all_start_methods() else "spawn"
+        self._ctx = mp.get_context(metodo)
+        self._eventos = self._ctx.Queue()
+        self._parar = self._ctx.Event()
+        self._processos = []
+        self._capturas = []  # Processos de captura (modo captura_separada)
+        self._escritor = None
+        self._lock = threading.Lock()
+        self._encerradas = set()
+
+        # Estatísticas por câmera (atualizadas pela thread de escrita)
+        self.stats = {
+            camera: {
+                'fonte': str(fonte) if isinstance(fonte, (str, int)) else type(fonte).__name__,
+                'eventos': 0
+            }
+            for camera, fonte in enumerate(self.fontes)
+        }
+
+    def start(self):
+        """Inicia um processo por câmera e a thread de escrita no banco"""
+        global _MODELO
+        if not self.model.trained:
+            raise ValueError("Modelo ainda não foi treinado")
+
+        _MODELO = self.model
+        try:
+            for camera, fonte in enumerate(self.fontes):
+                anel = consumido = None
+                if self.captura_separada:
+                    anel = self._ctx.Queue()
+                    consumido = self._ctx.Event()
+                    captura = self._ctx.Process(
+                        target=_processo_captura,
+                        args=(camera, fonte, self.config, anel, consumido, self._parar),
+                        name=f"captura-{camera}", daemon=True
+                    )
+                    captura.start()
+                    self._capturas.append(captura)
+                processo = self._ctx.Process(
+                    target=_processo_camera,
+                    args=(camera, fonte, self.config, self._eventos, self._parar, anel, consumido),
+                    name=f"camera-{camera}", daemon=True
+                )
+                processo.start()
+                self._processos.append(processo)
+        finally:
+            _MODELO = None
+
+        # A thread só é criada depois do fork, para que os filhos não herdem locks em uso
+        self._escritor = threading.Thread(target=self._escrever, name="escritor", daemon=True)
+        self._escritor.start()
+
+    def _escrever(self):
+        """Única thread que grava no banco: consome eventos e estatísticas das câmeras"""
+        while True:
+            mensagem = self._eventos.get()
+            if mensagem is None:
+                break
+            tipo, camera, dados = mensagem
+
+            if tipo == 'evento':
+                try:
+                    pessoa = self.database.registrar_reconhecimento(
+                        dados['pessoa_id'], dados['confianca'], "monitoramento.png",
+                        dados['ocorrencias'], dados['inicio'], dados['fim'], camera
+                    )
+                except Exception as e:
+                    print(f"Erro ao registrar reconhecimento: {e}")
+                    continue
+                with self._lock:
+                    self.stats[camera]['eventos'] += 1
+                if pessoa:
+                    print(f"[câmera {camera}] Pessoa identificada: {pessoa['nome']} "
+                          f"(confiança: {dados['confianca']:.2f}%, {dados['ocorrencias']} detecções)")
+            elif tipo == 'stats':
+                with self._lock:
+                    self.stats[camera].update(dados)
+            elif tipo == 'fim':
+                with self._lock:
+                    self.stats[camera].update(dados)
+                    self._encerradas.add(camera)
+                if dados.get('erro'):
+                    print(f"[câmera {camera}] {dados['erro']}")
+
+    @property
+    def running(self):
+        """Indica se alguma câmera ainda está ativa"""
+        with self._lock:
+            encerradas = len(self._encerradas)
+        return encerradas < len(self._processos) and any(p.is_alive() for p in self._processos)
+
+    def stop(self, timeout=5.0):
+        """Encerra as câmeras, aguarda os processos e esvazia a fila de eventos"""
+        self._parar.set()
+        limite = time.monotonic() + timeout
+        processos = self._processos + self._capturas
+        for processo in processos:
+            processo.join(max(0.0, limite - time.monotonic()))
+        for processo in processos:
+            if processo.is_alive():
+                print(f"Processo {processo.name} não encerrou a tempo; finalizando")
+                processo.terminate()
+                processo.join(1.0)
+
+        # Os eventos enviados antes do encerramento ainda são gravados
+        if self._escritor is not None:
+            self._eventos.put(None)
+            self._escritor.join()
+            self._escritor = None
+        self._processos = []
+        self._capturas = []
+        self.database.sincronizar()
+
+    def resumo(self):
+        """Cópia das estatísticas por câmera"""
+        with self._lock:
+            return {camera: dict(dados) for camera, dados in self.stats.items()}
+
+    def imprimir_resumo(self):
+        """Mostra fps, latência, descartes e eventos de cada câmera"""
+        for camera, d in self.resumo().items():
+            print(f"  câmera {camera} ({d['fonte']}): "
+                  f"{d.get('fps_processados', 0.0):6.1f} fps  "
+                  f"latência média {d.get('latencia_media_ms', 0.0):7.1f} ms  "
+                  f"p95 {d.get('latencia_p95_ms', 0.0):7.1f} ms  "
+                  f"descartados {d.get('frames_descartados', 0):6d}  "
+                  f"sobrescritos {d.get('frames_sobrescritos', 0):6d}  "
+                  f"eventos {d['eventos']}")
+
+def _interromper(signum, frame):
+    raise KeyboardInterrupt
+
+def main():
+    """Monitora várias fontes em paralelo (headless)"""
+    parser = argparse.ArgumentParser(description="Monitoramento de várias câmeras, um processo por fonte")
+    parser.add_argument("--fontes", nargs="+", required=True,
+                        help="Fontes de frames (índice da webcam, vídeo, URL, diretório ou sintetico[:N])")
+    parser.add_argument("--banco", choices=["json", "sqlite"], default="json",
+                        help="Backend de armazenamento (padrão: json)")
+    parser.add_argument("--db", default="faces.db", help="Arquivo do banco SQLite")
+    parser.add_argument("--motor", choices=["opencv", "numpy", "mapeado"], default="opencv",
+                        help="Motor LBPH (padrão: opencv)")
+    parser.add_argument("--velocidade-maxima", action="store_true",
+                        help="Não respeitar o fps de fontes gravadas")
+    parser.add_argument("--rastrear", action="store_true",
+                        help="Modo detectar-e-rastrear em cada câmera")
+    parser.add_argument("--intervalo-deteccao", type=int, default=5,
+                        help="Frames entre detecções completas no modo --rastrear (padrão: 5)")
+    parser.add_argument("--detectar-movimento", action="store_true",
+                        help="Detectar faces apenas em regiões com movimento")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Threads de detecção/reconhecimento por câmera (padrão: 1)")
+    parser.add_argument("--captura-separada", action="store_true",
+                        help="Capturar cada fonte em um processo próprio, com frames em memória compartilhada")
+    parser.add_argument("--duracao", type=float, default=None,
+                        help="Encerrar após N segundos (padrão: até as fontes terminarem ou Ctrl+C)")
+    parser.add_argument("--janela-eventos", type=float, default=10.0,
+                        help="Segundos para agrupar reconhecimentos repetidos da mesma pessoa "
+                             "em um único registro; 0 grava cada detecção (padrão: 10)")
+    parser.add_argument("--intervalo-stats", type=float, default=5.0,
+                        help="Segundos entre os resumos por câmera (padrão: 5)")
+    args = parser.parse_args()
+
+    database = SQLiteFaceDatabase(args.db) if args.banco == "sqlite" else FaceDatabase()
+    snapshot_dir = "modelos"
+    model = criar_modelo(args.motor, snapshot_dir)
+    origem, total = carregar_ou_treinar(model, database, snapshot_dir)
+    if origem is None:
+        print("Erro: Nenhuma face cadastrada para reconhecimento")
+        database.fechar()
+        return
+    print(f"Modelo {'carregado do snapshot' if origem == 'snapshot' else 'treinado'} ({total} faces)")
+
+    monitor = MultiCameraMonitor(
+        args.fontes, database, model,
+        snapshot_dir=snapshot_dir,
+        motor=args.motor,
+        tempo_real=not args.velocidade_maxima,
+        rastreamento=args.rastrear,
+        intervalo_deteccao=args.intervalo_deteccao,
+        detectar_movimento=args.detectar_movimento,
+        num_workers=args.workers,
+        intervalo_stats=min(1.0, args.intervalo_stats),
+        captura_separada=args.captura_separada,
+        janela_eventos=args.janela_eventos
+    )
+
+    # SIGTERM (ex.: serviço do sistema) encerra como Ctrl+C
+    signal.signal(signal.SIGTERM, _interromper)
+
+    inicio = time.monotonic()
+    ultimo_resumo = inicio
+    monitor.start()
+    print(f"Monitorando {len(args.fontes)} fontes. Pressione Ctrl+C para encerrar.")
+    try:
+        while monitor.running:
+            time.sleep(0.2)
+            agora = time.monotonic()
+            if args.duracao is not None and agora - inicio >= args.duracao:
+                break
+            if agora - ultimo_resumo >= args.intervalo_stats:
+                print("\nResumo por câmera:")
+                monitor.imprimir_resumo()
+                ultimo_resumo = agora
+    except KeyboardInterrupt:
+        print("\nEncerrando...")
+    finally:
+        monitor.stop()
+
+    print("\nResumo final por câmera:")
+    monitor.imprimir_resumo()
+    database.fechar()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import queue
+import threading
+import time
+from debounce import RecognitionCoalescer
+
+class MonitoringPipeline:
+    """
+    Pipeline de monitoramento em estágios:
+    captura -> fila limitada -> workers (detecção/qualidade/reconhecimento) -> persistência.
+    Sob carga, os frames mais antigos são descartados em vez de acumular latência.
+    """
+
+    def __init__(self, source, criar_processador, persistir, num_workers=2,
+                 tamanho_fila=2, tamanho_fila_eventos=64, descartar_frames=True,
+                 janela_eventos=0.0, duracao_maxima_evento=300.0):
+        """
+        source: FrameSource (hardware.py), com read() -> (ret, frame) e o atributo ended.
+        criar_processador: fábrica chamada uma vez por worker; retorna uma função
+            frame -> lista de detecções (dicts com 'bbox', 'pessoa_id', 'confianca', 'reconhecido').
+        persistir: função chamada no estágio de persistência para cada detecção reconhecida
+            (exceto as marcadas com 'evento': False, ex.: faces já reconhecidas de um track);
+            seu retorno (se não for None) fica disponível em get_event().
+        descartar_frames: se False, a captura espera espaço na fila em vez de descartar
+            (útil para processar todos os frames de uma fonte gravada).
+        janela_eventos: se > 0, detecções repetidas da mesma pessoa são agrupadas
+            (RecognitionCoalescer) e persistir recebe um evento por grupo, com
+            'ocorrencias', 'inicio' e 'fim', quando a janela fecha.
+        """
+        self.source = source
+        self.criar_processador = criar_processador
+        self.persistir = persistir
+        self.num_workers = num_workers
+        self.descartar_frames = descartar_frames
+        self.coalescer = RecognitionCoalescer(janela_eventos, duracao_maxima_evento) if janela_eventos > 0 else None
+
+        self._frames = queue.Queue(maxsize=tamanho_fila)
+        self._eventos = queue.Queue(maxsize=tamanho_fila_eventos)
+        self._persistidos = queue.Queue()
+        self._stop = threading.Event()  # Encerramento solicitado
+        self._captura_encerrada = threading.Event()  # Fonte sem mais frames
+        self._workers_ativos = 0
+        self._threads = []
+        self._lock = threading.Lock()
+        self._latest = None  # (seq, frame, detecções) do frame processado mais recente
+        self.erro = None
+
+        # Contadores
+        self.frames_capturados = 0
+        self.frames_descartados = 0
+        self.frames_processados = 0
+        self.frames_sobrescritos = 0  # Sobrescritos pela fonte durante o processamento
+        self.faces_detectadas = 0
+        self.eventos_persistidos = 0
+        self._latencias = []
+        self._inicio = None
+
+    def start(self):
+        """Inicia as threads de captura, workers e persistência"""
+        self._inicio = time.monotonic()
+        self._workers_ativos = self.num_workers
+        self._threads = [threading.Thread(target=self._captura, name="captura", daemon=True)]
+        for i in range(self.num_workers):
+            self._threads.append(threading.Thread(target=self._worker, name=f"worker-{i}", daemon=True))
+        self._threads.append(threading.Thread(target=self._persistencia, name="persistencia", daemon=True))
+        for t in self._threads:
+            t.start()
+
+    def stop(self, timeout=2.0):
+        """Sinaliza o encerramento e aguarda as threads (a persistência esvazia sua fila)"""
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    @property
+    def running(self):
+        """Indica se o pipeline ainda está processando (não encerrado e com frames a tratar)"""
+        return not self._stop.is_set() and any(t.is_alive() for t in self._threads)
+
+    def _captura(self):
+        """Lê frames continuamente, mantendo na fila apenas os mais recentes"""
+        seq = 0
+        while not self._stop.is_set():
+            ret, frame = self.source.read()
+            if not ret:
+                if not self.source.ended:
+                    self.erro = "Erro ao capturar frame da câmera"
+                break
+
+            seq += 1
+            item = (seq, time.monotonic(), frame, self.source.marca_frame())
+            with self._lock:
+                self.frames_capturados += 1
+
+            if not self.descartar_frames:
+                while not self._stop.is_set():
+                    try:
+                        self._frames.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                continue
+
+            # Fila cheia: descarta o frame mais antigo para abrir espaço ao novo
+            while True:
+                try:
+                    self._frames.put_nowait(item)
+                    break
+                except queue.Full:
+                    try:
+                        self._frames.get_nowait()
+                        with self._lock:
+                            self.frames_descartados += 1
+                    except queue.Empty:
+                        pass
+        
+        # Os workers terminam de processar o que já está na fila
+        self._captura_encerrada.set()
+
+    def _worker(self):
+        """Detecta e reconhece faces; a detecção do OpenCV libera o GIL"""
+        try:
+            self._processar_frames(self.criar_processador())
+        finally:
+            with self._lock:
+                self._workers_ativos -= 1
+
+    def _processar_frames(self, processar):
+        """Laço de um worker: consome a fila de frames até o encerramento"""
+        while not self._stop.is_set():
+            try:
+                seq, capturado_em, frame, marca = self._frames.get(timeout=0.1)
+            except queue.Empty:
+                if self._captura_encerrada.is_set():
+                    break
+                continue
+
+            try:
+                deteccoes = processar(frame)
+            except Exception as e:
+                print(f"Erro no processamento: {e}")
+                continue
+
+            # Frames em memória compartilhada (SharedRingSource) podem ter sido
+            # sobrescritos pelo produtor durante a detecção: resultado descartado
+            if marca is not None and not self.source.frame_intacto(marca):
+                with self._lock:
+                    self.frames_sobrescritos += 1
+                continue
+
+            latencia = time.monotonic() - capturado_em
+            with self._lock:
+                self.frames_processados += 1
+                self.faces_detectadas += len(deteccoes)
+                self._latencias.append(latencia)
+                if len(self._latencias) > 1000:
+                    del self._latencias[:500]
+                if self._latest is None or seq > self._latest[0]:
+                    self._latest = (seq, frame, deteccoes)
+
+            # Bloqueia se a persistência estiver atrasada: a pressão volta para
+            # a fila de frames, que descarta os mais antigos
+            for deteccao in deteccoes:
+                if deteccao['reconhecido'] and deteccao.get('evento', True):
+                    while True:
+                        try:
+                            self._eventos.put(deteccao, timeout=0.1)
+                            break
+                        except queue.Full:
+                            if self._stop.is_set():
+                                break
+
+    def _persistencia(self):
+        """Grava os reconhecimentos em uma única thread"""
+        while True:
+            try:
+                deteccao = self._eventos.get(timeout=0.1)
+            except queue.Empty:
+                if self.coalescer is not None:
+                    self._persistir_eventos(self.coalescer.vencidos())
+                # Fila vazia: termina após o encerramento ou quando os workers acabarem
+                with self._lock:
+                    workers_ativos = self._workers_ativos
+                if self._stop.is_set() or (workers_ativos == 0 and self._eventos.empty()):
+                    break
+                continue
+
+            if self.coalescer is None:
+                self._persistir_eventos([deteccao])
+                continue
+
+            self.coalescer.adicionar(deteccao)
+            self._persistir_eventos(self.coalescer.vencidos())
+
+        # Eventos ainda abertos são gravados no encerramento
+        if self.coalescer is not None:
+            self._persistir_eventos(self.coalescer.encerrar())
+
+    def _persistir_eventos(self, eventos):
+        for evento in eventos:
+            try:
+                resultado = self.persistir(evento)
+            except Exception as e:
+                print(f"Erro ao registrar reconhecimento: {e}")
+                continue
+
+            with self._lock:
+                self.eventos_persistidos += 1
+            if resultado is not None:
+                self._persistidos.put(resultado)
+
+    def latest_result(self):
+        """Retorna (frame, detecções) do frame processado mais recente, ou None"""
+        with self._lock:
+            if self._latest is None:
+                return None
+            return self._latest[1], self._latest[2]
+
+    def get_event(self, timeout=0):
+        """Retorna o próximo resultado do estágio de persistência, ou None"""
+        try:
+            return self._persistidos.get(timeout=timeout) if timeout else self._persistidos.get_nowait()
+        except queue.Empty:
+            return None
+
+    def stats(self):
+        """Contadores e latência (captura -> fim do processamento) do pipeline"""
+        with self._lock:
+            latencias = sorted(self._latencias)
+            decorrido = time.monotonic() - self._inicio if self._inicio else 0
+            return {
+                'frames_capturados': self.frames_capturados,
+                'frames_descartados': self.frames_descartados,
+                'frames_processados': self.frames_processados,
+                'frames_sobrescritos': self.frames_sobrescritos,
+                'faces_detectadas': self.faces_detectadas,
+                'eventos_persistidos': self.eventos_persistidos,
+                'deteccoes_agrupadas': self.coalescer.recebidos if self.coalescer is not None else 0,
+                'fps_processados': self.frames_processados / decorrido if decorrido else 0.0,
+                'latencia_media_ms': 1000 * sum(latencias) / len(latencias) if latencias else 0.0,
+                'latencia_p95_ms': 1000 * latencias[int(0.95 * (len(latencias) - 1))] if latencias else 0.0
+            }
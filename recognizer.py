@@ -0,0 +1,146 @@
+import os
+import cv2
+from quality_check import FaceQualityChecker
+from face_detection import FaceDetector
+from tracking import FaceTracker
+from face_store import FaceStore
+from model import LBPHModel
+from lbph_numpy import NumpyLBPHModel
+from gallery import MappedLBPHModel
+
+def criar_modelo(motor, snapshot_dir="modelos"):
+    """Cria o modelo LBPH do motor informado ('opencv', 'numpy' ou 'mapeado')"""
+    if motor == "mapeado":
+        # Galeria em arquivos mapeados, ao lado do snapshot
+        return MappedLBPHModel(os.path.join(snapshot_dir, "galeria"))
+    return NumpyLBPHModel() if motor == "numpy" else LBPHModel()
+
+def carregar_ou_treinar(model, database, snapshot_dir, face_store=None):
+    """
+    Carrega o snapshot do modelo se a impressão digital do conjunto de treino
+    coincidir; caso contrário treina com as faces pré-processadas do FaceStore
+    (snapshot_dir/faces.pack) e salva o snapshot.
+    Retorna ('snapshot' | 'treinado' | None, número de faces).
+    """
+    entradas = database.listar_faces_treinamento()
+    fingerprint = model.fingerprint(entradas)
+    if entradas and model.load_snapshot(snapshot_dir, fingerprint):
+        database.marcar_faces_carregadas(entradas)
+        return 'snapshot', len(entradas)
+
+    if face_store is None:
+        face_store = FaceStore(os.path.join(snapshot_dir, "faces.pack"))
+    faces, labels = face_store.carregar(entradas, model)
+    database.marcar_faces_carregadas(entradas)
+    if not len(faces):
+        return None, 0
+    model.train_processed(faces, labels)
+    model.save_snapshot(snapshot_dir, fingerprint)
+    return 'treinado', len(faces)
+
+class FaceRecognizer:
+    """
+    Detecção, verificação de qualidade e reconhecimento de faces em frames.
+    criar_processador() é a fábrica usada por MonitoringPipeline: cada worker
+    recebe seu próprio detector (o classificador do OpenCV não é thread-safe).
+    """
+
+    def __init__(self, model, quality_checker=None, rastreamento=False, intervalo_deteccao=5,
+                 detectar_movimento=False, logger=None):
+        self.model = model
+        self.quality_checker = quality_checker if quality_checker is not None else FaceQualityChecker()
+        self.rastreamento = rastreamento  # Detecção completa apenas a cada intervalo_deteccao frames
+        self.intervalo_deteccao = intervalo_deteccao
+        self.detectar_movimento = detectar_movimento
+        self.logger = logger
+
+    @staticmethod
+    def reconhecido(pessoa_id, confianca):
+        """Critério de reconhecimento usado no monitoramento"""
+        return pessoa_id != -1 and confianca >= 80
+
+    def criar_processador(self):
+        """Cria a função frame -> detecções de um worker do pipeline"""
+        detectar = self.criar_detector()
+
+        if self.rastreamento:
+            return self._criar_processador_rastreamento(detectar)
+
+        def processar(frame):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            faces = detectar(gray)
+
+            deteccoes = []
+            for bbox, pessoa_id, confianca in self.reconhecer(gray, faces):
+                deteccoes.append({
+                    'bbox': bbox,
+                    'pessoa_id': pessoa_id,
+                    'confianca': confianca,
+                    'reconhecido': self.reconhecido(pessoa_id, confianca)
+                })
+            return deteccoes
+
+        return processar
+
+    def criar_detector(self):
+        """Cria a função de detecção de faces (gray -> lista de (x, y, w, h)) de um worker"""
+        # Faces fora dos limites de qualidade seriam descartadas, então nem são procuradas
+        face_detector = FaceDetector(
+            min_face_size=self.quality_checker.min_face_size,
+            max_face_size=self.quality_checker.max_face_size,
+            usar_movimento=self.detectar_movimento
+        )
+        return face_detector.detect_gray
+
+    def _criar_processador_rastreamento(self, detectar):
+        """Processador do modo detectar-e-rastrear: detecção completa só a cada N frames"""
+        tracker = FaceTracker(detectar, intervalo_deteccao=self.intervalo_deteccao)
+
+        def processar(frame):
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            tracks = tracker.update(gray)
+
+            # Reconhecer apenas faces novas ou ainda não reconhecidas; as demais
+            # mantêm a identidade do track sem nova predição
+            pendentes = {t.bbox: t for t in tracks if t.precisa_reconhecimento}
+            novos = set()
+            for bbox, pessoa_id, confianca in self.reconhecer(gray, list(pendentes)):
+                track = pendentes[bbox]
+                if tracker.identificar(track, pessoa_id, confianca, self.reconhecido(pessoa_id, confianca)):
+                    novos.add(track.id)
+
+            return [{
+                'bbox': t.bbox,
+                'pessoa_id': t.pessoa_id if t.pessoa_id is not None else -1,
+                'confianca': t.confianca,
+                'reconhecido': t.reconhecido,
+                'track_id': t.id,
+                # Um reconhecimento é persistido uma vez por track
+                'evento': t.id in novos
+            } for t in tracks]
+
+        return processar
+
+    def reconhecer(self, gray, faces):
+        """Verifica a qualidade e prevê as faces (x, y, w, h); retorna (bbox, pessoa_id, confiança)"""
+        # Selecionar faces com qualidade suficiente
+        faces_validas = []
+        coordenadas = []
+        for (x, y, w, h) in faces:
+            face_region = gray[y:y+h, x:x+w]
+
+            # Verificar qualidade
+            try:
+                quality_msg = self.quality_checker.check_quality(face_region, (x, y, w, h))
+                if quality_msg == "OK":
+                    faces_validas.append(face_region)
+                    coordenadas.append((x, y, w, h))
+            except Exception as e:
+                if self.logger is not None:
+                    self.logger.error(f"Erro no processamento: {e}")
+                print(f"Erro no processamento: {e}")
+
+        # Prever todas as pessoas do frame em uma única chamada
+        predicoes = self.model.predict_batch(faces_validas) if faces_validas else []
+        return [(bbox, pessoa_id, confianca)
+                for bbox, (pessoa_id, confianca) in zip(coordenadas, predicoes)]
@@ -0,0 +1,131 @@
+import os
+import csv
+import json
+import argparse
+from datetime import datetime
+from database import FaceDatabase
+from database_sqlite import SQLiteFaceDatabase
+
+CAMPOS = ['pessoa_id', 'nome', 'cpf', 'email', 'confianca', 'face_path', 'data_hora',
+          'ocorrencias', 'inicio', 'fim', 'camera']
+
+class TxtReportWriter:
+    """Relatório legível (formato original do sistema)"""
+    extensao = "txt"
+
+    def __init__(self, f, data_inicio, data_fim):
+        self.f = f
+        f.write("="*50 + "\n")
+        f.write("RELATÓRIO DE RECONHECIMENTOS".center(50) + "\n")
+        f.write("="*50 + "\n\n")
+        f.write(f"Período: {data_inicio} a {data_fim}\n")
+        f.write(f"Data de geração: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
+        self.total = 0
+
+    def escrever(self, r):
+        if self.total == 0:
+            self.f.write("Reconhecimentos encontrados:\n")
+        self.total += 1
+        self.f.write("\n" + "-"*30 + "\n")
+        self.f.write(f"Nome: {r['nome']}\n")
+        self.f.write(f"CPF: {r['cpf']}\n")
+        self.f.write(f"E-mail: {r['email']}\n")
+        self.f.write(f"Data/Hora: {r['data_hora']}\n")
+        self.f.write(f"Confiança: {r['confianca']:.2f}%\n")
+
+    def finalizar(self):
+        if self.total == 0:
+            self.f.write("\nNenhum reconhecimento encontrado no período")
+
+class CsvReportWriter:
+    """Uma linha por reconhecimento, com cabeçalho"""
+    extensao = "csv"
+
+    def __init__(self, f, data_inicio, data_fim):
+        self.writer = csv.DictWriter(f, fieldnames=CAMPOS, extrasaction='ignore')
+        self.writer.writeheader()
+        self.total = 0
+
+    def escrever(self, r):
+        self.total += 1
+        self.writer.writerow(r)
+
+    def finalizar(self):
+        pass
+
+class JsonlReportWriter:
+    """Um objeto JSON por linha"""
+    extensao = "jsonl"
+
+    def __init__(self, f, data_inicio, data_fim):
+        self.f = f
+        self.total = 0
+
+    def escrever(self, r):
+        self.total += 1
+        self.f.write(json.dumps({c: r.get(c) for c in CAMPOS}, ensure_ascii=False) + "\n")
+
+    def finalizar(self):
+        pass
+
+FORMATOS = {
+    'txt': TxtReportWriter,
+    'csv': CsvReportWriter,
+    'jsonl': JsonlReportWriter
+}
+
+def barra_progresso(processados, total):
+    """Exibe o progresso real da leitura (bytes ou linhas processadas)"""
+    percentual = 100 if not total else min(100, processados * 100 // total)
+    barra = "=" * (percentual // 2) + ">" + " " * (50 - (percentual // 2))
+    print(f"\rProgresso: [{barra}] {percentual}%", end="", flush=True)
+
+def gerar_relatorio(database, data_inicio, data_fim, formato="txt", diretorio="relatorios",
+                    progresso=None, ao_escrever=None):
+    """
+    Grava o relatório do período conforme os reconhecimentos são lidos
+    (memória constante). ao_escrever(r) é chamado para cada reconhecimento.
+    Retorna (caminho do arquivo, total de reconhecimentos).
+    """
+    writer_cls = FORMATOS[formato]
+    os.makedirs(diretorio, exist_ok=True)
+    caminho = os.path.join(os.path.abspath(diretorio),
+                           f"relatorio_{data_inicio}_a_{data_fim}.{writer_cls.extensao}")
+
+    # Arquivo temporário: um relatório interrompido não substitui o anterior
+    temp = caminho + ".tmp"
+    try:
+        with open(temp, "w", encoding="utf-8", newline="" if formato == "csv" else None) as f:
+            writer = writer_cls(f, data_inicio, data_fim)
+            for r in database.iterar_reconhecimentos(data_inicio, data_fim, progresso):
+                writer.escrever(r)
+                if ao_escrever is not None:
+                    ao_escrever(r)
+            writer.finalizar()
+    except BaseException:
+        os.remove(temp)
+        raise
+    os.replace(temp, caminho)
+    return caminho, writer.total
+
+def main():
+    """Gera o relatório de um período sem a interface interativa"""
+    parser = argparse.ArgumentParser(description="Relatório de reconhecimentos por período")
+    parser.add_argument("inicio", help="Data inicial (YYYY-MM-DD)")
+    parser.add_argument("fim", help="Data final (YYYY-MM-DD)")
+    parser.add_argument("--formato", choices=sorted(FORMATOS), default="txt", help="Formato (padrão: txt)")
+    parser.add_argument("--banco", choices=["json", "sqlite"], default="json",
+                        help="Backend de armazenamento (padrão: json)")
+    parser.add_argument("--db", default="faces.db", help="Arquivo do banco SQLite")
+    args = parser.parse_args()
+
+    database = SQLiteFaceDatabase(args.db) if args.banco == "sqlite" else FaceDatabase()
+    try:
+        caminho, total = gerar_relatorio(database, args.inicio, args.fim, args.formato,
+                                         progresso=barra_progresso)
+        print(f"\n{total} reconhecimentos | Local do arquivo: {caminho}")
+    finally:
+        database.fechar()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import math
+from datetime import datetime, timedelta
+
+def _resumo_confianca():
+    return {'n': 0, 'soma': 0.0, 'soma_quadrados': 0.0, 'min': None, 'max': None}
+
+def _acumular_confianca(resumo, valor):
+    resumo['n'] += 1
+    resumo['soma'] += valor
+    resumo['soma_quadrados'] += valor * valor
+    resumo['min'] = valor if resumo['min'] is None else min(resumo['min'], valor)
+    resumo['max'] = valor if resumo['max'] is None else max(resumo['max'], valor)
+
+def _estatisticas_confianca(resumo):
+    """Média, desvio padrão, mínimo e máximo a partir das somas acumuladas"""
+    n = resumo['n']
+    if not n:
+        return {'media': None, 'desvio': None, 'min': None, 'max': None}
+    media = resumo['soma'] / n
+    variancia = max(0.0, resumo['soma_quadrados'] / n - media * media)
+    return {'media': media, 'desvio': math.sqrt(variancia), 'min': resumo['min'], 'max': resumo['max']}
+
+class RecognitionRollups:
+    """
+    Agregados dos reconhecimentos mantidos a cada evento: contagem, primeira e
+    última ocorrência, histograma por hora do dia e resumo da confiança por
+    pessoa; visitas por pessoa e por dia; totais gerais. As consultas não
+    percorrem os eventos. aplicadas registra quantas linhas de cada partição do
+    histórico já foram incorporadas (retomada após uma queda).
+    """
+
+    def __init__(self, dados=None):
+        dados = dados or {}
+        self.pessoas = dados.get('pessoas', {})  # id (str) -> agregados da pessoa
+        self.dias = dados.get('dias', {})  # AAAA-MM-DD -> {id (str): visitas}
+        self.horas = dados.get('horas', [0] * 24)
+        self.confianca = dados.get('confianca', _resumo_confianca())
+        self.total = dados.get('total', 0)
+        self.aplicadas = dados.get('aplicadas', {})  # partição -> linhas incorporadas
+        # Partições cujas visitas por dia mudaram desde a última gravação
+        self.alteradas = set(self.aplicadas) if 'dias' in dados else set()
+
+    def para_dict(self):
+        """Agregados gerais; as visitas por dia são gravadas por partição (dias_da_particao)"""
+        return {
+            'pessoas': self.pessoas,
+            'horas': self.horas,
+            'confianca': self.confianca,
+            'total': self.total,
+            'aplicadas': self.aplicadas
+        }
+
+    def dias_da_particao(self, particao):
+        """Visitas por dia dos dias da partição (chave AAAA-MM ou AAAA-MM-DD)"""
+        return {dia: visitas for dia, visitas in self.dias.items() if dia.startswith(particao)}
+
+    def adicionar(self, r, particao=None):
+        """Incorpora um reconhecimento (data_hora no formato AAAA-MM-DD HH:MM:SS)"""
+        data_hora = r['data_hora']
+        dia = data_hora[:10]
+        hora = int(data_hora[11:13])
+        chave = str(r['pessoa_id'])
+        confianca = float(r['confianca'])
+
+        pessoa = self.pessoas.get(chave)
+        if pessoa is None:
+            pessoa = self.pessoas[chave] = {
+                'nome': r.get('nome'),
+                'total': 0,
+                'primeiro': data_hora,
+                'ultimo': data_hora,
+                'horas': [0] * 24,
+                'confianca': _resumo_confianca()
+            }
+        pessoa['total'] += 1
+        pessoa['primeiro'] = min(pessoa['primeiro'], data_hora)
+        pessoa['ultimo'] = max(pessoa['ultimo'], data_hora)
+        pessoa['horas'][hora] += 1
+        _acumular_confianca(pessoa['confianca'], confianca)
+
+        visitas = self.dias.setdefault(dia, {})
+        visitas[chave] = visitas.get(chave, 0) + 1
+        self.horas[hora] += 1
+        _acumular_confianca(self.confianca, confianca)
+        self.total += 1
+        if particao is not None:
+            self.aplicadas[particao] = self.aplicadas.get(particao, 0) + 1
+            self.alteradas.add(particao)
+
+    def resumo_pessoa(self, pessoa_id):
+        """Total, primeira/última ocorrência, horas e confiança de uma pessoa (None se nunca vista)"""
+        pessoa = self.pessoas.get(str(pessoa_id))
+        if pessoa is None:
+            return None
+        return {
+            'pessoa_id': pessoa_id,
+            'nome': pessoa['nome'],
+            'total': pessoa['total'],
+            'primeiro': pessoa['primeiro'],
+            'ultimo': pessoa['ultimo'],
+            'horas': list(pessoa['horas']),
+            'confianca': _estatisticas_confianca(pessoa['confianca'])
+        }
+
+    def visitas_por_dia(self, data_inicio, data_fim, pessoa_id=None):
+        """Reconhecimentos por dia no período (AAAA-MM-DD, inclusive), de todos ou de uma pessoa"""
+        dia = datetime.strptime(data_inicio, "%Y-%m-%d")
+        fim = datetime.strptime(data_fim, "%Y-%m-%d")
+        chave = None if pessoa_id is None else str(pessoa_id)
+        resultado = {}
+        while dia <= fim:
+            texto = dia.strftime("%Y-%m-%d")
+            visitas = self.dias.get(texto, {})
+            resultado[texto] = sum(visitas.values()) if chave is None else visitas.get(chave, 0)
+            dia += timedelta(days=1)
+        return resultado
+
+    def horarios_movimentados(self, n=5):
+        """As n horas do dia com mais reconhecimentos: lista de (hora, total)"""
+        return sorted(enumerate(self.horas), key=lambda h: (-h[1], h[0]))[:n]
+
+    def totais(self):
+        """Total de reconhecimentos, pessoas distintas e confiança geral"""
+        return {
+            'reconhecimentos': self.total,
+            'pessoas': len(self.pessoas),
+            'confianca': _estatisticas_confianca(self.confianca)
+        }
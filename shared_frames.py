@@ -0,0 +1,200 @@
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+from hardware import FrameSource, FrameSourceEnded
+
+# Cabeçalho (int64): último seq publicado, produtor encerrado, reservado,
+# reservado e, em seguida, o seq presente em cada slot
+_ULTIMO, _ENCERRADO, _CAMPOS = 0, 1, 4
+_ALINHAMENTO = 64
+
+class SharedFrameRing:
+    """
+    Buffer circular de frames em multiprocessing.shared_memory, com um único
+    produtor. Cada slot guarda um frame e o número de sequência dele; o produtor
+    sempre sobrescreve o slot mais antigo, e os consumidores recebem views NumPy
+    do próprio slot (sem cópia nem serialização). Durante a escrita o seq do slot
+    fica negativo, de modo que valido(seq) indica se um frame lido continua intacto.
+    """
+
+    def __init__(self, shape, slots=8, dtype=np.uint8, name=None):
+        """Cria um novo buffer (name=None) ou se conecta a um existente pelo nome"""
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+
+        tamanho_frame = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._inicio_frames = -(-(_CAMPOS + slots) * 8 // _ALINHAMENTO) * _ALINHAMENTO
+        self._passo = -(-tamanho_frame // _ALINHAMENTO) * _ALINHAMENTO
+        tamanho = self._inicio_frames + slots * self._passo
+
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=tamanho)
+        else:
+            self.shm = self._anexar(name)
+        self.name = self.shm.name
+
+        self._cabecalho = np.ndarray((_CAMPOS + slots,), dtype=np.int64, buffer=self.shm.buf)
+        self._seqs = self._cabecalho[_CAMPOS:]
+        self._frames = [
+            np.ndarray(self.shape, dtype=self.dtype, buffer=self.shm.buf,
+                       offset=self._inicio_frames + i * self._passo)
+            for i in range(slots)
+        ]
+        if self.owner:
+            self._cabecalho[:] = 0
+
+    @staticmethod
+    def _anexar(name):
+        """Conecta-se ao segmento sem registrá-lo no resource_tracker deste processo"""
+        try:
+            return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=name)
+            # Antes do 3.13 o tracker removeria o segmento quando este processo terminasse
+            resource_tracker.unregister(shm._name, "shared_memory")
+            return shm
+
+    def descricao(self):
+        """Parâmetros para outro processo se conectar (ver de_descricao)"""
+        return {'name': self.name, 'shape': self.shape, 'slots': self.slots, 'dtype': self.dtype.str}
+
+    @classmethod
+    def de_descricao(cls, descricao):
+        return cls(descricao['shape'], descricao['slots'], descricao['dtype'], name=descricao['name'])
+
+    def reservar(self):
+        """Produtor: retorna (seq, view do slot) para o próximo frame, marcando o slot como em escrita"""
+        seq = int(self._cabecalho[_ULTIMO]) + 1
+        slot = seq % self.slots
+        self._seqs[slot] = -seq
+        return seq, self._frames[slot]
+
+    def publicar(self, seq):
+        """Produtor: torna visível o frame escrito no slot reservado"""
+        self._seqs[seq % self.slots] = seq
+        self._cabecalho[_ULTIMO] = seq
+
+    def escrever(self, frame):
+        """Produtor: copia um frame já decodificado para o próximo slot"""
+        seq, slot = self.reservar()
+        slot[...] = frame
+        self.publicar(seq)
+        return seq
+
+    def encerrar(self):
+        """Produtor: sinaliza que não haverá mais frames"""
+        self._cabecalho[_ENCERRADO] = 1
+
+    @property
+    def encerrado(self):
+        return bool(self._cabecalho[_ENCERRADO])
+
+    def ultimo(self):
+        """Seq do frame publicado mais recente (0 se nenhum)"""
+        return int(self._cabecalho[_ULTIMO])
+
+    def ler(self, seq):
+        """
+        View do frame seq, ou None se o slot já foi sobrescrito. O produtor pode
+        sobrescrevê-lo enquanto a view é usada: confira valido(seq) depois.
+        """
+        if seq <= 0 or not self.valido(seq):
+            return None
+        return self._frames[seq % self.slots]
+
+    def valido(self, seq):
+        """Indica se o slot ainda guarda o frame seq (não sobrescrito nem em escrita)"""
+        return int(self._seqs[seq % self.slots]) == seq
+
+    def close(self):
+        """Libera as views e desconecta deste processo"""
+        self._frames = []
+        self._cabecalho = self._seqs = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Ainda há views em uso (ex.: último frame do pipeline); o mapeamento
+            # é liberado quando elas forem coletadas ou o processo terminar
+            pass
+
+    def unlink(self):
+        """Remove o segmento do sistema (apenas o criador)"""
+        if self.owner:
+            self.shm.unlink()
+
+def publicar_frames(source, ring, parar=None):
+    """
+    Produtor: decodifica os frames da fonte diretamente nos slots do buffer até
+    o fim da fonte ou até parar (multiprocessing.Event) ser sinalizado
+    """
+    publicados = 0
+    try:
+        while parar is None or not parar.is_set():
+            seq, slot = ring.reservar()
+            try:
+                source.read_into(slot)
+            except FrameSourceEnded:
+                break
+            except RuntimeError as e:
+                print(f"Erro ao capturar frame: {e}")
+                break
+            ring.publicar(seq)
+            publicados += 1
+    finally:
+        ring.encerrar()
+    return publicados
+
+class SharedRingSource(FrameSource):
+    """
+    Fonte de frames que consome um SharedFrameRing: entrega sempre o frame mais
+    recente como view da memória compartilhada. O buffer precisa de slots
+    suficientes para os frames em processamento (fila do pipeline + workers);
+    frame_intacto(marca_frame()) indica se o produtor o sobrescreveu durante o
+    processamento, caso em que o resultado deve ser descartado.
+    """
+    live = True  # O ritmo é ditado pelo produtor
+
+    def __init__(self, descricao, timeout=5.0, intervalo_espera=0.001):
+        super().__init__()
+        self.descricao = descricao
+        self.timeout = timeout
+        self.intervalo_espera = intervalo_espera
+        self.ring = None
+        self.ultimo_seq = 0
+        self.frames_perdidos = 0  # Frames publicados e sobrescritos antes de serem lidos
+
+    def start(self):
+        self.ring = SharedFrameRing.de_descricao(self.descricao)
+        self.ultimo_seq = 0
+
+    def _read(self):
+        if self.ring is None:
+            raise RuntimeError("Buffer compartilhado não conectado. Chame start() antes.")
+        limite = time.monotonic() + self.timeout
+        while True:
+            seq = self.ring.ultimo()
+            if seq > self.ultimo_seq:
+                frame = self.ring.ler(seq)
+                if frame is not None:
+                    self.frames_perdidos += seq - self.ultimo_seq - 1
+                    self.ultimo_seq = seq
+                    return frame
+            elif self.ring.encerrado:
+                raise FrameSourceEnded("Produtor do buffer compartilhado encerrado")
+            if time.monotonic() > limite:
+                raise RuntimeError("Nenhum frame novo no buffer compartilhado")
+            time.sleep(self.intervalo_espera)
+
+    def marca_frame(self):
+        return self.ultimo_seq
+
+    def frame_intacto(self, marca):
+        ring = self.ring
+        return ring is not None and ring.valido(marca)
+
+    def release(self):
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
@@ -1,18 +1,19 @@
 import os
 import time
+import argparse
 from datetime import datetime
-from hardware import Webcam
+from hardware import open_source
 from processing import to_grayscale, resize, equalize
 from model import LBPHModel
 from evaluation import run_tests
 from logger import log_metrics, save_screenshot
 import cv2
 
-def testar_webcam():
-    """Testa a captura de frames da webcam"""
+def testar_webcam(fonte=0):
+    """Testa a captura de frames da webcam (ou de outra fonte de frames)"""
     print("\n=== Testando Webcam ===")
     try:
-        webcam = Webcam()
+        webcam = open_source(fonte)
         webcam.start()
         print("Webcam iniciada com sucesso")
         
@@ -53,12 +54,12 @@ def testar_webcam():
         print(f"Erro ao testar webcam: {e}")
         return False
 
-def testar_preprocessamento():
+def testar_preprocessamento(fonte=0):
     """Testa as funções de pré-processamento"""
     print("\n=== Testando Pré-processamento ===")
     try:
         # Capturar uma imagem real da webcam
-        webcam = Webcam()
+        webcam = open_source(fonte)
         webcam.start()
         frame = webcam.read_frame()
         webcam.release()
@@ -155,11 +156,16 @@ def gerar_relatorio(resultados):
 
 def main():
     """Função principal que executa todos os testes"""
+    parser = argparse.ArgumentParser(description="Testes do sistema de reconhecimento facial")
+    parser.add_argument("--fonte", default="0",
+                        help="Fonte de frames: índice da webcam, vídeo, URL, diretório de imagens ou sintetico[:N]")
+    args = parser.parse_args()
+    
     print("Iniciando testes...")
     
     resultados = {
-        "Webcam": testar_webcam(),
-        "Pré-processamento": testar_preprocessamento(),
+        "Webcam": testar_webcam(args.fonte),
+        "Pré-processamento": testar_preprocessamento(args.fonte),
         "Modelo LBPH": testar_modelo(),
         "Avaliação": testar_avaliacao()
     }
@@ -0,0 +1,182 @@
+import sys
+import itertools
+import cv2
+import numpy as np
+
+def iou_matrix(a, b):
+    """IoU entre todas as caixas (x, y, w, h) de a e de b, como matriz (len(a), len(b))"""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    ax1, ay1 = a[:, 0, None], a[:, 1, None]
+    ax2, ay2 = ax1 + a[:, 2, None], ay1 + a[:, 3, None]
+    bx1, by1 = b[None, :, 0], b[None, :, 1]
+    bx2, by2 = bx1 + b[None, :, 2], by1 + b[None, :, 3]
+
+    inter_w = np.clip(np.minimum(ax2, bx2) - np.maximum(ax1, bx1), 0, None)
+    inter_h = np.clip(np.minimum(ay2, by2) - np.maximum(ay1, by1), 0, None)
+    inter = inter_w * inter_h
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0)
+
+class Track:
+    """Face acompanhada entre detecções, com id estável e a última identidade reconhecida"""
+    _ids = itertools.count(1)
+
+    def __init__(self, bbox):
+        self.id = next(Track._ids)
+        self.bbox = bbox
+        self.score = 1.0  # Correlação do último passo de rastreamento
+        self.detectado = True  # bbox veio de uma detecção completa neste frame
+        self.perdas = 0  # Detecções completas consecutivas sem esta face
+        self.pessoa_id = None  # None: ainda não passou pelo reconhecimento
+        self.confianca = sys.float_info.max
+        self.reconhecido = False
+        self.template = None
+
+    @property
+    def precisa_reconhecimento(self):
+        """Faces novas ou ainda não reconhecidas, com bbox vinda de uma detecção"""
+        return self.detectado and not self.reconhecido
+
+class FaceTracker:
+    """
+    Modo detectar-e-rastrear: a detecção completa (cara) roda apenas a cada
+    intervalo_deteccao frames ou quando o rastreamento perde confiança; nos
+    demais frames as faces são seguidas por template matching em uma janela de
+    busca reduzida ao redor da última posição.
+    """
+
+    def __init__(self, detectar, intervalo_deteccao=5, confianca_minima=0.6, margem_busca=0.5,
+                 escala=0.5, iou_associacao=0.3, max_perdas=2):
+        """
+        detectar: função gray -> lista de (x, y, w, h) (ex.: detectMultiScale).
+        escala: fator de redução da imagem usada no template matching.
+        max_perdas: detecções completas seguidas sem a face antes de descartar o track
+            (o Haar cascade falha em frames isolados).
+        """
+        self.detectar = detectar
+        self.intervalo_deteccao = intervalo_deteccao
+        self.confianca_minima = confianca_minima
+        self.margem_busca = margem_busca
+        self.escala = escala
+        self.iou_associacao = iou_associacao
+        self.max_perdas = max_perdas
+        self.tracks = []
+        self._desde_deteccao = None  # Frames desde a última detecção completa
+
+        # Contadores
+        self.frames = 0
+        self.deteccoes = 0
+
+    def _reduzir(self, gray):
+        """Imagem reduzida usada nos templates"""
+        if self.escala == 1:
+            return gray
+        return cv2.resize(gray, None, fx=self.escala, fy=self.escala, interpolation=cv2.INTER_AREA)
+
+    def _recortar_template(self, track, small):
+        """Atualiza o template do track a partir da bbox atual"""
+        x, y, w, h = (int(round(v * self.escala)) for v in track.bbox)
+        template = small[max(0, y):y + h, max(0, x):x + w]
+        track.template = template.copy() if template.size and min(template.shape) >= 4 else None
+
+    def _rastrear(self, track, small):
+        """Procura o template do track na janela de busca; atualiza bbox e score"""
+        track.detectado = False
+        if track.template is None:
+            track.score = 0.0
+            return
+
+        th, tw = track.template.shape
+        x, y = (int(round(v * self.escala)) for v in track.bbox[:2])
+        mx, my = int(tw * self.margem_busca) + 1, int(th * self.margem_busca) + 1
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(small.shape[1], x + tw + mx), min(small.shape[0], y + th + my)
+        regiao = small[y0:y1, x0:x1]
+        if regiao.shape[0] < th or regiao.shape[1] < tw:
+            track.score = 0.0
+            return
+
+        resultado = cv2.matchTemplate(regiao, track.template, cv2.TM_CCOEFF_NORMED)
+        _, score, _, (px, py) = cv2.minMaxLoc(resultado)
+        track.score = float(score)
+        _, _, w, h = track.bbox
+        track.bbox = (int(round((x0 + px) / self.escala)), int(round((y0 + py) / self.escala)), w, h)
+
+    def _associar(self, deteccoes, small):
+        """Associa as detecções aos tracks por IoU; cria e descarta tracks"""
+        deteccoes = [tuple(int(v) for v in d) for d in deteccoes]
+        livres = set(range(len(deteccoes)))
+        associados = set()
+
+        if self.tracks and deteccoes:
+            ious = iou_matrix([t.bbox for t in self.tracks], deteccoes)
+            # Associação gulosa pelos maiores IoU
+            for indice in np.argsort(ious, axis=None)[::-1]:
+                i, j = np.unravel_index(indice, ious.shape)
+                if ious[i, j] < self.iou_associacao:
+                    break
+                if i in associados or j not in livres:
+                    continue
+                track = self.tracks[i]
+                track.bbox = deteccoes[j]
+                track.detectado = True
+                track.score = 1.0
+                track.perdas = 0
+                self._recortar_template(track, small)
+                associados.add(i)
+                livres.discard(j)
+
+        mantidos = []
+        for i, track in enumerate(self.tracks):
+            if i not in associados:
+                track.perdas += 1
+                # Tracks com rastreamento fraco não confirmados pela detecção são descartados
+                if track.perdas > self.max_perdas or track.score < self.confianca_minima:
+                    continue
+            mantidos.append(track)
+
+        for j in sorted(livres):
+            track = Track(deteccoes[j])
+            self._recortar_template(track, small)
+            mantidos.append(track)
+        self.tracks = mantidos
+
+    def update(self, gray):
+        """Processa um frame em escala de cinza e retorna os tracks ativos"""
+        self.frames += 1
+        small = self._reduzir(gray)
+
+        for track in self.tracks:
+            self._rastrear(track, small)
+
+        detectar = (
+            self._desde_deteccao is None
+            or self._desde_deteccao + 1 >= self.intervalo_deteccao
+            or any(t.score < self.confianca_minima for t in self.tracks)
+        )
+        if detectar:
+            self.deteccoes += 1
+            self._desde_deteccao = 0
+            self._associar(self.detectar(gray), small)
+        else:
+            self._desde_deteccao += 1
+
+        return list(self.tracks)
+
+    def identificar(self, track, pessoa_id, confianca, reconhecido):
+        """Grava o resultado do reconhecimento no track; retorna True se ele acabou de ser reconhecido"""
+        novo = reconhecido and not track.reconhecido
+        track.pessoa_id = pessoa_id
+        track.confianca = confianca
+        track.reconhecido = reconhecido
+        return novo
+
+    def stats(self):
+        """Frames processados e fração com detecção completa"""
+        return {
+            'frames': self.frames,
+            'deteccoes': self.deteccoes,
+            'fracao_deteccao': self.deteccoes / self.frames if self.frames else 0.0,
+            'tracks_ativos': len(self.tracks)
+        }